@@ -0,0 +1,230 @@
+# Path: asgi.py
+"""An asyncio entry point with the request contract of `main.main`.
+
+Serve it with an ASGI server, e.g. `uvicorn asgi:app`. Requests are verified
+against GoTrue, written to Supabase and turned into Cloud Tasks on one event
+loop, so an instance serves many concurrent requests without a thread per
+request. The secrets, caches, idempotency store and campaign service
+configuration are shared with `main`.
+"""
+import json
+import asyncio
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from werkzeug.datastructures import Headers
+
+import main
+from src.errors.verification_error import VerificationError
+from src.services.async_campaign_service import AsyncCampaignService
+from src.utils.async_supabase import AsyncSupabase, create_async_http_client
+from src.utils.timing import span, start_request
+from src.utils.token_extractor import extract_token_from_header
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncClients:
+    """The clients of the event loop, created on startup or first use and
+    closed on shutdown."""
+
+    def __init__(self):
+        self.http_client = None
+        self.campaign_service: Optional[AsyncCampaignService] = None
+        self._supabase: Tuple[Optional[str], Optional[AsyncSupabase]] = (None, None)
+
+    async def start(self) -> None:
+        if self.http_client is not None:
+            return
+        self.http_client = create_async_http_client(
+            max_keepalive_connections=int(main.env_vars["HTTP_POOL_MAXSIZE"] or 16)
+        )
+        self.campaign_service = AsyncCampaignService(
+            main.campaign_service.get(), main.get_supabase_client
+        )
+        try:
+            # Secret Manager is only called again by the background refresh
+            await asyncio.to_thread(main.get_service_key)
+        except Exception as error:
+            logger.error("Error fetching the service key: %s", error)
+
+    async def stop(self) -> None:
+        if self.campaign_service is not None:
+            await self.campaign_service.close()
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+        self._supabase = (None, None)
+
+    @staticmethod
+    async def service_key() -> str:
+        """Returns the service key, fetched in a worker thread if it is not cached."""
+        service_key = main.get_cached_service_key()
+        if service_key is None:
+            service_key = await asyncio.to_thread(main.get_service_key)
+        return service_key
+
+    async def supabase(self) -> AsyncSupabase:
+        """Returns the Supabase client, recreated when the service key is rotated."""
+        service_key = await self.service_key()
+        if self._supabase[0] != service_key:
+            self._supabase = (
+                service_key,
+                AsyncSupabase(
+                    base_url=main.env_vars["SUPABASE_URL"],
+                    anon_key=main.env_vars["SUPABASE_ANON_KEY"],
+                    service_role_key=service_key,
+                    client=self.http_client,
+                ),
+            )
+        return self._supabase[1]
+
+
+clients = AsyncClients()
+
+
+async def verify_request(
+    data: Optional[Dict[str, Any]], headers: Headers
+) -> Tuple[str, str, Dict[str, Any]]:
+    """
+    Validate the request and extract queue name, action type, and payload,
+    like `main.verify_request`.
+
+    Raises:
+    VerificationError: If the request is invalid.
+    """
+    if not data:
+        raise VerificationError("Invalid request body")
+
+    jwt_token = extract_token_from_header(headers)
+    if not jwt_token:
+        raise VerificationError("No token provided")
+
+    user_service = main.get_admin_user_service(await clients.service_key())
+    token_verification = await user_service.verify_user_async(
+        jwt_token, clients.http_client
+    )
+    if "error" in token_verification:
+        raise VerificationError(token_verification["error"])
+
+    queue_name, action_type, payload = main.parse_request_data(data)
+    main.verify_scheduler_caller(action_type, jwt_token)
+    return queue_name, action_type, payload
+
+
+async def handle(
+    body: bytes, headers: Headers, response_headers: Dict[str, str]
+) -> Tuple[int, Any]:
+    """
+    Handle a request, verify it, and dispatch it to the action of its type.
+
+    Returns:
+    Tuple[int, Any]: The status code and the JSON body of the response.
+    """
+    await clients.start()
+    try:
+        try:
+            data = json.loads(body) if body else None
+        except ValueError:
+            data = None
+        with span("verify"):
+            queue_name, action_type, payload = await verify_request(data, headers)
+            idempotency_key = main.derive_request_key(headers, action_type, payload)
+
+        async def dispatch():
+            response_action = clients.campaign_service.action_dispatcher(
+                action_type=action_type,
+                queue_name=queue_name,
+            )
+            with span(f"action.{action_type}"):
+                return await response_action(
+                    supabase=await clients.supabase(), payload=payload
+                )
+
+        if idempotency_key is None:
+            response_data, replayed = await dispatch(), False
+        else:
+            response_data, replayed = await main.idempotency_store.run_async(
+                idempotency_key,
+                dispatch,
+                main.derive_idempotency_key(action_type, payload),
+            )
+        if replayed:
+            response_headers["Idempotency-Replayed"] = "true"
+        return 200, response_data
+    except Exception as error:
+        status, response_body, error_headers = main.error_response(error)
+        response_headers.update(error_headers)
+        return status, response_body
+
+
+async def read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def send_response(send, status: int, body: Any, headers: Dict[str, str]) -> None:
+    if isinstance(body, bytes):
+        content = body
+    else:
+        content = b"" if body is None else json.dumps(body, default=str).encode()
+    raw_headers = [(k.encode(), v.encode()) for k, v in headers.items()]
+    if body is not None and "Content-Type" not in headers:
+        raw_headers.append((b"content-type", b"application/json"))
+    raw_headers.append((b"content-length", str(len(content)).encode()))
+    await send(
+        {"type": "http.response.start", "status": status, "headers": raw_headers}
+    )
+    await send({"type": "http.response.body", "body": content})
+
+
+async def lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await clients.start()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await clients.stop()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send) -> None:
+    """The ASGI application."""
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    response_headers = dict(main.CORS_HEADERS)
+    # Handle CORS preflight requests
+    if scope["method"] == "OPTIONS":
+        await send_response(send, 204, None, response_headers)
+        return
+    headers = Headers(
+        [(k.decode("latin-1"), v.decode("latin-1")) for k, v in scope["headers"]]
+    )
+    if main.is_metrics_request(scope["method"], scope["path"]):
+        if not main.is_metrics_authorized(headers):
+            await send_response(
+                send, 401, {"message": "Unauthorized"}, response_headers
+            )
+            return
+        body, status, response_headers = main.metrics_response(response_headers)
+        await send_response(send, status, body.encode(), response_headers)
+        return
+
+    body = await read_body(receive)
+    if not main.request_timing:
+        status, response_body = await handle(body, headers, response_headers)
+    else:
+        with start_request() as timer:
+            status, response_body = await handle(body, headers, response_headers)
+        main.report_timing(timer, response_headers)
+    await send_response(send, status, response_body, response_headers)
@@ -0,0 +1,181 @@
+# Path: benchmarks/async_throughput.py
+"""Compares the requests/sec and latency of the threaded Flask entry point
+(`main.main`) with the ASGI entry point (`asgi.app`) under concurrent
+`create_campaign` requests.
+
+GoTrue and PostgREST are served by `FakePostgREST`, every request has its own
+user so that GoTrue is called every time, and Cloud Tasks is replaced by the
+in-process fakes with the same latency. The threaded server handles at most
+`--threads` requests at a time, like a gunicorn worker with that many threads.
+The fakes share the process and the GIL with both servers, so with low
+latencies both runs are CPU-bound and the difference shrinks.
+
+Usage:
+    python -m benchmarks.async_throughput [--requests 500] [--concurrency 100]
+        [--threads 8] [--latency 0.05] [--tasks-latency 0.05]
+"""
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import threading
+from typing import Dict, List
+from unittest import mock
+
+import httpx
+import uvicorn
+from flask import Flask, request
+from werkzeug.serving import make_server
+
+import asgi
+import main as entry_point
+from benchmarks.fakes import FakeAsyncCloudTasks, FakeCloudTasks, FakePostgREST
+from benchmarks.harness import (
+    ENV_VARS,
+    local_entry_point,
+    make_campaign,
+    make_token,
+    percentile,
+)
+from src.services.campaign_service import CampaignService
+
+
+def make_body(i: int) -> Dict:
+    return {
+        "queue_name": "bench-queue",
+        "action_type": "create_campaign",
+        "payload": make_campaign(i),
+    }
+
+
+async def drive(url: str, requests: int, concurrency: int, first_user: int) -> Dict:
+    """Sends the requests with `concurrency` requests in flight."""
+    latencies: List[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+
+        async def send(i: int) -> None:
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(
+                    url,
+                    json=make_body(i),
+                    headers={"Authorization": f"Bearer {make_token(first_user + i)}"},
+                )
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send(i) for i in range(requests)))
+        seconds = time.perf_counter() - started
+
+    return {
+        "requests_per_sec": round(requests / seconds, 1),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "errors": errors,
+    }
+
+
+def serve_threaded(threads: int):
+    """Serves `main.main` with a werkzeug server limited to `threads` requests at a time."""
+    app = Flask(__name__)
+    slots = threading.Semaphore(threads)
+
+    @app.route("/", methods=["POST", "OPTIONS"])
+    def function():
+        with slots:
+            return entry_point.main(request)
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/"
+
+
+def serve_asgi():
+    """Serves `asgi.app` with uvicorn in a background thread."""
+    config = uvicorn.Config(asgi.app, host="127.0.0.1", port=0, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, thread, f"http://127.0.0.1:{port}/"
+
+
+def bench(
+    requests: int,
+    concurrency: int,
+    threads: int,
+    latency: float,
+    tasks_latency: float,
+) -> Dict:
+    results = {
+        "requests": requests,
+        "concurrency": concurrency,
+        "threads": threads,
+        "latency_ms": latency * 1000,
+        "tasks_latency_ms": tasks_latency * 1000,
+    }
+    with FakePostgREST(latency=latency) as postgrest:
+        cloud_tasks = FakeCloudTasks(latency=tasks_latency)
+        service = CampaignService(ENV_VARS)
+        service._client = cloud_tasks
+        with local_entry_point(postgrest, service, concurrency), mock.patch(
+            "google.cloud.tasks_v2.CloudTasksAsyncClient",
+            lambda: FakeAsyncCloudTasks(cloud_tasks),
+        ):
+            server, url = serve_threaded(threads)
+            try:
+                results["threaded"] = asyncio.run(drive(url, requests, concurrency, 0))
+            finally:
+                server.shutdown()
+
+            server, thread, url = serve_asgi()
+            try:
+                # New users, so that GoTrue is not skipped by the verified user cache
+                results["asgi"] = asyncio.run(
+                    drive(url, requests, concurrency, requests)
+                )
+            finally:
+                server.should_exit = True
+                thread.join()
+
+    results["speedup"] = round(
+        results["asgi"]["requests_per_sec"] / results["threaded"]["requests_per_sec"],
+        2,
+    )
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--tasks-latency", type=float, default=0.05)
+    args = parser.parse_args()
+    # The errors are counted in the results
+    logging.disable(logging.ERROR)
+    results = bench(
+        args.requests,
+        args.concurrency,
+        args.threads,
+        args.latency,
+        args.tasks_latency,
+    )
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+# Path: benchmarks/bulk_create.py
+"""Compares the rows/sec of the per-row `create_campaign` path with the bulk
+`create_campaigns` path against a local PostgREST stand-in.
+
+Usage:
+    python -m benchmarks.bulk_create [--rows 2000] [--chunk-size 100] [--latency 0.005]
+"""
+import sys
+import json
+import time
+import argparse
+from typing import Dict, List
+
+from supacrud import Supabase
+
+from benchmarks.fakes import FakePostgREST
+from src.services.campaign_service import CampaignService
+
+ENV_VARS = {
+    "PROJECT_ID": "bench-project",
+    "REGION": "bench-region",
+    "SURVEY_EXECUTOR_FUNCTION_URL": "http://127.0.0.1/executor",
+    "SERVICE_ACCOUNT": "bench@example.com",
+    "QUEUE_NAME": "bench-queue",
+}
+
+
+def make_payloads(rows: int) -> List[Dict]:
+    return [
+        {
+            "name": f"Campaign {i}",
+            "count": 0,
+            "threshold": 5,
+            "status": "active",
+            "company_id": "company-1",
+            "created_by": "user-1",
+            "next_run_time": "2023-01-01T09:00:00+00:00",
+            "type": "recurring",
+            "frequency": "weekly",
+            "audience_ids": [f"user-{j}" for j in range(50)],
+        }
+        for i in range(rows)
+    ]
+
+
+def bench(rows: int, chunk_size: int, latency: float) -> Dict:
+    results = {}
+    with FakePostgREST(latency=latency) as postgrest:
+        supabase = Supabase(
+            base_url=postgrest.url, anon_key="anon", service_role_key="service"
+        )
+        service = CampaignService({**ENV_VARS, "BULK_CHUNK_SIZE": str(chunk_size)})
+
+        started = time.perf_counter()
+        for payload in make_payloads(rows):
+            service.create_campaign(supabase, payload)
+        per_row_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        service.create_campaigns(supabase, {"campaigns": make_payloads(rows)})
+        bulk_seconds = time.perf_counter() - started
+
+    results["rows"] = rows
+    results["chunk_size"] = chunk_size
+    results["latency_ms"] = latency * 1000
+    results["per_row_rows_per_sec"] = round(rows / per_row_seconds, 1)
+    results["bulk_rows_per_sec"] = round(rows / bulk_seconds, 1)
+    results["speedup"] = round(per_row_seconds / bulk_seconds, 2)
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--chunk-size", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.005)
+    args = parser.parse_args()
+    print(json.dumps(bench(args.rows, args.chunk_size, args.latency), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+# Path: benchmarks/campaign_validation.py
+"""Measures the validate and encode throughput of create payloads with large
+audiences, `Campaign.from_payload` and `to_rpc_params` against the previous
+unchecked `Campaign(**payload)` and `dataclasses.asdict` encoding.
+
+Usage:
+    python -m benchmarks.campaign_validation [--sizes 10 1000 10000] [--repeat 5]
+"""
+import sys
+import json
+import time
+import argparse
+from dataclasses import asdict
+from typing import Callable, Dict
+
+from src.models.campaign import Campaign
+
+
+def make_payload(audience_size: int) -> Dict:
+    return {
+        "name": "Campaign",
+        "count": 0,
+        "threshold": 5,
+        "status": "active",
+        "company_id": "company-1",
+        "created_by": "user-1",
+        "next_run_time": "2023-01-01T09:00:00+00:00",
+        "type": "recurring",
+        "frequency": "daily",
+        "time_of_day": "09:00:00",
+        "audience_ids": [f"user-{i}" for i in range(audience_size)],
+        "questionnaire_ids": ["questionnaire-1"],
+    }
+
+
+def unchecked(payload: Dict) -> Dict:
+    campaign = Campaign(**payload)
+    return {f"_{k}": v for k, v in asdict(campaign).items()}
+
+
+def validated(payload: Dict) -> Dict:
+    return Campaign.from_payload(payload).to_rpc_params()
+
+
+def ops_per_sec(func: Callable[[Dict], Dict], payload: Dict, repeat: int) -> float:
+    """Returns the best throughput over `repeat` runs of at least 0.2 seconds."""
+    best = 0.0
+    for _ in range(repeat):
+        calls, started = 0, time.perf_counter()
+        while time.perf_counter() - started < 0.2:
+            func(payload)
+            calls += 1
+        best = max(best, calls / (time.perf_counter() - started))
+    return round(best, 1)
+
+
+def bench(audience_size: int, repeat: int) -> Dict:
+    payload = make_payload(audience_size)
+    results = {
+        "audience_size": audience_size,
+        "unchecked_ops_per_sec": ops_per_sec(unchecked, payload, repeat),
+        "validated_ops_per_sec": ops_per_sec(validated, payload, repeat),
+    }
+    results["speedup"] = round(
+        results["validated_ops_per_sec"] / results["unchecked_ops_per_sec"], 2
+    )
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps([bench(size, args.repeat) for size in args.sizes], indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,581 @@
+# Path: benchmarks/fakes.py
+"""Local stand-ins for the remote services used by the benchmarks and tests."""
+import json
+import time
+import asyncio
+import datetime as dt
+import uuid
+import itertools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+import requests
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    # Concurrent benchmark clients overflow the default listen backlog of 5
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class FakePostgREST:
+    """A local PostgREST stand-in for the `campaigns` and
+    `campaign_task_outbox` tables and their RPCs, see sql/. It also serves
+    the GoTrue admin users lookup, every user is a super admin.
+
+    Every request waits `latency` seconds, plus `row_latency` seconds per row
+    written, to model the network round trip and the database work. GoTrue
+    requests wait `auth_latency` seconds instead, if it is given.
+    Faults are injected by giving the status codes of the first requests in
+    `faults`, None serves a request normally.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.005,
+        row_latency: float = 0.00005,
+        faults: Iterable[Optional[int]] = (),
+        auth_latency: Optional[float] = None,
+    ):
+        self.latency = latency
+        self.row_latency = row_latency
+        self.auth_latency = latency if auth_latency is None else auth_latency
+        self.faults: Iterator[Optional[int]] = iter(faults)
+        self.rows: Dict[str, Dict] = {}
+        self.outbox: Dict[int, Dict] = {}
+        self.requests = 0
+        self._outbox_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = _HTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def __enter__(self) -> "FakePostgREST":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _insert(self, params: Dict) -> str:
+        campaign_id = str(uuid.uuid4())
+        row = {k.lstrip("_"): v for k, v in params.items()}
+        row["id"] = campaign_id
+        with self._lock:
+            self.rows[campaign_id] = row
+        return campaign_id
+
+    def _enqueue(self, campaign_id: str, action: str, **fields) -> None:
+        """Records a task intent, the caller holds the lock."""
+        outbox_id = next(self._outbox_ids)
+        self.outbox[outbox_id] = {
+            "id": outbox_id,
+            "campaign_id": campaign_id,
+            "action": action,
+            "payload": None,
+            "task_ref": None,
+            "previous_task_ref": None,
+            "status": "pending",
+            "attempts": 0,
+            "last_error": None,
+            "lease_until": None,
+            **fields,
+        }
+
+    def _table(self, path: str) -> Dict:
+        table = path.split("?", 1)[0].rsplit("/", 1)[-1]
+        return self.outbox if table == "campaign_task_outbox" else self.rows
+
+    @staticmethod
+    def _filters(path: str) -> List[Tuple[str, Callable[[Any], bool]]]:
+        """Parses the `column=eq.value`, `column=gt.value` and `column=in.(a,b)`
+        filters of a path."""
+        filters = []
+        query = path.split("?", 1)[1] if "?" in path else ""
+        for name, value in parse_qsl(query):
+            if value.startswith("eq."):
+                expected = value[3:]
+                filters.append((name, lambda v, e=expected: str(v) == e))
+            elif value.startswith("gt."):
+                bound = value[3:]
+                filters.append((name, lambda v, b=bound: v is not None and str(v) > b))
+            elif value.startswith("in.("):
+                expected = set(value[4:-1].split(","))
+                filters.append((name, lambda v, e=expected: str(v) in e))
+        return filters
+
+    def _select(self, path: str) -> List[Dict]:
+        """Returns the rows matching the filters of a path, the caller holds the lock."""
+        filters = self._filters(path)
+        rows = [
+            row
+            for row in self._table(path).values()
+            if all(test(row.get(name)) for name, test in filters)
+        ]
+        params = dict(parse_qsl(path.split("?", 1)[1] if "?" in path else ""))
+        if params.get("order"):
+            rows.sort(key=lambda row: str(row.get(params["order"])))
+        if params.get("limit"):
+            rows = rows[: int(params["limit"])]
+        return rows
+
+    def _rpc(self, name: str, body: Dict) -> Tuple[int, Any]:
+        if name == "create_campaign":
+            return 200, self._insert(body)
+        if name == "create_campaigns":
+            return 200, [self._insert(c) for c in body["_campaigns"]]
+        with self._lock:
+            if name == "create_campaign_with_task":
+                campaign_id = str(uuid.uuid4())
+                self.rows[campaign_id] = {**body["_campaign"], "id": campaign_id}
+                self._enqueue(
+                    campaign_id,
+                    "create",
+                    payload={**body["_task"], "id": campaign_id},
+                    task_ref=body["_campaign"].get("cloud_task_id"),
+                )
+                return 200, campaign_id
+            if name == "update_campaign_with_task":
+                row = self.rows.get(body["_id"])
+                if row is None:
+                    return 200, []
+                previous_task_ref = (
+                    row.get("cloud_task_id") or body["_previous_task_ref"]
+                )
+                row.update({k: v for k, v in body["_campaign"].items() if k != "id"})
+                self._enqueue(
+                    body["_id"],
+                    body["_action"],
+                    payload=body["_task"],
+                    task_ref=body["_campaign"].get("cloud_task_id"),
+                    previous_task_ref=previous_task_ref,
+                )
+                return 200, [dict(row)]
+            if name == "delete_campaign_with_task":
+                row = self.rows.pop(body["_id"], None)
+                if row is None:
+                    return 200, []
+                task_ref = row.get("cloud_task_id")
+                if task_ref or (row.get("type") or "instant") == "instant":
+                    self._enqueue(
+                        body["_id"],
+                        "delete",
+                        previous_task_ref=task_ref or body["_task_ref"],
+                    )
+                return 200, [row]
+            if name == "claim_campaign_task_outbox":
+                now = time.time()
+                pending = [
+                    row
+                    for row in self.outbox.values()
+                    if row["status"] == "pending"
+                    and (row["lease_until"] is None or row["lease_until"] < now)
+                ]
+                claimed = sorted(pending, key=lambda row: row["id"])[: body["_limit"]]
+                for row in claimed:
+                    row["lease_until"] = now + body["_lease_seconds"]
+                    row["attempts"] += 1
+                return 200, [dict(row) for row in claimed]
+        return 404, {"message": "Not found"}
+
+    def _next_fault(self) -> Optional[int]:
+        with self._lock:
+            self.requests += 1
+            return next(self.faults, None)
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def _respond(self, status: int, body=None) -> None:
+                data = json.dumps(body).encode() if body is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _body(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length)) if length else None
+
+            def _fault(self) -> bool:
+                status = fake._next_fault()
+                if status is None:
+                    return False
+                time.sleep(fake.latency)
+                self._respond(status, {"message": "Injected fault"})
+                return True
+
+            def do_GET(self):
+                if self._fault():
+                    return
+                if self.path.startswith("/auth/v1/admin/users/"):
+                    time.sleep(fake.auth_latency)
+                    user_id = self.path.rsplit("/", 1)[-1]
+                    self._respond(
+                        200, {"id": user_id, "app_metadata": {"role": "super_admin"}}
+                    )
+                    return
+                time.sleep(fake.latency)
+                with fake._lock:
+                    rows = [dict(row) for row in fake._select(self.path)]
+                self._respond(200, rows)
+
+            def do_POST(self):
+                body = self._body()
+                if self._fault():
+                    return
+                if "/rpc/" not in self.path:
+                    self._respond(404, {"message": "Not found"})
+                    return
+                written = len(body.get("_campaigns") or [None])
+                time.sleep(fake.latency + fake.row_latency * written)
+                self._respond(*fake._rpc(self.path.rsplit("/", 1)[-1], body))
+
+            def do_PATCH(self):
+                body = self._body()
+                if self._fault():
+                    return
+                time.sleep(fake.latency + fake.row_latency)
+                with fake._lock:
+                    rows = fake._select(self.path)
+                    for row in rows:
+                        row.update(body or {})
+                    rows = [dict(row) for row in rows]
+                self._respond(200, rows)
+
+            def do_DELETE(self):
+                if self._fault():
+                    return
+                time.sleep(fake.latency + fake.row_latency)
+                with fake._lock:
+                    rows = fake._select(self.path)
+                    table = fake._table(self.path)
+                    for row in rows:
+                        table.pop(row["id"], None)
+                self._respond(200, rows)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class PostgRESTClient:
+    """A minimal client with the interface of `supacrud.Supabase`, for the
+    tests, which cannot install supacrud."""
+
+    def __init__(self, base_url: str, timeout: float = 5):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def _request(self, method: str, url: str, data: Any = None) -> Any:
+        response = self.session.request(
+            method,
+            f"{self.base_url}/{url}",
+            timeout=self.timeout,
+            data=None if data is None else json.dumps(data, default=str),
+            headers={"Content-Type": "application/json"},
+        )
+        response.raise_for_status()
+        return response.json() if response.content else None
+
+    def read(self, url: str) -> Any:
+        return self._request("GET", url)
+
+    def update(self, url: str, data: Dict) -> Any:
+        return self._request("PATCH", url, data)
+
+    def delete(self, url: str) -> Any:
+        return self._request("DELETE", url)
+
+    def rpc(self, url: str, params: Dict) -> Any:
+        return self._request("POST", url, params)
+
+
+class FakeCloudTasks:
+    """An in-process stand-in for `tasks_v2.CloudTasksClient`.
+
+    Tasks are kept in memory by name. Like Cloud Tasks, the name of a deleted
+    task cannot be reused for `tombstone_seconds`, creating it again raises
+    AlreadyExists. Faults are injected by giving the exceptions of the first
+    calls in `faults`, None serves a call normally.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        faults: Iterable[Optional[Exception]] = (),
+        tombstone_seconds: float = 3600,
+    ):
+        self.latency = latency
+        self.faults: Iterator[Optional[Exception]] = iter(faults)
+        self.tombstone_seconds = tombstone_seconds
+        self.tasks: Dict[str, Dict] = {}
+        self.created: Dict[str, dt.datetime] = {}
+        # The monotonic time each deleted task name was deleted at
+        self.deleted: Dict[str, float] = {}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _call(self) -> None:
+        with self._lock:
+            self.calls += 1
+            fault = next(self.faults, None)
+        time.sleep(self.latency)
+        if fault is not None:
+            raise fault
+
+    @staticmethod
+    def queue_path(project: str, location: str, queue: str) -> str:
+        return f"projects/{project}/locations/{location}/queues/{queue}"
+
+    def _store(self, task: Dict):
+        """Adds a task unless its name is taken or tombstoned."""
+        from google.cloud import tasks_v2
+        from google.api_core.exceptions import AlreadyExists
+
+        name = task["name"]
+        with self._lock:
+            deleted_at = self.deleted.get(name)
+            if name in self.tasks or (
+                deleted_at is not None
+                and time.monotonic() - deleted_at < self.tombstone_seconds
+            ):
+                raise AlreadyExists(f"Task {name} already exists")
+            self.tasks[name] = task
+            self.created[name] = dt.datetime.now(dt.timezone.utc)
+        return tasks_v2.Task(name=name)
+
+    def _remove(self, name: str) -> None:
+        """Deletes a task and tombstones its name."""
+        from google.api_core.exceptions import NotFound
+
+        with self._lock:
+            if self.tasks.pop(name, None) is None:
+                raise NotFound("The requested entity was not found.")
+            self.deleted[name] = time.monotonic()
+
+    def create_task(self, request: Dict):
+        self._call()
+        return self._store(request["task"])
+
+    def delete_task(self, name: str) -> None:
+        self._call()
+        self._remove(name)
+
+    def list_tasks(self, request: Dict) -> "FakeTaskPager":
+        """Lists the tasks of a queue in pages of `page_size`, like the real pager."""
+        self._call()
+        prefix = f"{request['parent']}/tasks/"
+        with self._lock:
+            names = sorted(name for name in self.tasks if name.startswith(prefix))
+        return FakeTaskPager(self, names, request.get("page_size") or 1000)
+
+    def get_task(self, request: Dict):
+        from google.cloud import tasks_v2
+        from google.api_core.exceptions import NotFound
+
+        self._call()
+        with self._lock:
+            task = self.tasks.get(request["name"])
+        if task is None:
+            raise NotFound("The requested entity was not found.")
+        return tasks_v2.Task(name=request["name"])
+
+
+class FakeTaskPager:
+    """The `pages` of a `FakeCloudTasks.list_tasks` call, fetched lazily."""
+
+    def __init__(self, fake: FakeCloudTasks, names: List[str], page_size: int):
+        self.fake = fake
+        self.names = names
+        self.page_size = page_size
+
+    @property
+    def pages(self) -> Iterator[Any]:
+        from google.cloud import tasks_v2
+
+        for start in range(0, len(self.names), self.page_size):
+            if start:
+                self.fake._call()
+            with self.fake._lock:
+                tasks = [
+                    tasks_v2.Task(name=name, create_time=self.fake.created.get(name))
+                    for name in self.names[start : start + self.page_size]
+                    if name in self.fake.tasks
+                ]
+            yield tasks_v2.ListTasksResponse(tasks=tasks)
+
+
+class FakeAsyncCloudTasks:
+    """An asyncio stand-in for `tasks_v2.CloudTasksAsyncClient`, sharing the
+    tasks and faults of a `FakeCloudTasks`. Its latency does not block the loop.
+    """
+
+    def __init__(self, fake: FakeCloudTasks):
+        self.fake = fake
+        self.transport = self
+
+    async def close(self) -> None:
+        """Closes the fake channel, `transport.close` of the real client."""
+
+    async def _call(self) -> None:
+        with self.fake._lock:
+            self.fake.calls += 1
+            fault = next(self.fake.faults, None)
+        await asyncio.sleep(self.fake.latency)
+        if fault is not None:
+            raise fault
+
+    @staticmethod
+    def queue_path(project: str, location: str, queue: str) -> str:
+        return FakeCloudTasks.queue_path(project, location, queue)
+
+    async def create_task(self, request: Dict):
+        await self._call()
+        return self.fake._store(request["task"])
+
+    async def delete_task(self, name: str) -> None:
+        await self._call()
+        self.fake._remove(name)
+
+    async def get_task(self, request: Dict):
+        from google.cloud import tasks_v2
+        from google.api_core.exceptions import NotFound
+
+        await self._call()
+        with self.fake._lock:
+            task = self.fake.tasks.get(request["name"])
+        if task is None:
+            raise NotFound("The requested entity was not found.")
+        return tasks_v2.Task(name=request["name"])
+
+
+class FakeCloudTasksServer:
+    """A local gRPC server for the `google.cloud.tasks.v2.CloudTasks` service,
+    backed by a `FakeCloudTasks`.
+
+    Unlike the in-process fakes, calls go through the real `CloudTasksClient`,
+    the proto serialization and a gRPC channel. Errors of the fake are sent
+    with their gRPC status code, so the client raises the same exceptions as
+    against Cloud Tasks.
+    """
+
+    SERVICE = "google.cloud.tasks.v2.CloudTasks"
+
+    def __init__(self, fake: Optional[FakeCloudTasks] = None, max_workers: int = 64):
+        import grpc
+        from concurrent import futures
+
+        self.fake = fake or FakeCloudTasks()
+        self._server = grpc.server(futures.ThreadPoolExecutor(max_workers=max_workers))
+        self._server.add_generic_rpc_handlers((self._handler(),))
+        self.port = self._server.add_insecure_port("127.0.0.1:0")
+
+    @property
+    def address(self) -> str:
+        return f"127.0.0.1:{self.port}"
+
+    def __enter__(self) -> "FakeCloudTasksServer":
+        self._server.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._server.stop(grace=None)
+
+    def client(self):
+        """Returns a `CloudTasksClient` on an insecure channel to the server."""
+        import grpc
+        from google.cloud import tasks_v2
+        from google.cloud.tasks_v2.services.cloud_tasks.transports import (
+            CloudTasksGrpcTransport,
+        )
+        from src.services.campaign_service import CHANNEL_OPTIONS
+
+        channel = grpc.insecure_channel(self.address, options=CHANNEL_OPTIONS)
+        return tasks_v2.CloudTasksClient(
+            transport=CloudTasksGrpcTransport(channel=channel)
+        )
+
+    def _list_tasks(self, request) -> Any:
+        from google.cloud import tasks_v2
+
+        pager = self.fake.list_tasks(
+            {"parent": request.parent, "page_size": request.page_size}
+        )
+        start = int(request.page_token or 0)
+        end = start + pager.page_size
+        with self.fake._lock:
+            tasks = [
+                tasks_v2.Task(name=name, create_time=self.fake.created.get(name))
+                for name in pager.names[start:end]
+                if name in self.fake.tasks
+            ]
+        next_page_token = str(end) if end < len(pager.names) else ""
+        return tasks_v2.ListTasksResponse(tasks=tasks, next_page_token=next_page_token)
+
+    def _handler(self):
+        import grpc
+        from google.cloud import tasks_v2
+        from google.protobuf import empty_pb2
+        from google.api_core.exceptions import GoogleAPICallError
+
+        fake = self.fake
+
+        def create_task(request):
+            task = tasks_v2.Task.to_dict(request.task)
+            return fake.create_task({"parent": request.parent, "task": task})
+
+        def delete_task(request):
+            fake.delete_task(name=request.name)
+            return empty_pb2.Empty()
+
+        def get_task(request):
+            return fake.get_task({"name": request.name})
+
+        def unary(method, request_type, serialize):
+            def handle(request, context):
+                try:
+                    return method(request)
+                except GoogleAPICallError as error:
+                    context.abort(error.grpc_status_code, error.message)
+
+            return grpc.unary_unary_rpc_method_handler(
+                handle,
+                request_deserializer=request_type.deserialize,
+                response_serializer=serialize,
+            )
+
+        return grpc.method_handlers_generic_handler(
+            self.SERVICE,
+            {
+                "CreateTask": unary(
+                    create_task, tasks_v2.CreateTaskRequest, tasks_v2.Task.serialize
+                ),
+                "DeleteTask": unary(
+                    delete_task,
+                    tasks_v2.DeleteTaskRequest,
+                    empty_pb2.Empty.SerializeToString,
+                ),
+                "GetTask": unary(
+                    get_task, tasks_v2.GetTaskRequest, tasks_v2.Task.serialize
+                ),
+                "ListTasks": unary(
+                    self._list_tasks,
+                    tasks_v2.ListTasksRequest,
+                    tasks_v2.ListTasksResponse.serialize,
+                ),
+            },
+        )
@@ -0,0 +1,313 @@
+# Path: benchmarks/harness.py
+"""Drives a mix of create, edit and delete requests through `main.main`
+against local stand-ins and reports the throughput and the p50/p95/p99
+latency of every action as JSON.
+
+PostgREST and GoTrue are served over HTTP by `FakePostgREST` and Cloud Tasks
+over gRPC by `FakeCloudTasksServer`, each with its own latency, so a request
+exercises `verify_request`, the idempotency store, `CampaignService`, the HTTP
+sessions and the real Cloud Tasks client. Every request has its own user
+unless `--users` is set, so GoTrue is called every time. Edits change the
+audience of instant campaigns, which replaces their tasks.
+
+Usage:
+    python -m benchmarks.harness [--requests 600] [--concurrency 8]
+        [--mix create=0.4,edit=0.3,delete=0.3] [--supabase-latency 0.01]
+        [--gotrue-latency 0.01] [--tasks-latency 0.01] [--users 0]
+        [--output run.json] [--baseline previous.json]
+
+With `--baseline` the report also holds the change of every latency
+percentile and throughput against a previous report, in percent.
+"""
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import subprocess
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, redirect_stdout
+from typing import Any, Dict, Iterator, List, Optional
+from unittest import mock
+
+import jwt
+from flask import Flask, request
+
+import main as entry_point
+from benchmarks.fakes import FakeCloudTasksServer, FakePostgREST, PostgRESTClient
+from src.services.campaign_service import CampaignService
+from src.services.user_services import AdminUserService
+from src.utils.idempotency import IdempotencyStore
+from src.utils.startup import Lazy
+
+ENV_VARS = {
+    "PROJECT_ID": "bench-project",
+    "REGION": "bench-region",
+    "SURVEY_EXECUTOR_FUNCTION_URL": "http://127.0.0.1/executor",
+    "SERVICE_ACCOUNT": "bench@example.com",
+    "QUEUE_NAME": "bench-queue",
+}
+
+ACTIONS = ("create", "edit", "delete")
+
+
+def percentile(values: List[float], share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """Parses `create=0.4,edit=0.3,delete=0.3` into normalized action weights."""
+    mix = {}
+    for part in value.split(","):
+        action, weight = part.split("=", 1)
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown action '{action}', expected one of {ACTIONS}")
+        mix[action] = float(weight)
+    total = sum(mix.values())
+    return {action: weight / total for action, weight in mix.items()}
+
+
+def make_campaign(i: int) -> Dict:
+    return {
+        "name": f"Campaign {i}",
+        "count": 0,
+        "threshold": 5,
+        "status": "active",
+        "company_id": "company-1",
+        "created_by": "user-1",
+        "next_run_time": "2023-01-01T09:00:00+00:00",
+        "type": "instant",
+        "audience_ids": [f"user-{j}" for j in range(50)],
+    }
+
+
+def make_token(user: int) -> str:
+    return jwt.encode({"sub": f"user-{user}", "exp": time.time() + 3600}, "secret")
+
+
+@contextmanager
+def local_entry_point(
+    postgrest: FakePostgREST,
+    service: CampaignService,
+    pool_maxsize: int = 16,
+) -> Iterator[None]:
+    """Points `main` at the local stand-ins, without Secret Manager."""
+    user_service = AdminUserService(
+        base_url=postgrest.url, anon_key="anon", service_key="service"
+    )
+    supabase = PostgRESTClient(postgrest.url)
+    env_vars = {
+        "SUPABASE_URL": postgrest.url,
+        "SUPABASE_ANON_KEY": "anon",
+        "HTTP_POOL_MAXSIZE": str(pool_maxsize),
+    }
+    with mock.patch.dict(entry_point.env_vars, env_vars), mock.patch.multiple(
+        entry_point,
+        get_service_key=lambda: "service",
+        get_admin_user_service=lambda service_key=None: user_service,
+        get_supabase_client=lambda: supabase,
+        campaign_service=Lazy(lambda: service, "campaign_service"),
+        idempotency_store=IdempotencyStore(),
+    ):
+        yield
+
+
+def plan_requests(requests: int, mix: Dict[str, float], seed: int) -> List[str]:
+    """Returns the action of every request, in a random order."""
+    rng = random.Random(seed)
+    return rng.choices(list(mix), weights=list(mix.values()), k=requests)
+
+
+def bench(
+    requests: int,
+    concurrency: int,
+    mix: Dict[str, float],
+    supabase_latency: float,
+    gotrue_latency: float,
+    tasks_latency: float,
+    users: int = 0,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    Runs the request mix and reports the latencies of every action.
+    Args:
+        requests: The number of requests.
+        concurrency: The number of requests in flight at a time.
+        mix: The share of every action of the requests.
+        supabase_latency: The latency of PostgREST requests in seconds.
+        gotrue_latency: The latency of GoTrue requests in seconds.
+        tasks_latency: The latency of Cloud Tasks calls in seconds.
+        users: The number of distinct users, one per request if 0.
+        seed: The seed of the action order.
+    Returns:
+        The report, with the configuration, and the count, errors,
+        throughput and latency percentiles of every action.
+    """
+    app = Flask(__name__)
+    with FakePostgREST(
+        latency=supabase_latency, auth_latency=gotrue_latency
+    ) as postgrest, FakeCloudTasksServer() as cloud_tasks:
+        cloud_tasks.fake.latency = tasks_latency
+        service = CampaignService(ENV_VARS)
+        service._client = cloud_tasks.client()
+
+        # Every edit or delete gets its own campaign, created before the run
+        actions = plan_requests(requests, mix, seed)
+        supabase = PostgRESTClient(postgrest.url)
+        campaign_ids = [
+            f"{service.create_campaign(supabase, make_campaign(-i - 1))}"
+            for i, action in enumerate(actions)
+            if action != "create"
+        ]
+
+        def body(i: int, action: str) -> Dict:
+            if action == "create":
+                return {"action_type": "create_campaign", "payload": make_campaign(i)}
+            campaign_id = campaign_ids.pop()
+            row = dict(postgrest.rows[campaign_id])
+            if action == "edit":
+                row["audience_ids"] = [f"user-{j}" for j in range(51)]
+                return {"action_type": "edit_campaign", "payload": row}
+            payload = {"id": campaign_id, "cloud_task_id": row["cloud_task_id"]}
+            return {"action_type": "delete_campaign", "payload": payload}
+
+        bodies = [
+            {"queue_name": "bench-queue", **body(i, action)}
+            for i, action in enumerate(actions)
+        ]
+
+        def send(i: int) -> Dict:
+            user = i % users if users else i
+            headers = {"Authorization": f"Bearer {make_token(user)}"}
+            with app.test_request_context(
+                method="POST", json=bodies[i], headers=headers
+            ):
+                started = time.perf_counter()
+                response = entry_point.main(request)
+                seconds = time.perf_counter() - started
+            status = response[1] if isinstance(response, tuple) else 200
+            return {"action": actions[i], "seconds": seconds, "status": status}
+
+        with local_entry_point(postgrest, service, pool_maxsize=concurrency):
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                samples = list(executor.map(send, range(requests)))
+            wall_seconds = time.perf_counter() - started
+
+    report = {
+        "config": {
+            "requests": requests,
+            "concurrency": concurrency,
+            "mix": mix,
+            "supabase_latency_ms": supabase_latency * 1000,
+            "gotrue_latency_ms": gotrue_latency * 1000,
+            "tasks_latency_ms": tasks_latency * 1000,
+            "users": users,
+            "seed": seed,
+        },
+        "environment": environment(),
+        "total": summarize(samples, wall_seconds),
+        "actions": {
+            action: summarize(
+                [sample for sample in samples if sample["action"] == action],
+                wall_seconds,
+            )
+            for action in ACTIONS
+            if action in actions
+        },
+    }
+    return report
+
+
+def summarize(samples: List[Dict], wall_seconds: float) -> Dict[str, Any]:
+    latencies = [sample["seconds"] for sample in samples]
+    return {
+        "count": len(samples),
+        "errors": sum(1 for sample in samples if sample["status"] != 200),
+        "throughput_per_sec": round(len(samples) / wall_seconds, 1),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def environment() -> Dict[str, Optional[str]]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "started_at": dt.datetime.now(dt.timezone.utc).isoformat(),
+    }
+
+
+def compare(baseline: Dict[str, Any], report: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns the change in percent of every metric of `report` against `baseline`."""
+    metrics = ("throughput_per_sec", "p50_ms", "p95_ms", "p99_ms")
+    sections = {"total": (baseline.get("total"), report["total"])}
+    for action, summary in report["actions"].items():
+        sections[action] = (baseline.get("actions", {}).get(action), summary)
+    changes = {}
+    for name, (before, after) in sections.items():
+        if not before:
+            continue
+        changes[name] = {
+            metric: round((after[metric] - before[metric]) / before[metric] * 100, 1)
+            for metric in metrics
+            if before.get(metric)
+        }
+    return changes
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=600)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--mix", type=parse_mix, default="create=0.4,edit=0.3,delete=0.3"
+    )
+    parser.add_argument("--supabase-latency", type=float, default=0.01)
+    parser.add_argument("--gotrue-latency", type=float, default=0.01)
+    parser.add_argument("--tasks-latency", type=float, default=0.01)
+    parser.add_argument("--users", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--baseline", default=None)
+    args = parser.parse_args()
+    # The errors are counted in the report, stdout only holds the report
+    logging.disable(logging.ERROR)
+    with redirect_stdout(sys.stderr):
+        report = bench(
+            requests=args.requests,
+            concurrency=args.concurrency,
+            mix=args.mix,
+            supabase_latency=args.supabase_latency,
+            gotrue_latency=args.gotrue_latency,
+            tasks_latency=args.tasks_latency,
+            users=args.users,
+            seed=args.seed,
+        )
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            report["change_pct"] = compare(json.load(baseline), report)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
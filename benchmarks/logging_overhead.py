@@ -0,0 +1,89 @@
+# Path: benchmarks/logging_overhead.py
+"""Measures the time the request thread spends logging a request payload,
+with a synchronous file handler and with the pipeline of
+`configure_logging`, for growing audiences.
+
+Every call logs the payload like `parse_request_data` does. The time of the
+call is measured on the calling thread, the time the listener takes to write
+the queued records is reported separately as `drain_ms`.
+
+Usage:
+    python -m benchmarks.logging_overhead [--sizes 10 1000 10000] [--calls 200]
+        [--sample-rate 1]
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import logging
+import argparse
+import tempfile
+from typing import Dict, List
+
+from benchmarks.task_body import make_payload
+from src.utils.log_pipeline import configure_logging
+
+
+def make_logger(name: str, path: str) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    handler = logging.FileHandler(path)
+    handler.setFormatter(
+        logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s")
+    )
+    logger.addHandler(handler)
+    return logger
+
+
+def log_calls(logger: logging.Logger, payloads: List[Dict]) -> float:
+    """Returns the mean time of a call in microseconds."""
+    started = time.perf_counter()
+    for payload in payloads:
+        logger.info("Received request with payload: %s", payload)
+    return (time.perf_counter() - started) / len(payloads) * 1e6
+
+
+def bench(audience_size: int, calls: int, sample_rate: float) -> Dict:
+    payloads = [make_payload(audience_size, seed=i) for i in range(calls)]
+    results: Dict = {"audience_size": audience_size, "calls": calls}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sync.log")
+        logger = make_logger(f"bench.sync.{audience_size}", path)
+        results["sync_call_us"] = round(log_calls(logger, payloads), 1)
+        results["sync_bytes_per_call"] = os.path.getsize(path) // calls
+
+        path = os.path.join(directory, "pipeline.log")
+        name = f"bench.pipeline.{audience_size}"
+        logger = make_logger(name, path)
+        env_vars = {
+            "ASYNC_LOGGING": "true",
+            "LOG_SAMPLE_RATES": f"{name}={sample_rate}",
+        }
+        listener = configure_logging(env_vars, logger)
+        atexit.unregister(listener.stop)
+        results["pipeline_call_us"] = round(log_calls(logger, payloads), 1)
+        started = time.perf_counter()
+        listener.stop()
+        results["drain_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        results["pipeline_bytes_per_call"] = os.path.getsize(path) // calls
+        for handler in logger.handlers:
+            handler.close()
+    results["speedup"] = round(results["sync_call_us"] / results["pipeline_call_us"], 1)
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--sample-rate", type=float, default=1.0)
+    args = parser.parse_args()
+    results = [bench(size, args.calls, args.sample_rate) for size in args.sizes]
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
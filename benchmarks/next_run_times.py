@@ -0,0 +1,96 @@
+"""Compares the per-row `next_run_after` loop with the vectorized
+`next_run_times` pass over columns of recurring campaigns.
+
+Usage:
+    python -m benchmarks.next_run_times [--sizes 10000 100000 1000000] [--loop-max 100000]
+"""
+import sys
+import json
+import time
+import argparse
+import datetime as dt
+from typing import Dict
+
+import numpy as np
+
+from src.utils.schedule import next_run_after
+from src.utils.schedule_columns import FREQUENCIES, next_run_times
+
+NOW = dt.datetime(2023, 6, 1, 12, 0, tzinfo=dt.timezone.utc)
+TIMES_OF_DAY = [None, "09:00", "18:30"]
+
+
+def make_columns(size: int, seed: int = 1) -> Dict[str, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2022-01-01T00:00:00", "s")
+    end_days = rng.integers(-30, 365, size)
+    return {
+        "last_run": start + rng.integers(0, 500 * 86400, size).astype("timedelta64[s]"),
+        "frequency": rng.integers(0, len(FREQUENCIES), size),
+        "time_of_day": rng.choice([-1, 9 * 3600, 18 * 3600 + 1800], size),
+        "end_date": np.where(
+            end_days < 0,
+            np.datetime64("NaT", "s"),
+            np.datetime64("2023-06-01T00:00:00", "s")
+            + end_days.astype("timedelta64[D]"),
+        ),
+    }
+
+
+def run_loop(columns: Dict[str, np.ndarray]) -> None:
+    utc = dt.timezone.utc
+    for last_run, frequency, time_of_day, end_date in zip(
+        columns["last_run"].astype(dt.datetime),
+        columns["frequency"].tolist(),
+        columns["time_of_day"].tolist(),
+        columns["end_date"].astype(dt.datetime),
+    ):
+        next_run_after(
+            last_run.replace(tzinfo=utc),
+            FREQUENCIES[frequency],
+            NOW,
+            time_of_day=None
+            if time_of_day < 0
+            else dt.time(time_of_day // 3600, time_of_day // 60 % 60),
+            end_date=None if end_date is None else end_date.replace(tzinfo=utc),
+        )
+
+
+def bench(size: int, loop_max: int) -> Dict:
+    columns = make_columns(size)
+    started = time.perf_counter()
+    next_run_times(now=NOW, **columns)
+    vectorized_seconds = time.perf_counter() - started
+    result = {
+        "campaigns": size,
+        "vectorized_ms": round(vectorized_seconds * 1000, 2),
+        "vectorized_rows_per_sec": round(size / vectorized_seconds),
+    }
+    if size <= loop_max:
+        started = time.perf_counter()
+        run_loop(columns)
+        loop_seconds = time.perf_counter() - started
+        result["loop_ms"] = round(loop_seconds * 1000, 2)
+        result["loop_rows_per_sec"] = round(size / loop_seconds)
+        result["speedup"] = round(loop_seconds / vectorized_seconds, 1)
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument(
+        "--loop-max",
+        type=int,
+        default=100_000,
+        help="Largest size the per-row loop is run at",
+    )
+    args = parser.parse_args()
+    print(json.dumps([bench(size, args.loop_max) for size in args.sizes], indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
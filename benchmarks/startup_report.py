@@ -0,0 +1,85 @@
+# Path: benchmarks/startup_report.py
+"""Reports the cold start of the function: the import time of every module
+imported by `main` and the time of every lazy initialization step.
+
+Usage:
+    python -m benchmarks.startup_report [--warm-up] [--top 20] [--budget-ms 500]
+
+`--warm-up` also creates the clients, which needs the environment variables
+and Google credentials of a real deployment. With `--budget-ms` the script
+exits with a non-zero status if importing `main` takes longer than the budget.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, main
+if {warm_up}:
+    main.warm_up()
+print(json.dumps(main.startup_timer.report()))
+"""
+
+
+def parse_importtime(stderr: str) -> List[Dict]:
+    """Parse the output of `python -X importtime` into one entry per module."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        modules.append(
+            {
+                "module": name.strip(),
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+            }
+        )
+    return modules
+
+
+def startup_report(warm_up: bool = False, top: int = 20) -> Dict:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(warm_up=warm_up)],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = parse_importtime(result.stderr)
+    main_module = next(m for m in modules if m["module"] == "main")
+    return {
+        "main_import_ms": main_module["cumulative_ms"],
+        "slowest_imports": sorted(modules, key=lambda m: m["self_ms"], reverse=True)[
+            :top
+        ],
+        "steps_ms": json.loads(result.stdout.strip().splitlines()[-1]),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--warm-up", action="store_true")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--budget-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    report = startup_report(warm_up=args.warm_up, top=args.top)
+    print(json.dumps(report, indent=2))
+    if args.budget_ms is not None and report["main_import_ms"] > args.budget_ms:
+        print(
+            f"Importing main took {report['main_import_ms']} ms, "
+            f"over the budget of {args.budget_ms} ms",
+            file=sys.stderr,
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""Measures the size, compression ratio and encode/decode time of task
+bodies for synthetic campaigns with large audiences.
+
+Usage:
+    python -m benchmarks.task_body [--sizes 1000 10000 100000] [--levels 1 6 9]
+"""
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+from typing import Dict, List
+
+from src.utils.task_body import decode_task_body, encode_task_body
+
+
+def make_payload(audience_size: int, seed: int = 1) -> Dict:
+    rng = random.Random(seed)
+    return {
+        "id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "name": "Campaign",
+        "type": "instant",
+        "company_id": "company-1",
+        "questionnaire_ids": [str(uuid.UUID(int=rng.getrandbits(128)))],
+        "audience_ids": [
+            str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(audience_size)
+        ],
+    }
+
+
+def timed(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def bench(audience_size: int, levels: List[int], repeat: int) -> List[Dict]:
+    payload = make_payload(audience_size)
+    results = []
+    plain = encode_task_body(payload)
+    results.append(
+        {
+            "audience_ids": audience_size,
+            "encoding": "identity",
+            "bytes": plain.size,
+            "ratio": 1.0,
+            "encode_ms": round(
+                timed(lambda: encode_task_body(payload), repeat) * 1000, 2
+            ),
+            "decode_ms": round(
+                timed(lambda: decode_task_body(plain.body, plain.headers), repeat)
+                * 1000,
+                2,
+            ),
+        }
+    )
+    for level in levels:
+        encoded = encode_task_body(payload, "gzip", threshold=0, level=level)
+        encode_seconds = timed(
+            lambda: encode_task_body(payload, "gzip", threshold=0, level=level), repeat
+        )
+        decode_seconds = timed(
+            lambda: decode_task_body(encoded.body, encoded.headers), repeat
+        )
+        results.append(
+            {
+                "audience_ids": audience_size,
+                "encoding": f"gzip-{level}",
+                "bytes": encoded.size,
+                "ratio": round(encoded.ratio, 2),
+                "encode_ms": round(encode_seconds * 1000, 2),
+                "decode_ms": round(decode_seconds * 1000, 2),
+            }
+        )
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 6, 9])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    results = []
+    for size in args.sizes:
+        results.extend(bench(size, args.levels, args.repeat))
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,48 +1,183 @@
 # Path: main.py
+import time
+
+_import_started = time.perf_counter()
+
+import hmac
+import math
 import logging
+import threading
 import datetime as dt
 from flask import jsonify, Response, Request
 import functions_framework
-from typing import Any, Dict, List, Tuple, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 from src.errors.verification_error import VerificationError
+from src.errors.circuit_open_error import CircuitOpenError
 
 from src.services.user_services import AdminUserService
 from src.services.campaign_service import CampaignService
-from src.utils.get_secret_payload import get_secret_payload
+from src.utils.secret_cache import SecretCache
+from src.utils.idempotency import (
+    IdempotencyKeyReuseError,
+    IdempotencyStore,
+    IdempotencyTimeoutError,
+    derive_idempotency_key,
+)
 from src.utils.token_extractor import extract_token_from_header
 from src.utils.get_env_vars import get_env_vars
-from supacrud import Supabase, ResponseType
+from src.utils.jwt_verifier import JWTVerifier
+from src.utils.http_session import create_session
+from src.utils.log_pipeline import (
+    DEFAULT_MAX_CHARS,
+    DEFAULT_MAX_ITEMS,
+    configure_logging,
+    redact,
+)
+from src.utils.startup import Lazy, startup_timer
+from src.utils.timing import RequestTimer, histograms, span, start_request
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+CAMPAIGN_ACTION_TYPES = [
+    "create_campaign",
+    "create_campaigns",
+    "edit_campaign",
+    "delete_campaign",
+]
+# Action types that are only valid at the top level of a request, for the
+# callers in SCHEDULER_SUBJECTS, and that are never replayed
+SCHEDULER_ACTION_TYPES = [
+    "schedule_recurring_campaigns",
+    "drain_task_outbox",
+    "reconcile_tasks",
+]
+# Action types replayed without an Idempotency-Key header, by their payload
+DERIVED_KEY_ACTION_TYPES = ["create_campaign"]
+MAX_BATCH_SIZE = 500
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "POST, GET, DELETE, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type, Authorization, Idempotency-Key",
+    "Access-Control-Expose-Headers": "Idempotency-Replayed, Retry-After, Server-Timing",
+}
+
 # Get environment variables once and reuse
 env_vars = get_env_vars()
+log_listener = configure_logging(env_vars)
+request_timing = env_vars["REQUEST_TIMING"] == "true"
+metrics_token = env_vars["METRICS_TOKEN"]
 
-# Create a CampaignService instance once and reuse
-campaign_service = CampaignService(env_vars)
 
-# get the service key
-service_key = get_secret_payload(
-    project_id=env_vars["PROJECT_ID"],
-    secret_id=env_vars["SUPABASE_SERVICE_ROLE_SECRET_ID"],
-    version_id=env_vars["VERSION_ID"],
-)
-if not service_key:
-    raise Exception("Service key not found")
-
-# Create an AdminUserService instance once and reuse
-admin_user_service = AdminUserService(
-    base_url=env_vars["SUPABASE_URL"],
-    anon_key=env_vars["SUPABASE_ANON_KEY"],
-    service_key=service_key,
-)
+# The clients below are created once, on first use, so that a new instance
+# can start serving without waiting on Secret Manager or the Google clients.
+def _create_campaign_service() -> CampaignService:
+    return CampaignService(env_vars)
+
+
+def get_service_key() -> str:
+    """Returns the service key, refreshed from Secret Manager when it expires."""
+    return secret_cache.get(
+        project_id=env_vars["PROJECT_ID"],
+        secret_id=env_vars["SUPABASE_SERVICE_ROLE_SECRET_ID"],
+        version_id=env_vars["VERSION_ID"],
+    )
+
+
+def get_cached_service_key() -> Optional[str]:
+    """Returns the cached service key without I/O, None if it has to be fetched."""
+    return secret_cache.get_cached(
+        project_id=env_vars["PROJECT_ID"],
+        secret_id=env_vars["SUPABASE_SERVICE_ROLE_SECRET_ID"],
+        version_id=env_vars["VERSION_ID"],
+    )
+
+
+def _create_jwt_verifier() -> Optional[JWTVerifier]:
+    """Verify JWT signatures locally if a JWT secret or JWKS url is configured."""
+    jwt_secret = None
+    if env_vars["SUPABASE_JWT_SECRET_ID"]:
+        jwt_secret = lambda: secret_cache.get(
+            project_id=env_vars["PROJECT_ID"],
+            secret_id=env_vars["SUPABASE_JWT_SECRET_ID"],
+            version_id="latest",
+        )
+    if not jwt_secret and not env_vars["SUPABASE_JWKS_URL"]:
+        return None
+    return JWTVerifier(
+        jwt_secret=jwt_secret,
+        jwks_url=env_vars["SUPABASE_JWKS_URL"],
+    )
 
-supabase_client = Supabase(
-    base_url=env_vars["SUPABASE_URL"],
-    anon_key=env_vars["SUPABASE_ANON_KEY"],
-    service_role_key=service_key,
-)
+
+def _create_admin_user_service() -> AdminUserService:
+    return AdminUserService(
+        base_url=env_vars["SUPABASE_URL"],
+        anon_key=env_vars["SUPABASE_ANON_KEY"],
+        service_key=get_service_key(),
+        cache_ttl=float(env_vars["VERIFIED_USER_CACHE_TTL"] or 300),
+        cache_maxsize=int(env_vars["VERIFIED_USER_CACHE_MAXSIZE"] or 1024),
+        jwt_verifier=jwt_verifier.get(),
+        remote_fallback=env_vars["JWT_REMOTE_FALLBACK"] != "false",
+        session=create_session(pool_maxsize=int(env_vars["HTTP_POOL_MAXSIZE"] or 16)),
+    )
+
+
+def _create_supabase_client(service_key: str):
+    from supacrud import Supabase
+
+    return Supabase(
+        base_url=env_vars["SUPABASE_URL"],
+        anon_key=env_vars["SUPABASE_ANON_KEY"],
+        service_role_key=service_key,
+    )
+
+
+secret_cache = SecretCache(ttl=float(env_vars["SECRET_CACHE_TTL"] or 300))
+idempotency_store = IdempotencyStore(ttl=float(env_vars["IDEMPOTENCY_TTL"] or 300))
+campaign_service = Lazy(_create_campaign_service, "campaign_service")
+jwt_verifier = Lazy(_create_jwt_verifier, "jwt_verifier")
+admin_user_service = Lazy(_create_admin_user_service, "admin_user_service")
+
+_supabase_client_lock = threading.Lock()
+_supabase_client: Tuple[Optional[str], Any] = (None, None)
+
+
+def get_admin_user_service(service_key: Optional[str] = None) -> AdminUserService:
+    """Returns the AdminUserService, using the given or the current service key."""
+    service = admin_user_service.get()
+    service_key = service_key or get_service_key()
+    if service.service_key != service_key:
+        service.set_service_key(service_key)
+    return service
+
+
+def get_supabase_client():
+    """Returns the Supabase client, recreated when the service key is rotated."""
+    global _supabase_client
+    service_key = get_service_key()
+    if _supabase_client[0] != service_key:
+        with _supabase_client_lock:
+            if _supabase_client[0] != service_key:
+                with startup_timer.step("supabase_client"):
+                    client = _create_supabase_client(service_key)
+                _supabase_client = (service_key, client)
+    return _supabase_client[1]
+
+
+def warm_up() -> None:
+    """Create every client and open the Cloud Tasks channel ahead of the first request."""
+    try:
+        with startup_timer.step("service_key"):
+            get_service_key()
+        get_admin_user_service()
+        get_supabase_client()
+        with startup_timer.step("cloud_tasks_client"):
+            campaign_service.get().queue_path(env_vars["QUEUE_NAME"])
+        logger.info("Warm up complete: %s", startup_timer.report())
+    except Exception as error:
+        logger.error("Error warming up: %s", error)
 
 
 def verify_request(request: Request) -> Tuple[str, str, Dict[str, Any]]:
@@ -68,25 +203,222 @@ def verify_request(request: Request) -> Tuple[str, str, Dict[str, Any]]:
         raise VerificationError("No token provided")
 
     # verify user token
-    token_verification = admin_user_service.verify_user(jwt_token)
+    token_verification = get_admin_user_service().verify_user(jwt_token)
     if "error" in token_verification:
         raise VerificationError(token_verification["error"])
 
+    queue_name, action_type, payload = parse_request_data(data)
+    verify_scheduler_caller(action_type, jwt_token)
+    return queue_name, action_type, payload
+
+
+def verify_scheduler_caller(action_type: str, jwt_token: str) -> None:
+    """
+    Validate that only the scheduler identities run the scheduler actions.
+
+    Parameters:
+    action_type (str): The action type of the request.
+    jwt_token (str): The verified JWT of the request.
+
+    Raises:
+    VerificationError: If the user of the token is not in SCHEDULER_SUBJECTS.
+    """
+    if action_type not in SCHEDULER_ACTION_TYPES:
+        return
+    subjects = {
+        subject.strip()
+        for subject in (env_vars["SCHEDULER_SUBJECTS"] or "").split(",")
+        if subject.strip()
+    }
+    if AdminUserService.is_jwt_valid(jwt_token).get("sub") not in subjects:
+        raise VerificationError(f"User is not allowed to run {action_type}")
+
+
+def parse_request_data(data: Dict[str, Any]) -> Tuple[str, str, Dict[str, Any]]:
+    """
+    Extract queue name, action type, and payload of a verified request body.
+
+    Parameters:
+    data (dict): The JSON body of the request.
+
+    Returns:
+    Tuple[str, str, Dict[str, Any]]: The queue name, action type, and payload.
+
+    Raises:
+    VerificationError: If the body is invalid.
+    """
     queue_name = data.get("queue_name")
     action_type = data.get("action_type")
     payload = data.get("payload")
-    logger.info("Received request with payload: %s", payload)
+    # Payloads carry user data, they are only logged at DEBUG and redacted
+    logger.info("Received %s request for queue %s", action_type, queue_name)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "Request payload: %s",
+            redact(
+                payload,
+                max_items=int(env_vars.get("LOG_MAX_ITEMS") or DEFAULT_MAX_ITEMS),
+                max_chars=int(env_vars.get("LOG_MAX_CHARS") or DEFAULT_MAX_CHARS),
+            ),
+        )
     if not all([queue_name, action_type, payload]):
         raise VerificationError(
             "Missing queue_name, action_type, or payload in request data"
         )
 
-    if action_type not in ["create_campaign", "edit_campaign", "delete_campaign"]:
+    if action_type == "batch":
+        verify_batch_payload(payload)
+    elif action_type not in CAMPAIGN_ACTION_TYPES + SCHEDULER_ACTION_TYPES:
         raise VerificationError("Invalid action_type provided in payload")
 
     return queue_name, action_type, payload
 
 
+def verify_batch_payload(payload: Dict[str, Any]) -> None:
+    """
+    Validate the items of a batch request.
+
+    Parameters:
+    payload (dict): The batch payload, with an `items` list.
+
+    Raises:
+    VerificationError: If the batch is invalid.
+    """
+    items = payload.get("items") if isinstance(payload, dict) else None
+    if not isinstance(items, list) or not items:
+        raise VerificationError("Missing items in batch payload")
+    if len(items) > MAX_BATCH_SIZE:
+        raise VerificationError(f"Batch exceeds the maximum of {MAX_BATCH_SIZE} items")
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get("payload"), dict):
+            raise VerificationError(f"Missing payload in batch item {index}")
+        if item.get("action_type") not in CAMPAIGN_ACTION_TYPES:
+            raise VerificationError(f"Invalid action_type in batch item {index}")
+
+
+def get_idempotency_key(
+    request: Request, action_type: str, payload: Dict[str, Any]
+) -> Optional[str]:
+    """
+    Get the idempotency key of a verified request, scoped to the user.
+    The `Idempotency-Key` header is used if present, otherwise the key of a
+    create_campaign request is derived from its payload.
+
+    Parameters:
+    request (request): The incoming request from the client.
+    action_type (str): The action type of the request.
+    payload (dict): The payload of the request.
+
+    Returns:
+    Optional[str]: The idempotency key, None if the request is not replayed.
+    """
+    return derive_request_key(request.headers, action_type, payload)
+
+
+def derive_request_key(
+    headers: Any, action_type: str, payload: Dict[str, Any]
+) -> Optional[str]:
+    """
+    Get the idempotency key of a verified request from its headers.
+    Only create_campaign requests without an `Idempotency-Key` header get a
+    key derived from their payload, as repeating an edit or a delete with the
+    same payload can be intended, e.g. to undo an edit in between. Scheduler
+    actions report on the current state and are never replayed.
+
+    Parameters:
+    headers: The case-insensitive headers of the request.
+    action_type (str): The action type of the request.
+    payload (dict): The payload of the request.
+
+    Returns:
+    Optional[str]: The idempotency key, None if the request is not replayed.
+    """
+    if action_type in SCHEDULER_ACTION_TYPES:
+        return None
+    jwt_token = extract_token_from_header(headers)
+    user_id = AdminUserService.is_jwt_valid(jwt_token).get("sub", "")
+    idempotency_key = headers.get("Idempotency-Key")
+    if idempotency_key:
+        return derive_idempotency_key("Idempotency-Key", idempotency_key, user_id)
+    if action_type in DERIVED_KEY_ACTION_TYPES:
+        return derive_idempotency_key(action_type, payload, user_id)
+    return None
+
+
+def error_response(error: Exception) -> Tuple[int, Dict[str, Any], Dict[str, str]]:
+    """
+    Map an error of a request to its response.
+
+    Parameters:
+    error (Exception): The error raised while processing the request.
+
+    Returns:
+    Tuple[int, Dict[str, Any], Dict[str, str]]: The status code, the body
+        and the headers to add to the response.
+    """
+    if isinstance(error, VerificationError):
+        logger.error("Error processing request: %s", error.message)
+        return 400, {"message": error.message}, {}
+    if isinstance(error, IdempotencyTimeoutError):
+        logger.error("Error processing request: %s", error.message)
+        return 409, {"message": error.message}, {}
+    if isinstance(error, IdempotencyKeyReuseError):
+        logger.error("Error processing request: %s", error.message)
+        return 422, {"message": error.message}, {}
+    if isinstance(error, CircuitOpenError):
+        logger.error("Error processing request: %s", error.message)
+        retry_after = str(max(1, math.ceil(error.retry_after)))
+        return 503, {"message": error.message}, {"Retry-After": retry_after}
+    logger.error("Error processing request: %s", error)
+    return 500, {"message": "Internal server error"}, {}
+
+
+def report_timing(timer: RequestTimer, headers: Dict[str, str]) -> None:
+    """
+    Add the spans of a request to its response headers and log them.
+
+    Parameters:
+    timer (RequestTimer): The timer of the request.
+    headers (dict): The headers of the response.
+    """
+    headers["Server-Timing"] = timer.server_timing()
+    headers["Timing-Allow-Origin"] = "*"
+    summary = timer.summary()
+    logger.info("Request timing: %s", summary, extra={"timing": summary})
+
+
+def metrics_response(headers: Dict[str, str]) -> Tuple[str, int, Dict[str, str]]:
+    """
+    Dump the span histograms of the instance in the Prometheus text format.
+    """
+    headers["Content-Type"] = "text/plain; version=0.0.4"
+    return (histograms.to_prometheus(), 200, headers)
+
+
+def is_metrics_request(method: str, path: str) -> bool:
+    """
+    Whether a request scrapes the metrics, which are only served if both
+    REQUEST_TIMING and METRICS_TOKEN are set.
+    """
+    return (
+        request_timing
+        and bool(metrics_token)
+        and method == "GET"
+        and path.rstrip("/").endswith("/metrics")
+    )
+
+
+def is_metrics_authorized(headers: Any) -> bool:
+    """
+    Whether a metrics request has the METRICS_TOKEN as its bearer token.
+
+    Parameters:
+    headers: The case-insensitive headers of the request.
+    """
+    token = extract_token_from_header(headers) or ""
+    return hmac.compare_digest(token.encode(), metrics_token.encode())
+
+
 @functions_framework.http
 def main(request: Request) -> Union[Response, Tuple[Response, int]]:
     """
@@ -103,31 +435,72 @@ def main(request: Request) -> Union[Response, Tuple[Response, int]]:
     """
     
     # Set default CORS headers
-    headers = {
-        "Access-Control-Allow-Origin": "*",
-        "Access-Control-Allow-Methods": "POST, GET, DELETE, OPTIONS",
-        "Access-Control-Allow-Headers": "Content-Type, Authorization",
-    }
+    headers = dict(CORS_HEADERS)
     
     # Handle CORS preflight requests
     if request.method == "OPTIONS":
         return ("", 204, headers)
 
-    # Handle main requests
+    if is_metrics_request(request.method, request.path):
+        if not is_metrics_authorized(request.headers):
+            return (jsonify({"message": "Unauthorized"}), 401, headers)
+        return metrics_response(headers)
+
+    if not request_timing:
+        return handle_request(request, headers)
+    with start_request() as timer:
+        response = handle_request(request, headers)
+    report_timing(timer, headers)
+    return response
+
+
+def handle_request(
+    request: Request, headers: Dict[str, str]
+) -> Tuple[Response, int, Dict[str, str]]:
+    """
+    Verify a request and dispatch it to the action of its type.
+
+    Parameters:
+    request (request): The incoming request from the client.
+    headers (dict): The headers of the response.
+
+    Returns:
+    Tuple[Response, int, Dict[str, str]]: The response to be returned to the client.
+    """
     try:
-        queue_name, action_type, payload = verify_request(request)
-        response_action = campaign_service.action_dispatcher(
-            action_type=action_type,
-        )
-        response_data = response_action(
-            supabase=supabase_client,
-            payload=payload,
-        )
+        with span("verify"):
+            queue_name, action_type, payload = verify_request(request)
+            idempotency_key = get_idempotency_key(request, action_type, payload)
+
+        def dispatch():
+            response_action = campaign_service.get().action_dispatcher(
+                action_type=action_type,
+                queue_name=queue_name,
+            )
+            with span(f"action.{action_type}"):
+                return response_action(
+                    supabase=get_supabase_client(),
+                    payload=payload,
+                )
+
+        # Retried requests replay the stored response instead of running again
+        if idempotency_key is None:
+            response_data, replayed = dispatch(), False
+        else:
+            response_data, replayed = idempotency_store.run(
+                idempotency_key, dispatch, derive_idempotency_key(action_type, payload)
+            )
+        if replayed:
+            headers["Idempotency-Replayed"] = "true"
         return (jsonify(response_data), 200, headers)
 
-    except VerificationError as error:
-        logger.error("Error processing request: %s", error.message)
-        return (jsonify({"message": error.message}), 400, headers)
     except Exception as error:
-        logger.error("Error processing request: %s", error)
-        return (jsonify({"message": "Internal server error"}), 500, headers)#
+        status, body, error_headers = error_response(error)
+        headers.update(error_headers)
+        return (jsonify(body), status, headers)
+
+
+startup_timer.record("import", time.perf_counter() - _import_started)
+
+if env_vars["WARM_UP_ON_START"] == "true":
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
@@ -0,0 +1,135 @@
+-- Transactional outbox of the Cloud Tasks side effects of campaign writes.
+-- The campaign write and its task intent are committed together; the
+-- `drain_task_outbox` action then creates or deletes the tasks.
+
+create table if not exists public.campaign_task_outbox (
+    id bigint generated always as identity primary key,
+    campaign_id uuid not null,
+    -- create, delete or replace (delete the previous tasks, create the new ones)
+    action text not null check (action in ('create', 'delete', 'replace')),
+    -- The task body of create and replace intents
+    payload jsonb,
+    -- The TaskRef of the tasks to create, and of the tasks to delete
+    task_ref text,
+    previous_task_ref text,
+    status text not null default 'pending'
+        check (status in ('pending', 'done', 'failed')),
+    attempts integer not null default 0,
+    last_error text,
+    lease_until timestamptz,
+    created_at timestamptz not null default now(),
+    processed_at timestamptz
+);
+
+create index if not exists campaign_task_outbox_pending_idx
+    on public.campaign_task_outbox (id)
+    where status = 'pending';
+
+-- Creates a campaign and records the intent to create its tasks.
+create or replace function public.create_campaign_with_task(_campaign jsonb, _task jsonb)
+returns uuid
+language plpgsql
+as $$
+declare
+    _id uuid;
+    _row public.campaigns;
+begin
+    -- Columns are listed so that id and created_at keep their defaults
+    _row := jsonb_populate_record(null::public.campaigns, _campaign - 'id');
+    insert into public.campaigns (
+        name, count, threshold, status, company_id, created_by, next_run_time,
+        type, duration, end_date, frequency, time_of_day, description,
+        audience_ids, questionnaire_ids, cloud_task_id
+    ) values (
+        _row.name, _row.count, _row.threshold, _row.status, _row.company_id,
+        _row.created_by, _row.next_run_time, _row.type, _row.duration,
+        _row.end_date, _row.frequency, _row.time_of_day, _row.description,
+        _row.audience_ids, _row.questionnaire_ids, _row.cloud_task_id
+    )
+    returning id into _id;
+
+    insert into public.campaign_task_outbox (campaign_id, action, payload, task_ref)
+    values (_id, 'create', _task || jsonb_build_object('id', _id), _campaign ->> 'cloud_task_id');
+    return _id;
+end;
+$$;
+
+-- Updates a campaign and records the intent to replace or delete its tasks.
+-- The tasks to replace are the ones of the TaskRef stored on the locked row,
+-- _previous_task_ref is only used for rows without one.
+create or replace function public.update_campaign_with_task(
+    _id uuid,
+    _campaign jsonb,
+    _action text,
+    _task jsonb,
+    _previous_task_ref text
+)
+returns setof public.campaigns
+language plpgsql
+as $$
+declare
+    _row public.campaigns;
+begin
+    select * into _row from public.campaigns where id = _id for update;
+    if not found then
+        return;
+    end if;
+    _previous_task_ref := coalesce(_row.cloud_task_id, _previous_task_ref);
+    _row := jsonb_populate_record(_row, _campaign - 'id');
+    update public.campaigns set (
+        name, count, threshold, status, company_id, created_by, next_run_time,
+        type, duration, end_date, frequency, time_of_day, description,
+        audience_ids, questionnaire_ids, cloud_task_id
+    ) = (
+        _row.name, _row.count, _row.threshold, _row.status, _row.company_id,
+        _row.created_by, _row.next_run_time, _row.type, _row.duration,
+        _row.end_date, _row.frequency, _row.time_of_day, _row.description,
+        _row.audience_ids, _row.questionnaire_ids, _row.cloud_task_id
+    )
+    where id = _id;
+
+    insert into public.campaign_task_outbox
+        (campaign_id, action, payload, task_ref, previous_task_ref)
+    values (_id, _action, _task, _campaign ->> 'cloud_task_id', _previous_task_ref);
+    return query select * from public.campaigns where id = _id;
+end;
+$$;
+
+-- Deletes a campaign and records the intent to delete its tasks, the ones of
+-- the TaskRef of the deleted row. _task_ref is only used for rows without one.
+create or replace function public.delete_campaign_with_task(_id uuid, _task_ref text)
+returns setof public.campaigns
+language plpgsql
+as $$
+declare
+    _row public.campaigns;
+begin
+    delete from public.campaigns where id = _id returning * into _row;
+    if not found then
+        return;
+    end if;
+    if coalesce(_row.type, 'instant') = 'instant' or _row.cloud_task_id is not null then
+        insert into public.campaign_task_outbox (campaign_id, action, previous_task_ref)
+        values (_id, 'delete', coalesce(_row.cloud_task_id, _task_ref));
+    end if;
+    return next _row;
+end;
+$$;
+
+-- Leases up to _limit pending intents, concurrent drainers skip each other's rows.
+create or replace function public.claim_campaign_task_outbox(_limit integer, _lease_seconds integer)
+returns setof public.campaign_task_outbox
+language sql
+as $$
+    update public.campaign_task_outbox
+    set lease_until = now() + make_interval(secs => _lease_seconds),
+        attempts = attempts + 1
+    where id in (
+        select id from public.campaign_task_outbox
+        where status = 'pending' and (lease_until is null or lease_until < now())
+        order by id
+        limit _limit
+        for update skip locked
+    )
+    returning *;
+$$;
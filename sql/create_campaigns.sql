@@ -0,0 +1,39 @@
+-- Creates many campaigns in one transaction, for the `create_campaigns` action.
+-- _campaigns is a JSON array of `create_campaign` parameters, whose keys are
+-- the column names prefixed with an underscore. The ids are returned in the
+-- order of the array.
+create or replace function public.create_campaigns(_campaigns jsonb)
+returns setof uuid
+language plpgsql
+as $$
+declare
+    _params jsonb;
+    _row public.campaigns;
+    _id uuid;
+begin
+    -- One insert per campaign, in the order of the array, so that the ids
+    -- are returned in that order
+    for _params in
+        select value from jsonb_array_elements(_campaigns) with ordinality
+        order by ordinality
+    loop
+        _row := jsonb_populate_record(
+            null::public.campaigns,
+            (select jsonb_object_agg(substr(key, 2), value) from jsonb_each(_params))
+        );
+        -- Columns are listed so that id and created_at keep their defaults
+        insert into public.campaigns (
+            name, count, threshold, status, company_id, created_by, next_run_time,
+            type, duration, end_date, frequency, time_of_day, description,
+            audience_ids, questionnaire_ids, cloud_task_id
+        ) values (
+            _row.name, _row.count, _row.threshold, _row.status, _row.company_id,
+            _row.created_by, _row.next_run_time, _row.type, _row.duration,
+            _row.end_date, _row.frequency, _row.time_of_day, _row.description,
+            _row.audience_ids, _row.questionnaire_ids, _row.cloud_task_id
+        )
+        returning id into _id;
+        return next _id;
+    end loop;
+end;
+$$;
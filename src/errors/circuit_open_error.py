@@ -0,0 +1,8 @@
+# Path: src/errors/circuit_open_error.py
+class CircuitOpenError(Exception):
+    """Exception raised when a dependency is failing and calls to it are short-circuited."""
+
+    def __init__(self, message, retry_after: float = 0):
+        self.message = message
+        self.retry_after = retry_after
+        super().__init__(self.message)
@@ -1,9 +1,24 @@
 # Path: src/models/campaign.py
 import datetime as dt
-from dataclasses import dataclass, asdict
-from typing import Optional, List
+from dataclasses import MISSING, dataclass, fields
+from itertools import repeat
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Union,
+    get_args,
+    get_origin,
+    get_type_hints,
+)
 
-@dataclass
+from src.errors.verification_error import VerificationError
+
+
+@dataclass(slots=True)
 class Campaign:
     name: str
     count: int
@@ -22,6 +37,141 @@ class Campaign:
     questionnaire_ids: Optional[List[str]] = None
     cloud_task_id: Optional[str] = None
 
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any]) -> "Campaign":
+        """
+        Validates a create payload against the field types and builds the campaign.
+        ISO 8601 timestamps and times are parsed once, here.
+        Args:
+            payload: The payload from the request.
+        Returns:
+            The campaign.
+        Raises:
+            VerificationError: If a field is missing, unknown, set by the
+                server or of the wrong type.
+        """
+        if not isinstance(payload, dict):
+            raise VerificationError("Campaign payload must be an object")
+        if payload.get("cloud_task_id") is not None:
+            # The TaskRef of the tasks is only ever written by the service
+            raise VerificationError(
+                "Campaign field 'cloud_task_id' is set by the server"
+            )
+        unknown = payload.keys() - _FIELD_NAMES
+        if unknown:
+            raise VerificationError(
+                f"Unknown campaign fields: {', '.join(sorted(unknown))}"
+            )
+        return cls(**cls.parse_fields(payload))
+
+    @staticmethod
+    def parse_fields(values: Dict[str, Any], required: bool = True) -> Dict[str, Any]:
+        """
+        Parses the campaign fields of a payload or a row, other keys are ignored.
+        Args:
+            values: The payload or row.
+            required: Whether the fields without a default must be set.
+        Returns:
+            The parsed fields that are not None.
+        Raises:
+            VerificationError: If a field is missing or of the wrong type.
+        """
+        fields = {}
+        for name, parse, is_required in _FIELD_PARSERS:
+            value = values.get(name)
+            if value is None:
+                if required and is_required:
+                    raise VerificationError(f"Missing campaign field '{name}'")
+                continue
+            try:
+                fields[name] = parse(value)
+            except ValueError as error:
+                raise VerificationError(f"Invalid campaign field '{name}': {error}")
+        return fields
+
+    def to_row(self):
+        """Converts the fields into a dictionary of the campaigns table columns."""
+        return {name: _encode(getattr(self, name)) for name, _ in _RPC_KEYS}
+
     def to_rpc_params(self):
-        """Converts the fields into a dictionary with keys prefixed with an underscore."""
-        return {f"_{k}": v for k, v in asdict(self).items()}
+        """Converts the fields into a dictionary with keys prefixed with an underscore.
+        Lists are shared with the campaign rather than copied, timestamps and
+        times are ISO 8601 strings."""
+        return {key: _encode(getattr(self, name)) for name, key in _RPC_KEYS}
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, (dt.datetime, dt.time)):
+        return value.isoformat()
+    return value
+
+
+def _parse_str(value: Any) -> str:
+    if not isinstance(value, str):
+        raise ValueError("expected a string")
+    return value
+
+
+def _parse_int(value: Any) -> int:
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise ValueError("expected an integer")
+    return value
+
+
+def _parse_datetime(value: Any) -> dt.datetime:
+    if isinstance(value, dt.datetime):
+        return value
+    if isinstance(value, str):
+        try:
+            # fromisoformat only accepts a trailing Z from Python 3.11
+            if value.endswith("Z"):
+                value = value[:-1] + "+00:00"
+            return dt.datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    raise ValueError("expected an ISO 8601 timestamp")
+
+
+def _parse_time(value: Any) -> dt.time:
+    if isinstance(value, dt.time):
+        return value
+    if isinstance(value, str):
+        try:
+            return dt.time.fromisoformat(value)
+        except ValueError:
+            pass
+    raise ValueError("expected an ISO 8601 time")
+
+
+def _parse_str_list(value: Any) -> List[str]:
+    # map runs isinstance without a Python frame per item, which matters for
+    # audiences of thousands of ids
+    if not isinstance(value, list) or not all(map(isinstance, value, repeat(str))):
+        raise ValueError("expected a list of strings")
+    return value
+
+
+_PARSERS: Dict[Any, Callable[[Any], Any]] = {
+    str: _parse_str,
+    int: _parse_int,
+    dt.datetime: _parse_datetime,
+    dt.time: _parse_time,
+    List[str]: _parse_str_list,
+}
+
+
+def _compile_parsers(cls: type) -> Tuple[Tuple[str, Callable[[Any], Any], bool], ...]:
+    """Resolves the parser of every field from its type, once."""
+    hints = get_type_hints(cls)
+    parsers = []
+    for field in fields(cls):
+        hint = hints[field.name]
+        if get_origin(hint) is Union:
+            hint = next(arg for arg in get_args(hint) if arg is not type(None))
+        parsers.append((field.name, _PARSERS[hint], field.default is MISSING))
+    return tuple(parsers)
+
+
+_FIELD_PARSERS = _compile_parsers(Campaign)
+_FIELD_NAMES = frozenset(name for name, _, _ in _FIELD_PARSERS)
+_RPC_KEYS = tuple((name, f"_{name}") for name, _, _ in _FIELD_PARSERS)
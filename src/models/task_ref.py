@@ -0,0 +1,169 @@
+# Path: src/models/task_ref.py
+import json
+import time
+import hashlib
+import datetime as dt
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.models.campaign import Campaign
+
+# Campaign types that are executed through a Cloud Task
+TASK_CAMPAIGN_TYPES = frozenset(["instant"])
+
+# Campaign types whose runs are scheduled ahead as Cloud Tasks
+RECURRING_CAMPAIGN_TYPES = frozenset(["recurring"])
+
+# Fields of an instant campaign that change what the survey executor does
+# with its tasks, or when they run. Descriptive fields such as the name,
+# description, status and count are left out, so editing them keeps the tasks.
+TASK_FINGERPRINT_FIELDS = frozenset(
+    [
+        "type",
+        "next_run_time",
+        "threshold",
+        "company_id",
+        "duration",
+        "end_date",
+        "frequency",
+        "time_of_day",
+        "audience_ids",
+        "questionnaire_ids",
+    ]
+)
+
+# Fields of a recurring campaign that change its runs. The count, status and
+# next_run_time change as the campaign runs, and must not rebuild its tasks.
+RUN_FINGERPRINT_FIELDS = frozenset(
+    [
+        "frequency",
+        "time_of_day",
+        "end_date",
+        "duration",
+        "audience_ids",
+        "questionnaire_ids",
+    ]
+)
+
+
+def _digest(fields: Dict[str, Any]) -> str:
+    canonical = json.dumps(fields, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, dt.datetime) and value.tzinfo is not None:
+        value = value.astimezone(dt.timezone.utc)
+    if isinstance(value, (dt.datetime, dt.time)):
+        return value.isoformat()
+    return value
+
+
+def task_fingerprint(payload: Dict[str, Any]) -> str:
+    """
+    Returns a short hash of the scheduling fields of an instant campaign.
+    The fields are parsed like a create payload and None values are dropped,
+    so that the sparse payload of a create and the stored row of an edit,
+    with its None columns and the timestamps as Postgres formats them, give
+    the same hash.
+    Args:
+        payload: The create payload, or the stored row with the edited fields.
+    Returns:
+        The fingerprint.
+    """
+    fields = Campaign.parse_fields(
+        {k: payload.get(k) for k in TASK_FINGERPRINT_FIELDS}, required=False
+    )
+    return _digest({k: _normalize(v) for k, v in fields.items()})
+
+
+def run_fingerprint(campaign: Dict[str, Any], anchor: int) -> str:
+    """Returns a short hash of the schedule fields of a recurring campaign and
+    the anchor its runs are counted from, in epoch seconds."""
+    fields = {k: campaign.get(k) for k in RUN_FINGERPRINT_FIELDS}
+    return _digest({**fields, "anchor": anchor})
+
+
+@dataclass
+class TaskRef:
+    """Describes the Cloud Tasks of a campaign.
+    It is stored in the `cloud_task_id` column as `key=value` pairs
+    separated by `;`, e.g. `fp=3f2a9c0d1e4b5a6c;r=0-6`.
+
+    `runs` is the inclusive range of run indexes of a recurring campaign
+    that have been scheduled as tasks. `chunks` is the number of tasks an
+    instant campaign's audience is split into, named `{campaign_id}-{n}`.
+    `queue` is the queue of the tasks, if it cannot be derived from the
+    campaign id. `generation` identifies the edit that replaced the tasks of
+    an instant campaign, whose names get a `-g{generation}` suffix, so that an
+    edit never re-uses the name of a recently deleted task. `anchor` is the
+    time, in epoch seconds, that the run indexes of a recurring campaign are
+    counted from.
+    """
+
+    fingerprint: Optional[str] = None
+    runs: Optional[Tuple[int, int]] = None
+    chunks: Optional[int] = None
+    queue: Optional[str] = None
+    generation: Optional[int] = None
+    anchor: Optional[int] = None
+
+    def to_str(self) -> str:
+        fields = {
+            "fp": self.fingerprint,
+            "r": f"{self.runs[0]}-{self.runs[1]}" if self.runs else None,
+            "c": self.chunks,
+            "q": self.queue,
+            "g": self.generation,
+            "a": self.anchor,
+        }
+        return ";".join(f"{k}={v}" for k, v in fields.items() if v is not None)
+
+    def task_names(self, campaign_id: str) -> List[str]:
+        """Returns the task names of an instant campaign, one per audience chunk."""
+        base = f"{campaign_id}-g{self.generation}" if self.generation else campaign_id
+        if not self.chunks:
+            return [base]
+        return [f"{base}-{n}" for n in range(self.chunks)]
+
+    def next_generation(self) -> int:
+        """Returns the generation of the tasks that replace these ones.
+        It is a millisecond timestamp, unique per attempt, so that the retry
+        of a failed edit does not re-create the names its cleanup deleted,
+        which Cloud Tasks rejects for about an hour."""
+        return max((self.generation or 0) + 1, time.time_ns() // 1_000_000)
+
+    def run_task_name(self, campaign_id: str, index: int) -> str:
+        """Returns the task name of a run of a recurring campaign."""
+        return f"{campaign_id}-{self.fingerprint}-r{index}"
+
+    def run_task_names(self, campaign_id: str) -> List[str]:
+        """Returns the task names of every scheduled run of a recurring campaign."""
+        if not self.runs:
+            return []
+        return [
+            self.run_task_name(campaign_id, index)
+            for index in range(self.runs[0], self.runs[1] + 1)
+        ]
+
+    @classmethod
+    def parse(cls, value: Optional[str]) -> Optional["TaskRef"]:
+        """Parses a `cloud_task_id` value, returns None if it is not a TaskRef."""
+        if not value or "=" not in value:
+            return None
+        fields = dict(part.split("=", 1) for part in value.split(";") if "=" in part)
+        runs = None
+        if fields.get("r"):
+            first, last = fields["r"].split("-", 1)
+            runs = (int(first), int(last))
+        chunks = int(fields["c"]) if fields.get("c") else None
+        generation = int(fields["g"]) if fields.get("g") else None
+        anchor = int(fields["a"]) if fields.get("a") else None
+        return cls(
+            fingerprint=fields.get("fp"),
+            runs=runs,
+            chunks=chunks,
+            queue=fields.get("q") or None,
+            generation=generation,
+            anchor=anchor,
+        )
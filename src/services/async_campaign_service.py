@@ -0,0 +1,395 @@
+# Path: src/services/async_campaign_service.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+import datetime as dt
+from functools import partial
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional, Union
+
+from src.models.task_ref import TaskRef
+from src.utils.timing import span
+
+if TYPE_CHECKING:
+    from google.cloud import tasks_v2
+    from supacrud import Supabase
+    from src.services.campaign_service import CampaignService, EditPlan
+    from src.utils.async_supabase import AsyncSupabase
+
+logger = logging.getLogger(__name__)
+
+AsyncAction = Callable[..., Awaitable[Any]]
+
+
+class AsyncCampaignService:
+    """Runs the campaign actions of a request on an event loop.
+
+    Creates, edits and deletes await an `AsyncSupabase` client and the async
+    Cloud Tasks client, so that one instance serves many concurrent requests
+    without holding a thread per request. The planning of the tasks, the
+    configuration and the resilience guards are shared with `CampaignService`.
+    The other actions, e.g. batches and the scheduler actions, are long-running
+    jobs that fan out over the pool of the sync service; they run in a worker
+    thread with the sync Supabase client.
+    """
+
+    def __init__(
+        self,
+        campaign_service: CampaignService,
+        sync_supabase: Callable[[], Supabase],
+    ):
+        self.campaign_service = campaign_service
+        self.sync_supabase = sync_supabase
+        self._client: Optional[tasks_v2.CloudTasksAsyncClient] = None
+        self._queue_paths: Dict[str, str] = {}
+
+    @property
+    def client(self) -> tasks_v2.CloudTasksAsyncClient:
+        """The async Cloud Tasks client, created on first use in the running loop."""
+        if self._client is None:
+            from google.cloud import tasks_v2
+
+            self._client = tasks_v2.CloudTasksAsyncClient()
+        return self._client
+
+    async def close(self) -> None:
+        """Closes the gRPC channel of the client."""
+        if self._client is not None:
+            await self._client.transport.close()
+            self._client = None
+
+    async def reset_client(self) -> None:
+        """Close the current client so the next call creates a new channel."""
+        client, self._client = self._client, None
+        if client is not None:
+            try:
+                await client.transport.close()
+            except Exception as error:
+                logger.warning("Error closing Cloud Tasks channel: %s", error)
+
+    def _is_channel_broken(self, error: Exception) -> bool:
+        import grpc
+
+        return isinstance(
+            error, grpc.aio.UsageError
+        ) or self.campaign_service._is_channel_broken(error)
+
+    def queue_path(self, queue_name: Optional[str] = None) -> str:
+        service = self.campaign_service
+        queue_name = queue_name or service.queue_name
+        path = self._queue_paths.get(queue_name)
+        if path is None:
+            path = self.client.queue_path(service.project, service.location, queue_name)
+            self._queue_paths[queue_name] = path
+        return path
+
+    def action_dispatcher(
+        self, action_type: str, queue_name: Optional[str] = None
+    ) -> AsyncAction:
+        """
+        Selects the action to be performed based on the action type.
+        The Supabase client passed to the action is guarded.
+        Args:
+            action_type: The action type.
+            queue_name: The queue requested for new tasks, used if it is allowed.
+        Returns:
+            The coroutine function to be awaited.
+        """
+        service = self.campaign_service
+        queue_name = service.allowed_queue(queue_name)
+        if action_type == "create_campaign":
+            action = partial(self.create_campaign, queue_name=queue_name)
+        elif action_type == "edit_campaign":
+            action = self.edit_campaign
+        elif action_type == "delete_campaign":
+            action = self.delete_campaign
+        else:
+            sync_action = service.action_dispatcher(action_type, queue_name)
+
+            async def threaded_action(supabase: AsyncSupabase, payload: Dict):
+                return await asyncio.to_thread(
+                    sync_action, supabase=self.sync_supabase(), payload=payload
+                )
+
+            return threaded_action
+
+        async def guarded_action(supabase: AsyncSupabase, payload: Dict):
+            return await action(
+                supabase=service.guard_supabase(supabase), payload=payload
+            )
+
+        return guarded_action
+
+    async def create_task(
+        self,
+        payload: dict,
+        task_name: str,
+        schedule_time: Union[dt.datetime, None] = None,
+        queue_name: Union[None, str] = None,
+    ) -> tasks_v2.Task:
+        """Creates a task like `CampaignService.create_task`, with the async client."""
+        service = self.campaign_service
+
+        async def create():
+            request, encoded = service.build_task_request(
+                payload,
+                task_name,
+                schedule_time,
+                queue_path=self.queue_path(queue_name),
+            )
+            response = await self.client.create_task(request=request)
+            service.log_created_task(response, encoded)
+            return response
+
+        try:
+            with span("cloud_tasks.create_task"):
+                return await service.guards["cloud_tasks"].call_async(create)
+        except Exception as error:
+            if self._is_channel_broken(error):
+                await self.reset_client()
+            logger.error("Error creating task %s: %s", task_name, error)
+            raise
+
+    async def delete_task(
+        self, task_name: str, queue_name: Union[None, str] = None
+    ) -> bool:
+        """Deletes a task like `CampaignService.delete_task`, with the async client."""
+        name = f"{self.queue_path(queue_name)}/tasks/{task_name}"
+        try:
+            with span("cloud_tasks.delete_task"):
+                await self.campaign_service.guards["cloud_tasks"].call_async(
+                    self.client.delete_task, name=name, retry=False
+                )
+            return True
+        except Exception as error:
+            if self._is_channel_broken(error):
+                await self.reset_client()
+            return self.campaign_service.handle_delete_error(error, name)
+
+    async def snapshot_task(
+        self, task_name: str, queue_name: Union[None, str] = None
+    ) -> Optional[tasks_v2.Task]:
+        """Gets a task like `CampaignService.snapshot_task`, with the async client."""
+        from google.cloud import tasks_v2
+        from google.api_core.exceptions import NotFound
+
+        try:
+            with span("cloud_tasks.snapshot_task"):
+                return await self.campaign_service.guards["cloud_tasks"].call_async(
+                    self.client.get_task,
+                    request={
+                        "name": f"{self.queue_path(queue_name)}/tasks/{task_name}",
+                        "response_view": tasks_v2.Task.View.FULL,
+                    },
+                    retry=False,
+                )
+        except NotFound:
+            return None
+
+    @staticmethod
+    async def map_tasks(func: AsyncAction, calls: List[Dict]) -> List[Any]:
+        """
+        Awaits a Cloud Tasks method once per keyword arguments, concurrently.
+        Args:
+            func: The coroutine method to call.
+            calls: The keyword arguments of every call.
+        Returns:
+            The results in the order of the calls.
+        Raises:
+            Exception: The first error, once every call has finished.
+        """
+        results = await asyncio.gather(
+            *(func(**kwargs) for kwargs in calls), return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return results
+
+    async def create_campaign_tasks(
+        self, payload: Dict, campaign_id: str, task_ref: Optional[TaskRef] = None
+    ) -> None:
+        """Creates the tasks of an instant campaign, one per audience chunk."""
+        calls = self.campaign_service.task_calls(payload, campaign_id, task_ref)
+        await self.map_tasks(self.create_task, calls)
+
+    async def delete_campaign_tasks(
+        self, campaign_id: str, task_ref: Optional[TaskRef]
+    ) -> bool:
+        """Deletes every task of an instant campaign, returns True if any was deleted."""
+        calls = self.campaign_service.task_name_calls(campaign_id, task_ref)
+        return any(await self.map_tasks(self.delete_task, calls))
+
+    async def delete_run_tasks(self, campaign_id: str, task_ref: TaskRef) -> None:
+        """Deletes the scheduled run tasks of a recurring campaign concurrently."""
+        calls = [
+            {"task_name": task_name}
+            for task_name in task_ref.run_task_names(campaign_id)
+        ]
+        await self.map_tasks(self.delete_task, calls)
+        logger.info("Deleted %s run tasks of campaign %s", len(calls), campaign_id)
+
+    async def replace_campaign_tasks(self, supabase: AsyncSupabase, plan: EditPlan):
+        """
+        Replaces the task family of an instant campaign like
+        `CampaignService.replace_campaign_tasks`.
+        Args:
+            supabase: The async Supabase instance.
+            plan: The edit plan.
+        Returns:
+            The updated campaign.
+        """
+        service = self.campaign_service
+        calls = service.task_name_calls(plan.campaign_id, plan.previous_ref)
+        created = any(await self.map_tasks(self.snapshot_task, calls))
+        if created:
+            await self.create_campaign_tasks(
+                plan.campaign, plan.campaign_id, plan.task_ref
+            )
+        else:
+            logger.info("Campaign %s has no pending task to replace", plan.campaign_id)
+        try:
+            updated_campaign = await supabase.update(
+                url=f"rest/v1/campaigns?id=eq.{plan.campaign_id}",
+                data=plan.ref_data(),
+            )
+        except Exception:
+            if created:
+                try:
+                    await self.delete_campaign_tasks(plan.campaign_id, plan.task_ref)
+                except Exception as error:
+                    logger.error(
+                        "Error deleting new tasks of campaign %s: %s",
+                        plan.campaign_id,
+                        error,
+                    )
+            raise
+        if created:
+            await self.delete_campaign_tasks(plan.campaign_id, plan.previous_ref)
+        return updated_campaign
+
+    @staticmethod
+    async def read_campaign(
+        supabase: AsyncSupabase, campaign_id: str
+    ) -> Optional[Dict]:
+        """Reads the stored row of a campaign, None if it does not exist."""
+        rows = await supabase.read(
+            url=f"rest/v1/campaigns?id=eq.{campaign_id}&select=*"
+        )
+        return rows[0] if rows else None
+
+    async def create_campaign(
+        self,
+        supabase: AsyncSupabase,
+        payload: Dict,
+        queue_name: Optional[str] = None,
+    ):
+        """
+        Creates a campaign like `CampaignService.create_campaign`.
+        Args:
+            supabase: The async Supabase instance.
+            payload: The payload from the request.
+            queue_name: An explicit queue for the tasks, sharded if None.
+        Returns:
+            The created campaign.
+        """
+        try:
+            plan = self.campaign_service.plan_create(payload, queue_name)
+            logger.info("Creating campaign %s", plan.campaign)
+            campaign_id = await supabase.rpc(url=plan.url, params=plan.params)
+            if plan.outbox:
+                logger.info("Created campaign %s with a task intent", campaign_id)
+                return campaign_id
+
+            logger.info("Created campaign %s", campaign_id)
+            if plan.creates_tasks:
+                payload["id"] = campaign_id
+                await self.create_campaign_tasks(
+                    payload, f"{campaign_id}", plan.task_ref
+                )
+            return campaign_id
+        except Exception as error:
+            logger.error("Error creating campaign: %s", error)
+            raise
+
+    async def edit_campaign(self, supabase: AsyncSupabase, payload: Dict):
+        """
+        Edits a campaign like `CampaignService.edit_campaign`.
+        Args:
+            supabase: The async Supabase instance.
+            payload: The payload from the request.
+        """
+        service = self.campaign_service
+        try:
+            campaign_id = payload["id"]
+            plan = service.plan_edit(
+                await self.read_campaign(supabase, campaign_id), payload
+            )
+            if service.task_outbox and plan.action in ("edit", "delete"):
+                return await supabase.rpc(
+                    url="rest/v1/rpc/update_campaign_with_task",
+                    params=service.outbox_edit_params(plan),
+                )
+            if plan.action == "edit":
+                updated_campaign = await self.replace_campaign_tasks(supabase, plan)
+            else:
+                updated_campaign = await supabase.update(
+                    url=f"rest/v1/campaigns?id=eq.{campaign_id}",
+                    data=plan.data,
+                )
+                if plan.action == "delete":
+                    await self.delete_campaign_tasks(
+                        plan.campaign_id, plan.previous_ref
+                    )
+                else:
+                    logger.info("Task of campaign %s is unchanged", campaign_id)
+            if plan.action != "none" and plan.previous_ref and plan.previous_ref.runs:
+                await self.delete_run_tasks(plan.campaign_id, plan.previous_ref)
+            return updated_campaign
+        except Exception as error:
+            logger.error("Error editing campaign: %s", error)
+            raise
+
+    async def delete_campaign(self, supabase: AsyncSupabase, payload: Dict):
+        """
+        Deletes a campaign like `CampaignService.delete_campaign`.
+        Args:
+            supabase: The async Supabase instance.
+            payload: The payload from the request.
+        """
+        service = self.campaign_service
+        try:
+            campaign_id = payload["id"]
+            if service.task_outbox:
+                return await supabase.rpc(
+                    url="rest/v1/rpc/delete_campaign_with_task",
+                    params={"_id": campaign_id, "_task_ref": None},
+                )
+            started = time.perf_counter()
+            row = await self.read_campaign(supabase, campaign_id)
+            timings = {"read": time.perf_counter() - started}
+            started = time.perf_counter()
+            deleted_campaign = await supabase.delete(
+                url=f"rest/v1/campaigns?id=eq.{campaign_id}",
+            )
+            timings["delete"] = time.perf_counter() - started
+            calls = (
+                [] if row is None else service.stored_task_calls(f"{campaign_id}", row)
+            )
+            if calls:
+                started = time.perf_counter()
+                try:
+                    await self.map_tasks(self.delete_task, calls)
+                except Exception as error:
+                    logger.warning(
+                        "Error deleting tasks of deleted campaign %s: %s",
+                        campaign_id,
+                        error,
+                    )
+                timings["cloud_tasks"] = time.perf_counter() - started
+            service.log_steps("Deleted", campaign_id, timings)
+            return deleted_campaign
+        except Exception as error:
+            logger.error("Error deleting campaign: %s", error)
+            raise
@@ -1,18 +1,122 @@
+from __future__ import annotations
+
+import time
+import uuid
 import logging
-import json
+import threading
 import datetime as dt
-from typing import Dict, List, Union
-from tenacity import retry
-from tenacity.stop import stop_after_attempt
-from tenacity.wait import wait_exponential
-from google.cloud import tasks_v2
-from google.api_core.exceptions import PermissionDenied
-from supacrud import Supabase, ResponseType
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
+from src.errors.verification_error import VerificationError
 from src.models.campaign import Campaign
+from src.utils.task_body import EncodedBody, encode_task_body
+from src.utils.resilience import (
+    CircuitBreaker,
+    DependencyGuard,
+    GuardedClient,
+    RetryBudget,
+    guarded,
+    is_closed_channel_error,
+    is_retryable_status_error,
+    is_retryable_transport_error,
+)
+from src.utils.queue_shards import QUEUE_SHARD_KEYS, parse_queue_names, shard_queue
+from src.utils.timing import propagate
+from src.models.task_ref import (
+    RECURRING_CAMPAIGN_TYPES,
+    TASK_CAMPAIGN_TYPES,
+    TaskRef,
+    task_fingerprint,
+)
+from src.services.schedule_service import run_family
+
+# The Google Cloud and Supabase clients are imported on first use to keep the
+# cold start of the function short.
+if TYPE_CHECKING:
+    from google.cloud import tasks_v2
+    from supacrud import Supabase, ResponseType
 
 logger = logging.getLogger(__name__)
 
+# Keep the Cloud Tasks gRPC channel alive between requests
+CHANNEL_OPTIONS = [
+    ("grpc.keepalive_time_ms", 30000),
+    ("grpc.keepalive_timeout_ms", 10000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+]
+
+
+@dataclass
+class LegResult:
+    """The outcome of one leg (Supabase or Cloud Tasks) of a campaign operation."""
+
+    value: Any = None
+    error: Optional[Exception] = None
+    seconds: float = 0.0
+
+
+@dataclass
+class EditPlan:
+    """What an edit writes to a campaign row and changes in Cloud Tasks.
+
+    `action` is one of "none", "edit", "delete" or "reschedule". `campaign` is
+    the stored row with the edited fields, the body of the new tasks, and
+    `data` the columns the edit updates. `task_ref` is the TaskRef of the new
+    tasks of an "edit", written with `ref_data` once they exist.
+    """
+
+    campaign_id: str
+    action: str
+    campaign: Dict[str, Any]
+    data: Dict[str, Any]
+    previous_ref: Optional[TaskRef]
+    task_ref: Optional[TaskRef]
+
+    def ref_data(self) -> Dict[str, Any]:
+        """Returns the updated columns with the new TaskRef."""
+        return {**self.data, "cloud_task_id": self.task_ref.to_str()}
+
+
+@dataclass
+class CreatePlan:
+    """The RPC call that creates a campaign row, and the tasks created after it.
+
+    In outbox mode `url` is `create_campaign_with_task`, which commits the
+    intent to create the tasks with the row, and `creates_tasks` is False.
+    """
+
+    campaign: Campaign
+    url: str
+    params: Dict[str, Any]
+    outbox: bool
+    creates_tasks: bool
+
+    @property
+    def task_ref(self) -> Optional[TaskRef]:
+        return TaskRef.parse(self.campaign.cloud_task_id)
+
+
+def run_leg(leg: Callable[[], Any]) -> LegResult:
+    started = time.perf_counter()
+    try:
+        return LegResult(value=leg(), seconds=time.perf_counter() - started)
+    except Exception as error:
+        return LegResult(error=error, seconds=time.perf_counter() - started)
+
 
 class CampaignService:
     def __init__(self, env_vars):
@@ -24,22 +128,257 @@ class CampaignService:
         self.service_account_email = env_vars.get("SERVICE_ACCOUNT")
         self.queue_name = env_vars.get("QUEUE_NAME")
         self.check_variables()
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._queue_paths: Dict[str, str] = {}
+        self.concurrent_legs = env_vars.get("CONCURRENT_LEGS") == "true"
+        self.max_workers = int(env_vars.get("CAMPAIGN_WORKERS") or 8)
+        self.batch_concurrency = int(env_vars.get("BATCH_CONCURRENCY") or 8)
+        self.bulk_chunk_size = int(env_vars.get("BULK_CHUNK_SIZE") or 100)
+        # 0 disables the fan-out of large audiences into several tasks
+        self.audience_chunk_size = int(env_vars.get("AUDIENCE_CHUNK_SIZE") or 0)
+        self.task_body_encoding = env_vars.get("TASK_BODY_ENCODING") or None
+        self.queue_names = parse_queue_names(env_vars.get("QUEUE_NAMES")) or [
+            self.queue_name
+        ]
+        self.allowed_queue_names = frozenset(
+            parse_queue_names(env_vars.get("ALLOWED_QUEUE_NAMES"))
+        )
+        self.queue_shard_key = env_vars.get("QUEUE_SHARD_KEY") or "campaign_id"
+        if self.queue_shard_key not in QUEUE_SHARD_KEYS:
+            raise ValueError(f"Invalid QUEUE_SHARD_KEY: {self.queue_shard_key}")
+        self.task_outbox = env_vars.get("TASK_OUTBOX") == "true"
+        self.guards = {
+            "cloud_tasks": self._create_guard(
+                "cloud_tasks", is_retryable_transport_error
+            ),
+            "supabase": self._create_guard("supabase", is_retryable_status_error),
+        }
+        self.task_body_threshold = int(
+            env_vars.get("TASK_BODY_COMPRESS_THRESHOLD") or 16384
+        )
+        self.schedule_horizon = dt.timedelta(
+            hours=float(env_vars.get("SCHEDULE_HORIZON_HOURS") or 168)
+        )
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    def _create_guard(
+        self, name: str, is_retryable: Callable[[BaseException], bool]
+    ) -> DependencyGuard:
+        return DependencyGuard(
+            name,
+            is_retryable=is_retryable,
+            budget=RetryBudget(
+                ratio=float(self.env_vars.get("RETRY_BUDGET_RATIO") or 0.2)
+            ),
+            breaker=CircuitBreaker(
+                failure_threshold=int(
+                    self.env_vars.get("BREAKER_FAILURE_THRESHOLD") or 5
+                ),
+                reset_timeout=float(self.env_vars.get("BREAKER_RESET_SECONDS") or 30),
+            ),
+        )
 
-    def action_dispatcher(self, action_type: str):
+    def guard_supabase(self, supabase: Supabase) -> Supabase:
+        """Wraps a Supabase client so that its calls go through the Supabase guard.
+        Reads, updates and deletes are retried, RPC calls are not."""
+        if isinstance(supabase, GuardedClient):
+            return supabase
+        return GuardedClient(
+            supabase,
+            self.guards["supabase"],
+            idempotent_methods=("read", "update", "delete"),
+        )
+
+    def resilience_metrics(self) -> List[Dict[str, Any]]:
+        """Returns the breaker state and retry counts of every dependency."""
+        return [guard.metrics() for guard in self.guards.values()]
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """A bounded thread pool shared by the requests of the instance."""
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix="campaign"
+                    )
+        return self._executor
+
+    def run_legs(
+        self, row_leg: Callable[[], Any], task_leg: Callable[[], Any]
+    ) -> Tuple[LegResult, LegResult]:
+        """Runs the Supabase and Cloud Tasks legs of an operation at the same time.
+        The task leg runs in the calling thread, so that it can fan out over
+        the shared pool without waiting on a pool thread itself.
+        """
+        row_future = self.executor.submit(propagate(run_leg), row_leg)
+        task = run_leg(task_leg)
+        return row_future.result(), task
+
+    def map_tasks(self, func: Callable[..., Any], calls: List[Dict]) -> List[Any]:
+        """
+        Calls a Cloud Tasks method once per keyword arguments, concurrently on
+        the shared pool if there is more than one call.
+        Args:
+            func: The method to call.
+            calls: The keyword arguments of every call.
+        Returns:
+            The results in the order of the calls.
+        Raises:
+            Exception: The first error, once every call has finished.
+        """
+        if len(calls) == 1:
+            return [func(**calls[0])]
+        futures = [self.executor.submit(propagate(func), **kwargs) for kwargs in calls]
+        results, errors = [], []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as error:
+                errors.append(error)
+        if errors:
+            raise errors[0]
+        return results
+
+    @staticmethod
+    def log_steps(action: str, campaign_id: str, timings: Dict[str, float]):
+        """Logs how long each step of a campaign operation took, in seconds."""
+        logger.info(
+            "%s campaign %s: %s",
+            action,
+            campaign_id,
+            ", ".join(
+                f"{step} {seconds * 1000:.1f} ms" for step, seconds in timings.items()
+            ),
+            extra={
+                "leg_timings_ms": {
+                    step: round(seconds * 1000, 3) for step, seconds in timings.items()
+                }
+            },
+        )
+
+    @staticmethod
+    def log_legs(action: str, campaign_id: str, row: LegResult, task: LegResult):
+        CampaignService.log_steps(
+            action, campaign_id, {"supabase": row.seconds, "cloud_tasks": task.seconds}
+        )
+
+    @property
+    def client(self) -> tasks_v2.CloudTasksClient:
+        """The Cloud Tasks client, created on first use and shared between calls."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._create_client()
+        return self._client
+
+    @staticmethod
+    def _create_client() -> tasks_v2.CloudTasksClient:
+        """Create a Cloud Tasks client on a gRPC channel with keepalive enabled."""
+        from google.cloud import tasks_v2
+
+        transport_class = tasks_v2.CloudTasksClient.get_transport_class("grpc")
+        channel = transport_class.create_channel(options=CHANNEL_OPTIONS)
+        return tasks_v2.CloudTasksClient(transport=transport_class(channel=channel))
+
+    def reset_client(self) -> None:
+        """Close the current client so the next call creates a new channel."""
+        with self._client_lock:
+            client, self._client = self._client, None
+        if client is not None:
+            try:
+                client.transport.close()
+            except Exception as error:
+                logger.warning("Error closing Cloud Tasks channel: %s", error)
+
+    @staticmethod
+    def _is_channel_broken(error: Exception) -> bool:
+        return is_closed_channel_error(error)
+
+    def queue_path(self, queue_name: str) -> str:
+        """Returns the fully qualified queue path, computed once per queue."""
+        path = self._queue_paths.get(queue_name)
+        if path is None:
+            path = self.client.queue_path(self.project, self.location, queue_name)
+            self._queue_paths[queue_name] = path
+        return path
+
+    def allowed_queue(self, queue_name: Optional[str]) -> Optional[str]:
+        """Returns the requested queue if it is allowed, otherwise None."""
+        if queue_name in self.allowed_queue_names:
+            return queue_name
+        if queue_name is not None:
+            logger.debug("Queue %s is not allowed, tasks are sharded", queue_name)
+        return None
+
+    def task_queue(self, task_ref: Optional[TaskRef]) -> str:
+        """
+        Returns the queue of the tasks of an instant campaign.
+        The queue is stored in the TaskRef when the tasks are created, so that
+        changing QUEUE_NAMES does not move the tasks of existing campaigns.
+        Campaigns without a stored queue predate the sharding and use QUEUE_NAME.
+        Args:
+            task_ref: The stored TaskRef.
+        Returns:
+            The queue name.
+        """
+        if task_ref is not None and task_ref.queue:
+            return task_ref.queue
+        return self.queue_name
+
+    def shard_queue(self, payload: Dict) -> str:
+        """
+        Picks the queue of the tasks of a new instant campaign.
+        The campaign id is only known once the campaign is created, so the
+        campaigns sharded on it are spread by a random key instead, which
+        balances the queues the same way.
+        Args:
+            payload: The campaign payload, to shard on its company id.
+        Returns:
+            The queue name.
+        """
+        key = None
+        if self.queue_shard_key == "company_id":
+            key = payload.get("company_id")
+        return shard_queue(f"{key or uuid.uuid4()}", self.queue_names)
+
+    def action_dispatcher(self, action_type: str, queue_name: Optional[str] = None):
         """
         Selects the action to be performed based on the action type.
+        The Supabase client passed to the action is guarded.
         Args:
             action_type: The action type.
+            queue_name: The queue requested for new tasks, used if it is allowed.
 
         Returns:
             The function to be called.
         """
+        action = self._select_action(action_type, self.allowed_queue(queue_name))
+
+        def guarded_action(supabase: Supabase, payload: Dict):
+            return action(supabase=self.guard_supabase(supabase), payload=payload)
+
+        return guarded_action
+
+    def _select_action(self, action_type: str, queue_name: Optional[str]):
         if action_type == "create_campaign":
-            return self.create_campaign
+            return partial(self.create_campaign, queue_name=queue_name)
         elif action_type == "edit_campaign":
             return self.edit_campaign
         elif action_type == "delete_campaign":
             return self.delete_campaign
+        elif action_type == "create_campaigns":
+            return partial(self.create_campaigns, queue_name=queue_name)
+        elif action_type == "batch":
+            return partial(self.execute_batch, queue_name=queue_name)
+        elif action_type == "schedule_recurring_campaigns":
+            return self.schedule_recurring_campaigns
+        elif action_type == "drain_task_outbox":
+            return self.drain_task_outbox
+        elif action_type == "reconcile_tasks":
+            return self.reconcile_tasks
         else:
             raise ValueError(f"Invalid action type: {action_type}")
 
@@ -65,7 +404,7 @@ class CampaignService:
                 f"Undefined environment variables: {', '.join(undefined_variables)}"
             )
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, max=3))
+    @guarded("cloud_tasks")
     def create_task(self, payload: dict, task_name: str, schedule_time: Union[dt.datetime, None] = None, queue_name: Union[None, str] = None) -> tasks_v2.types.task.Task:  # type: ignore
         """Create a task for a given queue with an arbitrary payload and schedule time.
         Args:
@@ -77,33 +416,15 @@ class CampaignService:
             The created task.
         """
         try:
-            queue_name = queue_name or self.queue_name
-
-            client = tasks_v2.CloudTasksClient()
-            parent = client.queue_path(self.project, self.location, queue_name)
-            task = {
-                "http_request": {
-                    "http_method": tasks_v2.HttpMethod.POST,
-                    "url": self.url,
-                    "oidc_token": {
-                        "service_account_email": self.service_account_email,
-                        "audience": self.audience,
-                    },
-                },
-                "name": f"projects/{self.project}/locations/{self.location}/queues/{queue_name}/tasks/{task_name}",
-            }
-            if schedule_time:
-                task["schedule_time"] = schedule_time # .strftime("%Y-%m-%dT%H:%M:%S.%fZ")  # type: ignore
-
-            payload_str = json.dumps(payload)
-            converted_payload = payload_str.encode()
-            task["http_request"]["body"] = converted_payload
-
-            response = client.create_task(request={"parent": parent, "task": task})
-
-            logger.info("Created task %s", response.name)
+            request, encoded = self.build_task_request(
+                payload, task_name, schedule_time, queue_name
+            )
+            response = self.client.create_task(request=request)
+            self.log_created_task(response, encoded)
             return response
         except Exception as error:
+            if self._is_channel_broken(error):
+                self.reset_client()
             logger.error(
                 "Error creating task for queue '%s' with payload '%s' and schedule time '%s': %s",
                 queue_name,
@@ -113,23 +434,102 @@ class CampaignService:
             )
             raise
 
+    def build_task_request(
+        self,
+        payload: dict,
+        task_name: str,
+        schedule_time: Union[dt.datetime, None] = None,
+        queue_name: Union[None, str] = None,
+        queue_path: Optional[str] = None,
+    ) -> Tuple[Dict, EncodedBody]:
+        """
+        Builds the `create_task` request of a task, shared by the sync and async clients.
+        Args:
+            payload: The task HTTP request body.
+            task_name: The task name which will be used as a unique identifier for the task.
+            schedule_time: The time the task should be scheduled for.
+            queue_name: The queue name. If None, the default queue name from self.env_vars is used.
+            queue_path: The path of the queue, if it is not built by the sync client.
+        Returns:
+            The request and the encoded body.
+        """
+        from google.cloud import tasks_v2
+
+        parent = queue_path or self.queue_path(queue_name or self.queue_name)
+        task = {
+            "http_request": {
+                "http_method": tasks_v2.HttpMethod.POST,
+                "url": self.url,
+                "oidc_token": {
+                    "service_account_email": self.service_account_email,
+                    "audience": self.audience,
+                },
+            },
+            "name": f"{parent}/tasks/{task_name}",
+        }
+        if schedule_time:
+            task["schedule_time"] = schedule_time # .strftime("%Y-%m-%dT%H:%M:%S.%fZ")  # type: ignore
+
+        encoded = encode_task_body(
+            payload,
+            encoding=self.task_body_encoding,
+            threshold=self.task_body_threshold,
+        )
+        task["http_request"]["body"] = encoded.body
+        if self.task_body_encoding is not None:
+            task["http_request"]["headers"] = encoded.headers
+        return {"parent": parent, "task": task}, encoded
+
+    @staticmethod
+    def log_created_task(response: tasks_v2.Task, encoded: EncodedBody) -> None:
+        logger.info(
+            "Created task %s, body %s bytes (%.1fx, encoded in %.2f ms)",
+            response.name,
+            encoded.size,
+            encoded.ratio,
+            encoded.seconds * 1000,
+            extra={
+                "task_body": {
+                    "raw_bytes": encoded.raw_size,
+                    "bytes": encoded.size,
+                    "ratio": round(encoded.ratio, 2),
+                    "encode_ms": round(encoded.seconds * 1000, 3),
+                    "encoding": encoded.headers.get("Content-Encoding"),
+                }
+            },
+        )
+
     def edit_task(
         self,
         payload: dict,
         task_name: str,
         schedule_time: Union[dt.datetime, None] = None,
         queue_name: Union[None, str] = None,
+        new_task_name: Optional[str] = None,
     ):
         """
         Edits a task for a given queue.
         As tasks cannot be directly modified, this function deletes the existing task and creates a new one.
+        Cloud Tasks rejects the name of a recently deleted task, so if a new task name
+        is given the new task is created first under that name, then the existing one is deleted.
         Args:
             payload: The task HTTP request body.
             task_name: The task name which will be used as a unique identifier for the task.
             schedule_time: The time the task should be scheduled for.
             queue_name: The queue name. If None, the default queue name from self.env_vars is used.
+            new_task_name: The name of the new task, e.g. the next generation of `task_name`.
         """
         try:
+            if new_task_name is not None:
+                if self.snapshot_task(task_name=task_name, queue_name=queue_name):
+                    self.create_task(
+                        payload=payload,
+                        task_name=new_task_name,
+                        schedule_time=schedule_time,
+                        queue_name=queue_name,
+                    )
+                    self.delete_task(task_name=task_name, queue_name=queue_name)
+                return
             task_deletion = self.delete_task(task_name=task_name, queue_name=queue_name)
             if task_deletion:
                 self.create_task(
@@ -142,6 +542,7 @@ class CampaignService:
             logger.error("Error editing task: %s", error)
             raise
 
+    @guarded("cloud_tasks", retry=False)
     def delete_task(self, task_name: str, queue_name: Union[None, str] = None) -> bool:
         """
         Deletes a task from a given queue.
@@ -150,94 +551,801 @@ class CampaignService:
             queue_name: The queue name. If None, the default queue name from self.env_vars is used.
         """
         try:
-            client = tasks_v2.CloudTasksClient()
-            task_name = f"projects/{self.project}/locations/{self.location}/queues/{queue_name or self.queue_name}/tasks/{task_name}"
-            client.delete_task(name=task_name)
+            task_name = f"{self.queue_path(queue_name or self.queue_name)}/tasks/{task_name}"
+            self.client.delete_task(name=task_name)
             return True
         except Exception as error:
-            if isinstance(error, PermissionDenied):
-                logger.warning("Permission denied while deleting task: %s", error)
-                return False
-            elif "entity was not found." in str(error):
-                logger.error("Task not found: %s", task_name)
-                return False
-            else:
-                logger.error("Error deleting task: %s", error)
-                raise
+            if self._is_channel_broken(error):
+                self.reset_client()
+            return self.handle_delete_error(error, task_name)
+
+    @staticmethod
+    def handle_delete_error(error: Exception, task_name: str) -> bool:
+        """Returns False if a task could not be deleted because it is missing
+        or not accessible, re-raises any other error."""
+        from google.api_core.exceptions import PermissionDenied
+
+        if isinstance(error, PermissionDenied):
+            logger.warning("Permission denied while deleting task: %s", error)
+            return False
+        elif "entity was not found." in str(error):
+            logger.error("Task not found: %s", task_name)
+            return False
+        else:
+            logger.error("Error deleting task: %s", error)
+            raise error
+
+    @guarded("cloud_tasks", retry=False)
+    def snapshot_task(
+        self, task_name: str, queue_name: Union[None, str] = None
+    ) -> Optional[tasks_v2.Task]:
+        """
+        Gets a task with its full HTTP request, so it can be restored later.
+        Args:
+            task_name: The task name which is used as a unique identifier for the task.
+            queue_name: The queue name. If None, the default queue name from self.env_vars is used.
+        Returns:
+            The task, or None if it does not exist.
+        """
+        from google.cloud import tasks_v2
+        from google.api_core.exceptions import NotFound
+
+        try:
+            return self.client.get_task(
+                request={
+                    "name": f"{self.queue_path(queue_name or self.queue_name)}/tasks/{task_name}",
+                    "response_view": tasks_v2.Task.View.FULL,
+                }
+            )
+        except NotFound:
+            return None
+
+    def task_chunks(self, payload: Dict) -> int:
+        """Returns the number of tasks the audience of a campaign is split into."""
+        audience_size = len(payload.get("audience_ids") or [])
+        if not self.audience_chunk_size or audience_size <= self.audience_chunk_size:
+            return 1
+        return -(-audience_size // self.audience_chunk_size)
 
-    def create_campaign(self, supabase: Supabase, payload: Dict) -> ResponseType:
+    def task_ref(self, payload: Dict, queue_name: Optional[str] = None) -> TaskRef:
+        """
+        Returns the TaskRef of the tasks of an instant campaign payload.
+        The queue is always stored, see `task_queue`.
+        Args:
+            payload: The campaign payload.
+            queue_name: An explicit queue for the tasks, sharded if None.
+        Returns:
+            The TaskRef.
+        """
+        chunks = self.task_chunks(payload)
+        return TaskRef(
+            fingerprint=task_fingerprint(payload),
+            chunks=chunks if chunks > 1 else None,
+            queue=queue_name or self.shard_queue(payload),
+        )
+
+    def chunk_payloads(self, payload: Dict) -> List[Dict]:
+        """
+        Splits a campaign payload into one task body per audience chunk.
+        Every chunk keeps the other fields, and gets its `chunk` index and the
+        number of `chunks`.
+        Args:
+            payload: The campaign payload.
+        Returns:
+            The task bodies, the payload itself if it is not split.
+        """
+        chunks = self.task_chunks(payload)
+        if chunks == 1:
+            return [payload]
+        audience_ids = payload["audience_ids"]
+        size = self.audience_chunk_size
+        return [
+            {
+                **payload,
+                "audience_ids": audience_ids[n * size : (n + 1) * size],
+                "chunk": n,
+                "chunks": chunks,
+            }
+            for n in range(chunks)
+        ]
+
+    def task_calls(
+        self, payload: Dict, campaign_id: str, task_ref: Optional[TaskRef] = None
+    ) -> List[Dict]:
+        """Returns the `create_task` arguments of every task of a campaign."""
+        bodies = self.chunk_payloads(payload)
+        queue_name = self.task_queue(task_ref)
+        chunk_ref = TaskRef(
+            chunks=len(bodies) if len(bodies) > 1 else None,
+            generation=task_ref.generation if task_ref else None,
+        )
+        return [
+            {"payload": body, "task_name": task_name, "queue_name": queue_name}
+            for body, task_name in zip(bodies, chunk_ref.task_names(campaign_id))
+        ]
+
+    def create_campaign_tasks(
+        self, payload: Dict, campaign_id: str, task_ref: Optional[TaskRef] = None
+    ) -> None:
+        """
+        Creates the tasks of an instant campaign, one per audience chunk.
+        Args:
+            payload: The campaign payload.
+            campaign_id: The campaign id.
+            task_ref: The TaskRef stored on the campaign.
+        """
+        self.map_tasks(
+            self.create_task, self.task_calls(payload, campaign_id, task_ref)
+        )
+
+    def task_name_calls(
+        self, campaign_id: str, task_ref: Optional[TaskRef]
+    ) -> List[Dict]:
+        """Returns the `delete_task` and `snapshot_task` arguments of every
+        task of an instant campaign."""
+        queue_name = self.task_queue(task_ref)
+        return [
+            {"task_name": task_name, "queue_name": queue_name}
+            for task_name in (task_ref or TaskRef()).task_names(campaign_id)
+        ]
+
+    def delete_campaign_tasks(
+        self, campaign_id: str, task_ref: Optional[TaskRef]
+    ) -> bool:
+        """
+        Deletes every task of an instant campaign.
+        Args:
+            campaign_id: The campaign id.
+            task_ref: The stored TaskRef, None for a single task.
+        Returns:
+            True if any task was deleted.
+        """
+        calls = self.task_name_calls(campaign_id, task_ref)
+        return any(self.map_tasks(self.delete_task, calls))
+
+    def snapshot_campaign_tasks(
+        self, campaign_id: str, task_ref: Optional[TaskRef]
+    ) -> List[tasks_v2.Task]:
+        """Returns snapshots of the existing tasks of an instant campaign."""
+        snapshots = self.map_tasks(
+            self.snapshot_task, self.task_name_calls(campaign_id, task_ref)
+        )
+        return [snapshot for snapshot in snapshots if snapshot is not None]
+
+    def build_campaign(
+        self, payload: Dict, queue_name: Optional[str] = None
+    ) -> Campaign:
+        """
+        Builds the Campaign of a create payload, with the TaskRef of its tasks
+        if the campaign type has any.
+        Args:
+            payload: The payload from the request.
+            queue_name: An explicit queue for the tasks.
+        Returns:
+            The campaign.
+        Raises:
+            VerificationError: If the payload does not match the campaign fields.
+        """
+        campaign_data = Campaign.from_payload(payload)
+        if payload.get("type") in TASK_CAMPAIGN_TYPES:
+            campaign_data.cloud_task_id = self.task_ref(payload, queue_name).to_str()
+        return campaign_data
+
+    def create_campaign(
+        self, supabase: Supabase, payload: Dict, queue_name: Optional[str] = None
+    ) -> ResponseType:
         """
         Creates a campaign in the campaigns table.
         If the campaign type is recurring, only a campaign is created in the campaigns table.
-        If the campaign type is instant, a task is created in Cloud Tasks.
+        If the campaign type is instant, a task is created in Cloud Tasks,
+        or one task per audience chunk if the audience is large. In outbox
+        mode the intent to create the tasks is committed with the campaign
+        instead, and applied by `drain_task_outbox`.
         Args:
             supabase: The Supabase instance.
             payload: The payload from the request.
+            queue_name: An explicit queue for the tasks, sharded if None.
         Returns:
             The created campaign.
         """
         try:
-            campaign_data = Campaign(**payload)
-            logger.info("Creating campaign %s", campaign_data)
-            rpc_params = campaign_data.to_rpc_params()
-            campaign_id = supabase.rpc(
-                url="rest/v1/rpc/create_campaign",
-                params=rpc_params,
-            )
+            plan = self.plan_create(payload, queue_name)
+            logger.info("Creating campaign %s", plan.campaign)
+            campaign_id = supabase.rpc(url=plan.url, params=plan.params)
+            if plan.outbox:
+                logger.info("Created campaign %s with a task intent", campaign_id)
+                return campaign_id
 
             logger.info("Created campaign %s", campaign_id)
-            if payload["type"] == "instant":
+            if plan.creates_tasks:
                 payload["id"] = campaign_id
-                self.create_task(
-                    payload=payload,
-                    queue_name=self.queue_name,
-                    task_name=f"{campaign_id}",
-                )
+                self.create_campaign_tasks(payload, f"{campaign_id}", plan.task_ref)
             return campaign_id
         except Exception as error:
             logger.error("Error creating campaign: %s", error)
             raise
 
+    def plan_create(
+        self, payload: Dict, queue_name: Optional[str] = None
+    ) -> CreatePlan:
+        """
+        Plans the create of a campaign, shared by the sync and async services.
+        Args:
+            payload: The payload from the request.
+            queue_name: An explicit queue for the tasks, sharded if None.
+        Returns:
+            The create plan.
+        Raises:
+            VerificationError: If the payload does not match the campaign fields.
+        """
+        campaign_data = self.build_campaign(payload, queue_name)
+        has_tasks = payload["type"] in TASK_CAMPAIGN_TYPES
+        if self.task_outbox and has_tasks:
+            return CreatePlan(
+                campaign=campaign_data,
+                url="rest/v1/rpc/create_campaign_with_task",
+                params={"_campaign": campaign_data.to_row(), "_task": payload},
+                outbox=True,
+                creates_tasks=False,
+            )
+        return CreatePlan(
+            campaign=campaign_data,
+            url="rest/v1/rpc/create_campaign",
+            params=campaign_data.to_rpc_params(),
+            outbox=False,
+            creates_tasks=has_tasks,
+        )
+
+    def create_campaigns(
+        self, supabase: Supabase, payload: Dict, queue_name: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Creates many campaigns with one `create_campaigns` RPC call per chunk.
+        Every campaign is validated before anything is written. The RPC takes a
+        `_campaigns` array of `create_campaign` params and returns the ids in
+        the same order. Every chunk is its own transaction, a failed chunk is
+        reported and does not stop the others. Tasks of instant campaigns are
+        then created concurrently.
+        Args:
+            supabase: The Supabase instance.
+            payload: The payload from the request, with a `campaigns` list.
+            queue_name: An explicit queue for the tasks, sharded if None.
+        Returns:
+            The ids of the campaigns in the order of the payload, None for the
+            campaigns of a failed chunk, the failed chunks and the ids whose
+            task could not be created.
+        Raises:
+            VerificationError: If any campaign is invalid.
+        """
+        campaigns = payload.get("campaigns")
+        if not isinstance(campaigns, list) or not campaigns:
+            raise VerificationError("Missing campaigns in payload")
+        campaign_data = []
+        for index, campaign_payload in enumerate(campaigns):
+            try:
+                campaign_data.append(self.build_campaign(campaign_payload, queue_name))
+            except VerificationError as error:
+                raise VerificationError(f"Invalid campaign at index {index}: {error}")
+
+        campaign_ids: List[Optional[str]] = []
+        failed_chunks = []
+        for start in range(0, len(campaign_data), self.bulk_chunk_size):
+            chunk = campaign_data[start : start + self.bulk_chunk_size]
+            try:
+                chunk_ids = supabase.rpc(
+                    url="rest/v1/rpc/create_campaigns",
+                    params={"_campaigns": [c.to_rpc_params() for c in chunk]},
+                )
+                if len(chunk_ids) != len(chunk):
+                    raise ValueError(
+                        f"Expected {len(chunk)} campaign ids, got {len(chunk_ids)}"
+                    )
+            except Exception as error:
+                logger.error("Error creating campaigns from %s: %s", start, error)
+                last_error = error
+                failed_chunks.append(
+                    {
+                        "start": start,
+                        "count": len(chunk),
+                        "message": "Internal server error",
+                    }
+                )
+                campaign_ids.extend([None] * len(chunk))
+                continue
+            campaign_ids.extend(chunk_ids)
+        if not any(campaign_ids):
+            # Nothing was written, the request fails and can be retried as a whole
+            raise last_error
+        logger.info(
+            "Created %s campaigns, %s chunks failed",
+            sum(1 for campaign_id in campaign_ids if campaign_id),
+            len(failed_chunks),
+        )
+
+        futures = []
+        for campaign_id, campaign_payload, data in zip(
+            campaign_ids, campaigns, campaign_data
+        ):
+            if campaign_id and campaign_payload.get("type") == "instant":
+                campaign_payload["id"] = campaign_id
+                task_ref = TaskRef.parse(data.cloud_task_id)
+                task_calls = self.task_calls(
+                    campaign_payload, f"{campaign_id}", task_ref
+                )
+                for kwargs in task_calls:
+                    future = self.executor.submit(propagate(self.create_task), **kwargs)
+                    futures.append((campaign_id, future))
+        failed_task_ids = []
+        for campaign_id, future in futures:
+            try:
+                future.result()
+            except Exception as error:
+                logger.error(
+                    "Error creating task of campaign %s: %s", campaign_id, error
+                )
+                if campaign_id not in failed_task_ids:
+                    failed_task_ids.append(campaign_id)
+        return {
+            "ids": campaign_ids,
+            "failed_chunks": failed_chunks,
+            "failed_task_ids": failed_task_ids,
+        }
+
+    def plan_task_edit(
+        self, campaign: Dict, previous_ref: Optional[TaskRef]
+    ) -> Tuple[str, Optional[TaskRef]]:
+        """
+        Decides what an edit has to do in Cloud Tasks by comparing the
+        fingerprint stored in the campaign `cloud_task_id` with the fingerprint
+        of the edited campaign. The runs of a recurring campaign only change
+        with its schedule fields.
+        Args:
+            campaign: The stored campaign row with the edited fields.
+            previous_ref: The stored TaskRef.
+        Returns:
+            A tuple of the action, one of "none", "edit", "delete" or
+            "reschedule", and the TaskRef to store on the campaign. The tasks
+            of an edit get a new generation of task names.
+        """
+        campaign_type = campaign.get("type") or "instant"
+        if (
+            campaign_type in RECURRING_CAMPAIGN_TYPES
+            and previous_ref
+            and previous_ref.runs
+        ):
+            # Runs are re-created by the next schedule expansion
+            fingerprint, _, _ = run_family(campaign, previous_ref)
+            if previous_ref.fingerprint == fingerprint:
+                return "none", previous_ref
+            return "reschedule", None
+        if campaign_type not in TASK_CAMPAIGN_TYPES:
+            return ("delete" if previous_ref else "none"), None
+        # Tasks stay in their queue across edits
+        task_ref = self.task_ref(
+            campaign, self.task_queue(previous_ref) if previous_ref else None
+        )
+        if (
+            previous_ref is not None
+            and previous_ref.fingerprint == task_ref.fingerprint
+            and previous_ref.chunks == task_ref.chunks
+        ):
+            return "none", previous_ref
+        return "edit", replace(
+            task_ref, generation=(previous_ref or TaskRef()).next_generation()
+        )
+
+    def plan_edit(self, row: Optional[Dict], payload: Dict) -> EditPlan:
+        """
+        Plans an edit against the stored campaign row, shared by the sync and
+        async services. The `cloud_task_id` of the payload is ignored, the
+        previous TaskRef is always the stored one.
+        Args:
+            row: The stored campaign row, None if there is no such campaign.
+            payload: The payload from the request.
+        Returns:
+            The edit plan.
+        """
+        data = {k: v for k, v in payload.items() if k != "cloud_task_id"}
+        if row is None:
+            return EditPlan(f"{payload['id']}", "none", data, data, None, None)
+        previous_ref = TaskRef.parse(row.get("cloud_task_id"))
+        campaign = {
+            **{k: v for k, v in row.items() if k != "cloud_task_id"},
+            **data,
+        }
+        task_action, task_ref = self.plan_task_edit(campaign, previous_ref)
+        if task_action in ("delete", "reschedule"):
+            data["cloud_task_id"] = None
+        return EditPlan(
+            f"{payload['id']}", task_action, campaign, data, previous_ref, task_ref
+        )
+
+    @staticmethod
+    def read_campaign(supabase: Supabase, campaign_id: str) -> Optional[Dict]:
+        """Reads the stored row of a campaign, None if it does not exist."""
+        rows = supabase.read(url=f"rest/v1/campaigns?id=eq.{campaign_id}&select=*")
+        return rows[0] if rows else None
+
     def edit_campaign(self, supabase: Supabase, payload: Dict):
         """
         Edits a campaign in the campaigns table.
-        If the campaign type is instant, the associated task in Cloud Tasks is also updated.
+        The edit is planned against the stored row. If the campaign type is
+        instant and the scheduling-relevant fields changed, the associated
+        tasks in Cloud Tasks are also replaced, and the new TaskRef is only
+        written once the new tasks exist.
+        If concurrent legs are enabled, the row and the task are updated at the same time.
+        In outbox mode the task change is committed with the row as an intent.
         Args:
             supabase: The Supabase instance.
             payload: The payload from the request.
         """
         try:
             campaign_id = payload["id"]
-            updated_campaign = supabase.update(
-                url=f"rest/v1/campaigns?id=eq.{campaign_id}",
-                data=payload,
-            )
-            self.edit_task(
-                payload=payload,
-                task_name=f"{campaign_id}",
-                queue_name=self.queue_name,
-            )
+            plan = self.plan_edit(self.read_campaign(supabase, campaign_id), payload)
+            if self.task_outbox and plan.action in ("edit", "delete"):
+                return supabase.rpc(
+                    url="rest/v1/rpc/update_campaign_with_task",
+                    params=self.outbox_edit_params(plan),
+                )
+            if plan.action == "edit" and self.concurrent_legs:
+                updated_campaign = self._edit_campaign_concurrently(supabase, plan)
+            elif plan.action == "edit":
+                updated_campaign = self.replace_campaign_tasks(supabase, plan)
+            else:
+                updated_campaign = supabase.update(
+                    url=f"rest/v1/campaigns?id=eq.{campaign_id}",
+                    data=plan.data,
+                )
+                if plan.action == "delete":
+                    self.delete_campaign_tasks(plan.campaign_id, plan.previous_ref)
+                else:
+                    logger.info("Task of campaign %s is unchanged", campaign_id)
+            if plan.action != "none" and plan.previous_ref and plan.previous_ref.runs:
+                self.delete_run_tasks(plan.campaign_id, plan.previous_ref)
             return updated_campaign
         except Exception as error:
             logger.error("Error editing campaign: %s", error)
             raise
 
+    @staticmethod
+    def outbox_edit_params(plan: EditPlan) -> Dict[str, Any]:
+        """Returns the `update_campaign_with_task` parameters of an edit."""
+        is_edit = plan.action == "edit"
+        return {
+            "_id": plan.campaign_id,
+            "_campaign": plan.ref_data() if is_edit else plan.data,
+            "_action": "replace" if is_edit else "delete",
+            "_task": plan.campaign if is_edit else None,
+            "_previous_task_ref": (
+                plan.previous_ref.to_str() if plan.previous_ref else None
+            ),
+        }
+
+    def replace_campaign_tasks(self, supabase: Supabase, plan: EditPlan):
+        """
+        Replaces the task family of an instant campaign.
+        As tasks cannot be directly modified, the new generation of tasks is
+        created, only if any previous task still existed, then the row is
+        updated with the new TaskRef and the previous tasks are deleted. A
+        task of the campaign is scheduled at all times, and if the row update
+        fails the new tasks are deleted again.
+        Args:
+            supabase: The Supabase instance.
+            plan: The edit plan.
+        Returns:
+            The updated campaign.
+        """
+        created = self.create_next_generation(plan)
+        try:
+            updated_campaign = supabase.update(
+                url=f"rest/v1/campaigns?id=eq.{plan.campaign_id}",
+                data=plan.ref_data(),
+            )
+        except Exception:
+            if created:
+                self.discard_next_generation(plan)
+            raise
+        if created:
+            self.delete_campaign_tasks(plan.campaign_id, plan.previous_ref)
+        return updated_campaign
+
+    def create_next_generation(self, plan: EditPlan) -> bool:
+        """
+        Creates the tasks of the new TaskRef of an edit, if any task of the
+        previous generation still exists.
+        Args:
+            plan: The edit plan.
+        Returns:
+            True if the tasks were created.
+        """
+        if not self.snapshot_campaign_tasks(plan.campaign_id, plan.previous_ref):
+            logger.info("Campaign %s has no pending task to replace", plan.campaign_id)
+            return False
+        self.create_campaign_tasks(plan.campaign, plan.campaign_id, plan.task_ref)
+        return True
+
+    def discard_next_generation(self, plan: EditPlan) -> None:
+        """Deletes the new tasks of a failed edit, the previous ones are kept."""
+        try:
+            self.delete_campaign_tasks(plan.campaign_id, plan.task_ref)
+        except Exception as error:
+            logger.error(
+                "Error deleting new tasks of campaign %s: %s", plan.campaign_id, error
+            )
+
+    def delete_run_tasks(self, campaign_id: str, task_ref: TaskRef) -> None:
+        """
+        Deletes the scheduled run tasks of a recurring campaign concurrently.
+        Args:
+            campaign_id: The campaign id.
+            task_ref: The TaskRef of the campaign, with the range of scheduled runs.
+        """
+        calls = [
+            {"task_name": task_name}
+            for task_name in task_ref.run_task_names(campaign_id)
+        ]
+        self.map_tasks(self.delete_task, calls)
+        logger.info("Deleted %s run tasks of campaign %s", len(calls), campaign_id)
+
+    def schedule_recurring_campaigns(
+        self, supabase: Supabase, payload: Dict
+    ) -> Dict[str, Any]:
+        """
+        Creates the run tasks of recurring campaigns over the schedule horizon.
+        Args:
+            supabase: The Supabase instance.
+            payload: The payload from the request, with an optional list of
+                `campaigns` rows, `horizon_hours` and `page_size`. If no
+                campaigns are given, every recurring campaign is read from the
+                campaigns table, `page_size` rows at a time.
+        Returns:
+            The report of the schedule expansion.
+        """
+        from src.services.schedule_service import ScheduleService
+
+        horizon = self.schedule_horizon
+        if payload.get("horizon_hours"):
+            horizon = dt.timedelta(hours=float(payload["horizon_hours"]))
+        campaigns = payload.get("campaigns")
+        if campaigns is None:
+            campaigns = self.recurring_campaigns(
+                supabase, page_size=int(payload.get("page_size") or 1000)
+            )
+        schedule_service = ScheduleService(self, horizon=horizon)
+        return schedule_service.schedule_campaigns(supabase, campaigns)
+
+    @staticmethod
+    def recurring_campaigns(supabase: Supabase, page_size: int) -> Iterator[Dict]:
+        """
+        Streams the recurring campaign rows, paged by id so that a page is
+        only read once the previous one has been scheduled.
+        Args:
+            supabase: The Supabase instance.
+            page_size: The number of rows read per request.
+        Returns:
+            An iterator of the campaign rows, ordered by id.
+        """
+        last_id = None
+        while True:
+            after = f"&id=gt.{last_id}" if last_id is not None else ""
+            rows = supabase.read(
+                url=(
+                    f"rest/v1/campaigns?type=eq.recurring{after}"
+                    f"&order=id&limit={page_size}&select=*"
+                )
+            )
+            yield from rows
+            if len(rows) < page_size:
+                return
+            last_id = rows[-1]["id"]
+
+    def drain_task_outbox(self, supabase: Supabase, payload: Dict) -> Dict[str, Any]:
+        """
+        Creates and deletes the Cloud Tasks of the pending outbox intents.
+        Args:
+            supabase: The Supabase instance.
+            payload: The payload from the request, with an optional
+                `max_batches` limit.
+        Returns:
+            The report of the drain.
+        """
+        from src.services.outbox_service import OutboxDrainer
+
+        drainer = OutboxDrainer(
+            self,
+            batch_size=int(self.env_vars.get("OUTBOX_BATCH_SIZE") or 100),
+        )
+        return drainer.drain(supabase, max_batches=payload.get("max_batches"))
+
+    def reconcile_tasks(self, supabase: Supabase, payload: Dict) -> Dict[str, Any]:
+        """
+        Deletes the Cloud Tasks that no campaign refers to any more.
+        Args:
+            supabase: The Supabase instance.
+            payload: The payload from the request, with optional `queue_names`
+                to sweep, `page_size` and `dry_run`. Queues removed from
+                QUEUE_NAMES are only swept if listed in `queue_names`.
+        Returns:
+            The report of the sweep.
+        """
+        from src.services.reconcile_service import ReconcileService
+
+        reconcile_service = ReconcileService(
+            self, page_size=int(payload.get("page_size") or 1000)
+        )
+        return reconcile_service.reconcile(
+            supabase,
+            queue_names=payload.get("queue_names"),
+            dry_run=bool(payload.get("dry_run")),
+        )
+
+    def execute_batch(
+        self, supabase: Supabase, payload: Dict, queue_name: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Executes a batch of create, edit and delete actions.
+        The items are dispatched through `action_dispatcher` and run with at
+        most `batch_concurrency` items in flight. A failed item does not stop
+        the others.
+        Args:
+            supabase: The Supabase instance.
+            payload: The batch payload, with an `items` list of
+                `{"action_type": ..., "payload": ...}` dictionaries, with an
+                optional `queue_name` per item.
+            queue_name: The queue requested for the batch.
+        Returns:
+            The number of succeeded and failed items and the result of every
+            item, in the order of the request.
+        """
+
+        def execute_item(index: int, item: Dict) -> Dict[str, Any]:
+            action_type = item.get("action_type")
+            try:
+                if action_type == "batch":
+                    raise VerificationError("Nested batches are not supported")
+                try:
+                    action = self.action_dispatcher(
+                        action_type=action_type,
+                        queue_name=item.get("queue_name") or queue_name,
+                    )
+                except ValueError as error:
+                    raise VerificationError(str(error))
+                data = action(supabase=supabase, payload=item["payload"])
+                return {
+                    "index": index,
+                    "action_type": action_type,
+                    "status": "ok",
+                    "data": data,
+                }
+            except Exception as error:
+                logger.error("Error executing batch item %s: %s", index, error)
+                # Only input errors are reported, as the response of a request
+                return {
+                    "index": index,
+                    "action_type": action_type,
+                    "status": "error",
+                    "message": (
+                        error.message
+                        if isinstance(error, VerificationError)
+                        else "Internal server error"
+                    ),
+                }
+
+        items = payload["items"]
+        # The batch has its own pool, the items use the shared pool for their legs
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(self.batch_concurrency, len(items))),
+            thread_name_prefix="batch",
+        ) as executor:
+            futures = [
+                executor.submit(propagate(execute_item), index, item)
+                for index, item in enumerate(items)
+            ]
+            results = [future.result() for future in futures]
+        failed = sum(1 for result in results if result["status"] == "error")
+        logger.info("Executed batch of %s items, %s failed", len(items), failed)
+        return {
+            "succeeded": len(results) - failed,
+            "failed": failed,
+            "results": results,
+        }
+
+    def _edit_campaign_concurrently(self, supabase: Supabase, plan: EditPlan):
+        """
+        Updates the campaign row and creates the next generation of its tasks
+        at the same time. The new TaskRef is written once both succeeded, then
+        the previous tasks are deleted.
+        - If either leg or the TaskRef update fails, the new tasks are deleted
+          and the row keeps the previous TaskRef.
+        """
+        url = f"rest/v1/campaigns?id=eq.{plan.campaign_id}"
+        row, task = self.run_legs(
+            lambda: supabase.update(url=url, data=plan.data),
+            lambda: self.create_next_generation(plan),
+        )
+        timings = {"supabase": row.seconds, "cloud_tasks": task.seconds}
+        error = row.error or task.error
+        updated_campaign = row.value
+        if error is None:
+            # The TaskRef is written after both legs, an extra round trip
+            ref = run_leg(
+                lambda: supabase.update(
+                    url=url, data={"cloud_task_id": plan.task_ref.to_str()}
+                )
+            )
+            timings["taskref_update"] = ref.seconds
+            error, updated_campaign = ref.error, ref.value
+        self.log_steps("Edited", plan.campaign_id, timings)
+        if error is not None:
+            # A failed task leg may have created some of the new tasks
+            if task.value is not False:
+                self.discard_next_generation(plan)
+            raise error
+        if task.value:
+            self.delete_campaign_tasks(plan.campaign_id, plan.previous_ref)
+        return updated_campaign
+
+    def stored_task_calls(self, campaign_id: str, row: Dict) -> List[Dict]:
+        """
+        Returns the `delete_task` arguments of every task a stored campaign
+        row refers to, shared by the sync and async services.
+        Args:
+            campaign_id: The campaign id.
+            row: The stored campaign row, with its `type` and `cloud_task_id`.
+        Returns:
+            The calls of the instant campaign tasks and of the scheduled runs.
+        """
+        task_ref = TaskRef.parse(row.get("cloud_task_id"))
+        calls = []
+        if (row.get("type") or "instant") in TASK_CAMPAIGN_TYPES:
+            calls.extend(self.task_name_calls(campaign_id, task_ref))
+        if task_ref is not None and task_ref.runs:
+            calls.extend(
+                {"task_name": task_name}
+                for task_name in task_ref.run_task_names(campaign_id)
+            )
+        return calls
+
     def delete_campaign(self, supabase: Supabase, payload: Dict):
         """
         Deletes a campaign from the campaigns table.
-        If the campaign type is instant, the associated task in Cloud Tasks is also deleted.
+        The tasks of the campaign, found from the stored row, are deleted
+        once the row is deleted, concurrently if there are several. A task
+        whose delete fails is logged and left for `reconcile_tasks`.
+        In outbox mode the intent to delete the tasks is committed with the delete.
         Args:
             supabase: The Supabase instance.
             payload: The payload from the request.
         """
         try:
             campaign_id = payload["id"]
+            if self.task_outbox:
+                # The TaskRef is read from the deleted row
+                return supabase.rpc(
+                    url="rest/v1/rpc/delete_campaign_with_task",
+                    params={"_id": campaign_id, "_task_ref": None},
+                )
+            started = time.perf_counter()
+            row = self.read_campaign(supabase, campaign_id)
+            timings = {"read": time.perf_counter() - started}
+            started = time.perf_counter()
             deleted_campaign = supabase.delete(
                 url=f"rest/v1/campaigns?id=eq.{campaign_id}",
             )
-            self.delete_task(task_name=f"{campaign_id}", queue_name=self.queue_name)
-            print(deleted_campaign)
-            logger.info("Deleted campaign %s", campaign_id)
+            timings["delete"] = time.perf_counter() - started
+            calls = [] if row is None else self.stored_task_calls(f"{campaign_id}", row)
+            if calls:
+                started = time.perf_counter()
+                try:
+                    self.map_tasks(self.delete_task, calls)
+                except Exception as error:
+                    logger.warning(
+                        "Error deleting tasks of deleted campaign %s: %s",
+                        campaign_id,
+                        error,
+                    )
+                timings["cloud_tasks"] = time.perf_counter() - started
+            self.log_steps("Deleted", campaign_id, timings)
             return deleted_campaign
         except Exception as error:
             logger.error("Error deleting campaign: %s", error)
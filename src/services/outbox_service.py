@@ -0,0 +1,161 @@
+# Path: src/services/outbox_service.py
+from __future__ import annotations
+
+import logging
+import datetime as dt
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from src.models.task_ref import TaskRef
+
+if TYPE_CHECKING:
+    from supacrud import Supabase
+    from src.services.campaign_service import CampaignService
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_TABLE = "rest/v1/campaign_task_outbox"
+
+
+class OutboxDrainer:
+    """Applies the task intents recorded in the `campaign_task_outbox` table.
+
+    Intents are leased in batches with `claim_campaign_task_outbox`, so that
+    concurrent drainers do not process the same rows. The tasks of a batch
+    are created and deleted concurrently on the campaign service pool, then
+    the applied intents are marked done with one update. A failed intent is
+    released for the next drain, until it has been attempted `max_attempts`
+    times.
+    """
+
+    def __init__(
+        self,
+        campaign_service: CampaignService,
+        batch_size: int = 100,
+        lease_seconds: int = 60,
+        max_attempts: int = 5,
+    ):
+        self.campaign_service = campaign_service
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    def drain(
+        self, supabase: Supabase, max_batches: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Applies pending task intents until there are none left.
+        Args:
+            supabase: The Supabase instance.
+            max_batches: The maximum number of batches to claim, unlimited if None.
+        Returns:
+            The number of claimed, done, retried and failed intents.
+        """
+        report = {"claimed": 0, "done": 0, "retried": 0, "failed": 0}
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            rows = supabase.rpc(
+                url="rest/v1/rpc/claim_campaign_task_outbox",
+                params={
+                    "_limit": self.batch_size,
+                    "_lease_seconds": self.lease_seconds,
+                },
+            )
+            if not rows:
+                break
+            batches += 1
+            report["claimed"] += len(rows)
+            self._apply(supabase, rows, report)
+            if len(rows) < self.batch_size:
+                break
+        logger.info("Drained task outbox: %s", report)
+        return report
+
+    def _calls(self, row: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+        """Returns the Cloud Tasks calls of an intent."""
+        service = self.campaign_service
+        campaign_id = f"{row['campaign_id']}"
+        calls = []
+        if row["action"] in ("delete", "replace"):
+            previous_ref = TaskRef.parse(row.get("previous_task_ref"))
+            for kwargs in service.task_name_calls(campaign_id, previous_ref):
+                calls.append(("delete", kwargs))
+                if row["action"] == "replace":
+                    calls.append(("snapshot", kwargs))
+            if previous_ref is not None and previous_ref.runs:
+                for task_name in previous_ref.run_task_names(campaign_id):
+                    calls.append(("delete", {"task_name": task_name}))
+        if row["action"] in ("create", "replace"):
+            task_ref = TaskRef.parse(row.get("task_ref"))
+            for kwargs in service.task_calls(row["payload"], campaign_id, task_ref):
+                calls.append(("create", kwargs))
+        return calls
+
+    def _run(self, kind: str, kwargs: Dict[str, Any]) -> bool:
+        from google.api_core.exceptions import AlreadyExists
+
+        if kind == "snapshot":
+            return self.campaign_service.snapshot_task(**kwargs) is not None
+        if kind == "delete":
+            return self.campaign_service.delete_task(**kwargs)
+        try:
+            self.campaign_service.create_task(**kwargs)
+        except AlreadyExists:
+            # A previous drain created it before failing on another task
+            logger.info("Task %s already exists", kwargs["task_name"])
+        return True
+
+    def _apply(
+        self, supabase: Supabase, rows: List[Dict[str, Any]], report: Dict[str, Any]
+    ) -> None:
+        executor = self.campaign_service.executor
+        calls = {row["id"]: self._calls(row) for row in rows}
+        errors: Dict[int, Exception] = {}
+        existing = set()
+        # Like replace_campaign_tasks, a replace only creates the next
+        # generation if a previous task still exists, so an instant campaign
+        # that already ran is not run again. The new tasks are created before
+        # the previous ones are deleted.
+        skipped = {row["id"] for row in rows if row["action"] == "replace"}
+        for kind in ("snapshot", "create", "delete"):
+            futures = [
+                (row_id, executor.submit(self._run, kind, kwargs))
+                for row_id, row_calls in calls.items()
+                if row_id not in errors
+                and not (kind == "create" and row_id in skipped - existing)
+                for call_kind, kwargs in row_calls
+                if call_kind == kind
+            ]
+            for row_id, future in futures:
+                try:
+                    if future.result() and kind == "snapshot":
+                        existing.add(row_id)
+                except Exception as error:
+                    errors.setdefault(row_id, error)
+
+        done_ids = []
+        for row in rows:
+            error = errors.get(row["id"])
+            if error is None:
+                done_ids.append(row["id"])
+                continue
+            logger.error("Error applying task intent %s: %s", row["id"], error)
+            failed = row["attempts"] >= self.max_attempts
+            report["failed" if failed else "retried"] += 1
+            supabase.update(
+                url=f"{OUTBOX_TABLE}?id=eq.{row['id']}",
+                data={
+                    "status": "failed" if failed else "pending",
+                    "last_error": str(error),
+                    "lease_until": None,
+                },
+            )
+        if done_ids:
+            supabase.update(
+                url=f"{OUTBOX_TABLE}?id=in.({','.join(str(i) for i in done_ids)})",
+                data={
+                    "status": "done",
+                    "processed_at": dt.datetime.now(dt.timezone.utc).isoformat(),
+                    "lease_until": None,
+                },
+            )
+            report["done"] += len(done_ids)
@@ -0,0 +1,228 @@
+# Path: src/services/reconcile_service.py
+from __future__ import annotations
+
+import re
+import logging
+import datetime as dt
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Set
+
+from src.models.task_ref import TASK_CAMPAIGN_TYPES, TaskRef
+
+if TYPE_CHECKING:
+    from supacrud import Supabase
+    from src.services.campaign_service import CampaignService
+
+logger = logging.getLogger(__name__)
+
+# Every task name of a campaign starts with the campaign id, a UUID
+CAMPAIGN_ID_PATTERN = re.compile(
+    r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+)
+
+
+def task_campaign_id(task_name: str) -> Optional[str]:
+    """Returns the campaign id of a task name, None if it is not a campaign task."""
+    match = CAMPAIGN_ID_PATTERN.match(task_name.rsplit("/", 1)[-1])
+    return match.group(0) if match else None
+
+
+def is_expected_task(row: Dict[str, Any], task_name: str) -> bool:
+    """
+    Whether a task belongs to the current tasks of a campaign row.
+    Args:
+        row: The campaign row, with its `id`, `type` and `cloud_task_id`.
+        task_name: The short task name.
+    Returns:
+        True for the current generation of an instant campaign's tasks, and
+        the run tasks of a recurring campaign's current fingerprint.
+    """
+    campaign_id = f"{row['id']}"
+    task_ref = TaskRef.parse(row.get("cloud_task_id"))
+    if task_ref is not None and task_ref.runs:
+        return task_name.startswith(f"{campaign_id}-{task_ref.fingerprint}-r")
+    if (row.get("type") or "instant") not in TASK_CAMPAIGN_TYPES:
+        return False
+    return task_name in (task_ref or TaskRef()).task_names(campaign_id)
+
+
+class ReconcileService:
+    """Deletes the Cloud Tasks that no campaign refers to any more.
+
+    Tasks are left behind when a task delete fails after its campaign row was
+    deleted, or when the previous generation of an edited campaign could not
+    be deleted. The tasks of every queue are streamed one `list_tasks` page at
+    a time; the campaign rows of a page are read with one query per
+    `lookup_size` campaign ids, which keeps the `id=in.(...)` filter within
+    URL length limits, and the orphans are the page's tasks minus the
+    expected tasks of those rows. Only one page is held in memory, so the
+    sweep scales with the number of pages, not the number of tasks.
+
+    Only the given queues are swept, every campaign queue by default. Tasks
+    left in a queue that was removed from QUEUE_NAMES and ALLOWED_QUEUE_NAMES
+    are only found by passing that queue in `queue_names`.
+
+    Tasks younger than `grace_period` are skipped, as their campaign row may
+    not be committed yet, and so are the campaigns with pending outbox intents.
+    """
+
+    def __init__(
+        self,
+        campaign_service: CampaignService,
+        page_size: int = 1000,
+        grace_period: dt.timedelta = dt.timedelta(minutes=10),
+        lookup_size: int = 100,
+    ):
+        self.campaign_service = campaign_service
+        self.page_size = page_size
+        self.grace_period = grace_period
+        self.lookup_size = lookup_size
+
+    def task_pages(self, queue_name: str) -> Iterator[List[Any]]:
+        """Streams the tasks of a queue, one page at a time."""
+        service = self.campaign_service
+        pager = service.client.list_tasks(
+            request={
+                "parent": service.queue_path(queue_name),
+                "page_size": self.page_size,
+            }
+        )
+        for page in pager.pages:
+            yield list(page.tasks)
+
+    def reconcile(
+        self,
+        supabase: Supabase,
+        queue_names: Optional[Iterable[str]] = None,
+        dry_run: bool = False,
+        now: Optional[dt.datetime] = None,
+    ) -> Dict[str, Any]:
+        """
+        Finds and deletes the orphaned tasks of the campaign queues.
+        Args:
+            supabase: The Supabase instance.
+            queue_names: The queues to sweep, every campaign queue if None.
+                Queues removed from the configuration have to be listed.
+            dry_run: Only report the orphans, without deleting them.
+            now: The current time, defaults to now.
+        Returns:
+            A report of the scanned, skipped, orphaned, deleted and failed tasks.
+        """
+        now = now or dt.datetime.now(dt.timezone.utc)
+        if queue_names is None:
+            queue_names = sorted(
+                {*self.campaign_service.queue_names}
+                | self.campaign_service.allowed_queue_names
+            )
+        report: Dict[str, Any] = {
+            "queues": 0,
+            "pages": 0,
+            "scanned": 0,
+            "skipped": 0,
+            "orphaned": 0,
+            "deleted": 0,
+            "failed": 0,
+            "dry_run": dry_run,
+        }
+        for queue_name in queue_names:
+            report["queues"] += 1
+            for tasks in self.task_pages(queue_name):
+                report["pages"] += 1
+                report["scanned"] += len(tasks)
+                orphans = self.find_orphans(supabase, tasks, now, report)
+                report["orphaned"] += len(orphans)
+                if orphans and not dry_run:
+                    self.delete_orphans(queue_name, orphans, report)
+        logger.info("Reconciled campaign tasks: %s", report)
+        return report
+
+    def find_orphans(
+        self,
+        supabase: Supabase,
+        tasks: List[Any],
+        now: dt.datetime,
+        report: Dict[str, Any],
+    ) -> List[str]:
+        """
+        Returns the short names of the orphaned tasks of a page.
+        Args:
+            supabase: The Supabase instance.
+            tasks: The tasks of the page.
+            now: The current time.
+            report: The report, its skipped count is updated.
+        Returns:
+            The names of the tasks no campaign row expects.
+        """
+        candidates: Dict[str, str] = {}
+        for task in tasks:
+            task_name = task.name.rsplit("/", 1)[-1]
+            campaign_id = task_campaign_id(task_name)
+            if campaign_id is None or self._is_recent(task, now):
+                report["skipped"] += 1
+                continue
+            candidates[task_name] = campaign_id
+        if not candidates:
+            return []
+
+        campaign_ids = sorted(set(candidates.values()))
+        rows: Dict[str, Dict[str, Any]] = {}
+        busy: Set[str] = set()
+        for start in range(0, len(campaign_ids), self.lookup_size):
+            lookup_ids = campaign_ids[start : start + self.lookup_size]
+            id_filter = f"in.({','.join(lookup_ids)})"
+            for row in (
+                supabase.read(
+                    url=f"rest/v1/campaigns?id={id_filter}&select=id,type,cloud_task_id"
+                )
+                or []
+            ):
+                rows[f"{row['id']}"] = row
+            busy |= self._pending_campaign_ids(supabase, id_filter)
+        orphans = []
+        for task_name, campaign_id in candidates.items():
+            if campaign_id in busy:
+                report["skipped"] += 1
+                continue
+            row = rows.get(campaign_id)
+            if row is None or not is_expected_task(row, task_name):
+                orphans.append(task_name)
+        return orphans
+
+    def delete_orphans(
+        self, queue_name: str, task_names: List[str], report: Dict[str, Any]
+    ) -> None:
+        """Deletes the orphans of a page on the shared pool, which bounds the concurrency."""
+        service = self.campaign_service
+        futures = [
+            (
+                task_name,
+                service.executor.submit(
+                    service.delete_task, task_name=task_name, queue_name=queue_name
+                ),
+            )
+            for task_name in task_names
+        ]
+        for task_name, future in futures:
+            try:
+                if future.result():
+                    report["deleted"] += 1
+            except Exception as error:
+                logger.error("Error deleting orphaned task %s: %s", task_name, error)
+                report["failed"] += 1
+
+    def _is_recent(self, task: Any, now: dt.datetime) -> bool:
+        create_time = getattr(task, "create_time", None)
+        if not create_time:
+            return False
+        return now - create_time < self.grace_period
+
+    def _pending_campaign_ids(self, supabase: Supabase, id_filter: str) -> Set[str]:
+        """Returns the campaigns whose task intents have not been applied yet."""
+        if not self.campaign_service.task_outbox:
+            return set()
+        rows = supabase.read(
+            url=(
+                f"rest/v1/campaign_task_outbox?campaign_id={id_filter}"
+                "&status=eq.pending&select=campaign_id"
+            )
+        )
+        return {f"{row['campaign_id']}" for row in rows or []}
@@ -0,0 +1,236 @@
+# Path: src/services/schedule_service.py
+from __future__ import annotations
+
+import logging
+import datetime as dt
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
+
+from src.models.task_ref import TaskRef, run_fingerprint
+from src.utils.schedule import (
+    expand_runs,
+    first_run_after,
+    run_index,
+    schedule_anchor,
+)
+
+if TYPE_CHECKING:
+    from supacrud import Supabase
+    from src.services.campaign_service import CampaignService
+
+logger = logging.getLogger(__name__)
+
+
+def run_family(
+    campaign: Dict[str, Any], previous_ref: Optional[TaskRef]
+) -> Tuple[str, dt.datetime, int]:
+    """
+    Resolves the task family of the runs of a recurring campaign.
+    The anchor of the previous TaskRef is kept while the next run of the
+    campaign is one of its runs, so that the run indexes do not shift as
+    next_run_time advances.
+    Args:
+        campaign: The campaign row.
+        previous_ref: The stored TaskRef.
+    Returns:
+        A tuple of the fingerprint, the anchor and the index of the next run.
+    """
+    anchor = schedule_anchor(
+        campaign["next_run_time"], campaign.get("time_of_day")
+    ).replace(microsecond=0)
+    offset = 0
+    if previous_ref is not None and previous_ref.anchor is not None:
+        pinned = dt.datetime.fromtimestamp(previous_ref.anchor, dt.timezone.utc)
+        index = run_index(pinned, campaign.get("frequency"), anchor)
+        if index is not None:
+            anchor, offset = pinned, index
+    return run_fingerprint(campaign, int(anchor.timestamp())), anchor, offset
+
+
+@dataclass
+class RunPlan:
+    """The tasks to create and delete for one recurring campaign."""
+
+    campaign_id: str
+    task_ref: Optional[TaskRef]
+    runs: List[Tuple[int, dt.datetime]] = field(default_factory=list)
+    stale_task_names: List[str] = field(default_factory=list)
+    changed: bool = False
+
+
+class ScheduleService:
+    """Expands recurring campaigns into Cloud Tasks over a rolling horizon.
+
+    Every run of a campaign gets a task named `{campaign_id}-{fingerprint}-r{index}`
+    scheduled at its run time. The range of scheduled run indexes and their
+    anchor are stored in the TaskRef of the campaign, so running the expansion
+    again only creates the runs that entered the horizon since. Editing the
+    schedule fields of the campaign, or moving its next run off the anchored
+    runs, changes the fingerprint, which starts a new family of task names.
+    """
+
+    def __init__(
+        self,
+        campaign_service: CampaignService,
+        horizon: dt.timedelta = dt.timedelta(days=7),
+        batch_size: int = 100,
+    ):
+        self.campaign_service = campaign_service
+        self.horizon = horizon
+        self.batch_size = batch_size
+
+    def plan(self, campaign: Dict[str, Any], now: dt.datetime) -> RunPlan:
+        """
+        Plans the runs of a recurring campaign that are missing within the horizon.
+        Args:
+            campaign: The campaign row.
+            now: The current time.
+        Returns:
+            The run plan of the campaign.
+        """
+        campaign_id = campaign["id"]
+        frequency = campaign["frequency"]
+        previous_ref = TaskRef.parse(campaign.get("cloud_task_id"))
+        fingerprint, anchor, offset = run_family(campaign, previous_ref)
+        plan = RunPlan(campaign_id=campaign_id, task_ref=previous_ref)
+        pending_index = max(offset, first_run_after(anchor, frequency, now))
+
+        first_index = offset
+        scheduled_runs = None
+        if previous_ref is not None and previous_ref.runs:
+            if previous_ref.fingerprint == fingerprint:
+                first_index = max(offset, previous_ref.runs[1] + 1)
+                scheduled_runs = previous_ref.runs
+                # Pending runs before the next run were skipped by an edit
+                plan.stale_task_names = [
+                    previous_ref.run_task_name(campaign_id, index)
+                    for index in range(
+                        max(scheduled_runs[0], first_run_after(anchor, frequency, now)),
+                        min(offset, scheduled_runs[1] + 1),
+                    )
+                ]
+            else:
+                plan.stale_task_names = previous_ref.run_task_names(campaign_id)
+
+        plan.runs = expand_runs(
+            next_run_time=anchor,
+            frequency=frequency,
+            after=now,
+            until=now + self.horizon,
+            end_date=campaign.get("end_date"),
+            first_index=first_index,
+        )
+
+        last_index = plan.runs[-1][0] if plan.runs else None
+        if scheduled_runs is not None:
+            last_index = max(scheduled_runs[1], last_index or 0)
+        task_ref = TaskRef(fingerprint=fingerprint, anchor=int(anchor.timestamp()))
+        if last_index is not None:
+            # Runs in the past have been executed, they are dropped from the range
+            first = scheduled_runs[0] if scheduled_runs else plan.runs[0][0]
+            task_ref.runs = (min(max(first, pending_index), last_index), last_index)
+        plan.changed = task_ref != previous_ref
+        plan.task_ref = task_ref
+        return plan
+
+    def schedule_campaigns(
+        self,
+        supabase: Supabase,
+        campaigns: Iterable[Dict[str, Any]],
+        now: Optional[dt.datetime] = None,
+    ) -> Dict[str, Any]:
+        """
+        Creates the missing run tasks of recurring campaigns and stores their TaskRef.
+        Tasks are created in batches of `batch_size`, concurrently on the
+        campaign service pool. A campaign whose tasks could not all be created
+        keeps its previous TaskRef, so the next expansion retries it.
+        Args:
+            supabase: The Supabase instance.
+            campaigns: The recurring campaign rows.
+            now: The current time, defaults to now.
+        Returns:
+            A report of the created and deleted tasks and the failed campaigns.
+        """
+        now = now or dt.datetime.now(dt.timezone.utc)
+        report: Dict[str, Any] = {
+            "campaigns": 0,
+            "created": 0,
+            "deleted": 0,
+            "failed": [],
+        }
+        batch: List[Tuple[Dict[str, Any], RunPlan]] = []
+        batch_runs = 0
+        for campaign in campaigns:
+            report["campaigns"] += 1
+            try:
+                plan = self.plan(campaign, now)
+            except Exception as error:
+                logger.error(
+                    "Error planning campaign %s: %s", campaign.get("id"), error
+                )
+                report["failed"].append(campaign.get("id"))
+                continue
+            batch.append((campaign, plan))
+            batch_runs += len(plan.runs) + len(plan.stale_task_names)
+            if batch_runs >= self.batch_size:
+                self._execute(supabase, batch, report)
+                batch, batch_runs = [], 0
+        if batch:
+            self._execute(supabase, batch, report)
+        logger.info("Scheduled recurring campaigns: %s", report)
+        return report
+
+    def _create_run_task(self, **kwargs) -> None:
+        from google.api_core.exceptions import AlreadyExists
+
+        try:
+            self.campaign_service.create_task(**kwargs)
+        except AlreadyExists:
+            logger.info("Task %s already exists", kwargs["task_name"])
+
+    def _execute(
+        self,
+        supabase: Supabase,
+        batch: List[Tuple[Dict[str, Any], RunPlan]],
+        report: Dict[str, Any],
+    ) -> None:
+        executor = self.campaign_service.executor
+        futures = []
+        for campaign, plan in batch:
+            for index, run_time in plan.runs:
+                future = executor.submit(
+                    self._create_run_task,
+                    payload={
+                        **campaign,
+                        "run": index,
+                        "run_time": run_time.isoformat(),
+                    },
+                    task_name=plan.task_ref.run_task_name(plan.campaign_id, index),
+                    schedule_time=run_time,
+                )
+                futures.append(("created", plan, future))
+            for task_name in plan.stale_task_names:
+                future = executor.submit(
+                    self.campaign_service.delete_task, task_name=task_name
+                )
+                futures.append(("deleted", plan, future))
+
+        failed = set()
+        for kind, plan, future in futures:
+            try:
+                future.result()
+                report[kind] += 1
+            except Exception as error:
+                logger.error(
+                    "Error scheduling campaign %s: %s", plan.campaign_id, error
+                )
+                failed.add(plan.campaign_id)
+
+        for _, plan in batch:
+            if plan.campaign_id in failed:
+                report["failed"].append(plan.campaign_id)
+            elif plan.changed:
+                supabase.update(
+                    url=f"rest/v1/campaigns?id=eq.{plan.campaign_id}",
+                    data={"cloud_task_id": plan.task_ref.to_str()},
+                )
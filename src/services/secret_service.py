@@ -8,14 +8,15 @@ logger.setLevel(logging.DEBUG)
 
 
 def get_secret_payload(
-    project_id: str, secret_id: str, version_id: str
+    project_id: str, secret_id: str, version_id: str, client=None
 ) -> Optional[str]:
     """
     Access the payload for the given secret version if one exists. The version
     can be a version number as a string (e.g. "5") or an alias (e.g. "latest").
+    An existing SecretManagerServiceClient can be passed in to be reused.
     """
     try:
-        client = secretmanager.SecretManagerServiceClient()
+        client = client or secretmanager.SecretManagerServiceClient()
         secret_name = f"projects/{project_id}/secrets/{secret_id}/versions/{version_id}"
         response = client.access_secret_version(request={"name": secret_name})
         logger.debug("Secret request response successful.")
@@ -1,14 +1,50 @@
 # src/services/user_services.py
 # src/user_service.py
 import jwt
+import asyncio
+import logging
 import requests
 import datetime
+from typing import TYPE_CHECKING, Any, List, Optional, Tuple
+
+from src.utils.http_session import create_session, pool_stats
+from src.utils.jwt_verifier import JWTVerifier
+from src.utils.timing import span
+from src.utils.verified_user_cache import VerifiedUserCache
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
 
 
 class AdminUserService:
-    def __init__(self, base_url: str, anon_key: str, service_key: str):
+    def __init__(
+        self,
+        base_url: str,
+        anon_key: str,
+        service_key: str,
+        cache_ttl: float = 300,
+        cache_maxsize: int = 1024,
+        jwt_verifier: Optional[JWTVerifier] = None,
+        remote_fallback: bool = True,
+        session: Optional[requests.Session] = None,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 5,
+    ):
         self.base_url = base_url
         self.anon_key = anon_key
+        self.set_service_key(service_key)
+        self.verified_user_cache = VerifiedUserCache(
+            ttl=cache_ttl, maxsize=cache_maxsize
+        )
+        self.jwt_verifier = jwt_verifier
+        self.remote_fallback = remote_fallback
+        self.session = session or create_session()
+        self.timeout = (connect_timeout, read_timeout)
+
+    def set_service_key(self, service_key: str) -> None:
+        """Set the service key used to call the admin API, e.g. after a rotation."""
         self.service_key = service_key
         self.headers = {
             "apikey": self.anon_key,
@@ -18,40 +54,44 @@ class AdminUserService:
 
     def get_user_by_email(self, email: str):
         """Get a user by their email"""
-        response = requests.get(
+        response = self.session.get(
             f"{self.base_url}/auth/v1/admin/users?email={email}",
             headers=self.headers,
-            timeout=5,
+            timeout=self.timeout,
         )
         return response
 
     def get_user_by_id(self, user_id: str):
         """Get a user by their user_id"""
-        response = requests.get(
+        response = self.session.get(
             f"{self.base_url}/auth/v1/admin/users/{user_id}",
             headers=self.headers,
-            timeout=5,
+            timeout=self.timeout,
         )
         return response
 
     def generate_link(self):
         """Generate a link to invite a user to your project."""
-        response = requests.post(
+        response = self.session.post(
             f"{self.base_url}/auth/v1/admin/generate_link",
             headers=self.headers,
-            timeout=5,
+            timeout=self.timeout,
         )
         return response
 
     def delete_user(self, user_id: str):
         """Delete a user by their user_id"""
-        response = requests.delete(
+        response = self.session.delete(
             f"{self.base_url}/auth/v1/admin/users/{user_id}",
             headers=self.headers,
-            timeout=5,
+            timeout=self.timeout,
         )
         return response
 
+    def pool_stats(self) -> List[dict]:
+        """Returns the utilisation of the connection pools of the HTTP session."""
+        return pool_stats(self.session)
+
     @staticmethod
     def is_jwt_valid(jwt_token: str) -> dict:
         """Checks if the JWT token is currently valid.
@@ -77,21 +117,118 @@ class AdminUserService:
         else:
             return {"error": "Expired JWT"}
 
+    def verify_user_locally(self, jwt_token: str) -> Optional[dict]:
+        """Verifies a user from the signed claims of the JWT, without any I/O
+        once the signing keys are cached.
+
+        Returns:
+            Optional[dict]:
+                The user metadata if the user is a super admin, a dictionary
+                with the error message if the user is rejected, or None if the
+                decision has to be made by the remote lookup.
+        """
+        try:
+            claims = self.jwt_verifier.verify(jwt_token)
+        except jwt.ExpiredSignatureError:
+            return {"error": "Expired JWT"}
+        except jwt.PyJWKClientConnectionError as error:
+            if self.remote_fallback:
+                logger.warning("Unable to fetch JWKS, using remote lookup: %s", error)
+                return None
+            return {"error": "Unable to verify JWT"}
+        except (jwt.InvalidTokenError, jwt.PyJWKClientError, jwt.PyJWKError):
+            return {"error": "Invalid JWT"}
+
+        user_metadata = claims.get("app_metadata") or {}
+        if user_metadata.get("role") is None:
+            if self.remote_fallback:
+                return None
+            return {"error": "User does not have app metadata"}
+        if user_metadata.get("role") != "super_admin":
+            return {"error": "User is not a super admin"}
+        return user_metadata
+
     def verify_user(self, jwt_token: str) -> dict:
         """Verifies a user based on the user `id` and JWT token.
+        If a JWT verifier is configured the signature is checked locally and the
+        role is read from the verified claims. The remote admin users lookup is
+        used when no verifier is configured, or as a fallback if enabled.
+        Verified super admins are cached by user id until the cache TTL
+        or the token expiration, whichever comes first.
+
+        Returns:
+            dict:
+                A dictionary with the user metadata if the user is a super admin.
+        """
+        verification, jwt_valid = self.verify_user_without_lookup(jwt_token)
+        if verification is not None:
+            return verification
+
+        with span("gotrue.get_user"):
+            response = self.get_user_by_id(jwt_valid["sub"])
+        return self.verify_user_response(jwt_valid, response)
+
+    async def verify_user_async(
+        self, jwt_token: str, client: "httpx.AsyncClient"
+    ) -> dict:
+        """Verifies a user like `verify_user`, with the remote admin users
+        lookup made on an async HTTP client. The local verification runs in a
+        worker thread, as fetching the JWT secret or the JWKS blocks.
 
         Returns:
             dict:
                 A dictionary with the user metadata if the user is a super admin.
         """
+        verification, jwt_valid = await asyncio.to_thread(
+            self.verify_user_without_lookup, jwt_token
+        )
+        if verification is not None:
+            return verification
+
+        with span("gotrue.get_user"):
+            response = await client.get(
+                f"{self.base_url}/auth/v1/admin/users/{jwt_valid['sub']}",
+                headers=self.headers,
+            )
+        return self.verify_user_response(jwt_valid, response)
+
+    def verify_user_without_lookup(
+        self, jwt_token: str
+    ) -> Tuple[Optional[dict], Optional[dict]]:
+        """Verifies a user from the JWT and the cache of verified users.
+
+        Returns:
+            Tuple[Optional[dict], Optional[dict]]:
+                The verification if it is decided without a remote lookup,
+                otherwise None and the decoded JWT.
+        """
+        if self.jwt_verifier is not None:
+            local_verification = self.verify_user_locally(jwt_token)
+            if local_verification is not None:
+                return local_verification, None
+
         jwt_valid = self.is_jwt_valid(jwt_token)
         if "error" in jwt_valid:
-            return jwt_valid
+            return jwt_valid, None
 
         user_id = jwt_valid.get("sub")
         if user_id is None:
-            return {"error": "No user id in JWT"}
-        response = self.get_user_by_id(user_id)
+            return {"error": "No user id in JWT"}, None
+
+        cached_metadata = self.verified_user_cache.get(user_id)
+        if cached_metadata is not None:
+            return cached_metadata, None
+        return None, jwt_valid
+
+    def verify_user_response(self, jwt_valid: dict, response: Any) -> dict:
+        """Verifies a user from the response of the admin users lookup, a
+        `requests` or `httpx` response.
+
+        Returns:
+            dict:
+                A dictionary with the user metadata if the user is a super admin.
+        """
+        user_id = jwt_valid["sub"]
         if response.status_code != 200:
             return {"error": "User id does not exis."}
 
@@ -102,6 +239,8 @@ class AdminUserService:
         user_metadata = user.get("app_metadata")
         if user_metadata.get("role") != "super_admin":
             return {"error": "User is not a super admin"}
+
+        self.verified_user_cache.set(user_id, user_metadata, jwt_valid["exp"])
         return user_metadata
 
 
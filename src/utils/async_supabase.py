@@ -0,0 +1,82 @@
+# Path: src/utils/async_supabase.py
+import json
+import logging
+from typing import Any, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+def create_async_http_client(
+    max_connections: int = 100,
+    max_keepalive_connections: int = 20,
+    connect_timeout: float = 3.05,
+    read_timeout: float = 5,
+) -> httpx.AsyncClient:
+    """Create a keep-alive async HTTP client shared by the requests of an
+    event loop.
+    Args:
+        max_connections: The maximum number of open connections.
+        max_keepalive_connections: The maximum number of idle connections kept alive.
+        connect_timeout: The connect timeout in seconds.
+        read_timeout: The read timeout in seconds.
+    Returns:
+        The client, to be closed with `aclose` when the loop stops.
+    """
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        ),
+        timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+    )
+
+
+class AsyncSupabase:
+    """An asyncio client for the Supabase REST API, with the interface of
+    `supacrud.Supabase` where every method is a coroutine.
+
+    Urls are relative to `base_url`, e.g. `rest/v1/campaigns?id=eq.1`.
+    Non-2xx responses raise `httpx.HTTPStatusError`.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        anon_key: str,
+        service_role_key: str,
+        client: httpx.AsyncClient,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.client = client
+        self.headers = {
+            "apikey": anon_key,
+            "Authorization": f"Bearer {service_role_key}",
+            "Content-Type": "application/json",
+            "Prefer": "return=representation",
+        }
+
+    async def _request(self, method: str, url: str, data: Optional[Any] = None) -> Any:
+        # Dates of the campaign fields are sent as ISO 8601 strings
+        content = None if data is None else json.dumps(data, default=str)
+        response = await self.client.request(
+            method, f"{self.base_url}/{url}", headers=self.headers, content=content
+        )
+        response.raise_for_status()
+        return response.json() if response.content else None
+
+    async def create(self, url: str, data: Dict) -> Any:
+        return await self._request("POST", url, data)
+
+    async def read(self, url: str) -> Any:
+        return await self._request("GET", url)
+
+    async def update(self, url: str, data: Dict) -> Any:
+        return await self._request("PATCH", url, data)
+
+    async def delete(self, url: str) -> Any:
+        return await self._request("DELETE", url)
+
+    async def rpc(self, url: str, params: Dict) -> Any:
+        return await self._request("POST", url, params)
@@ -30,6 +30,43 @@ def get_env_vars() -> dict:
             "VERSION_ID": os.environ.get("VERSION_ID"),
             "SUPABASE_URL": os.environ.get("SUPABASE_URL"),
             "SUPABASE_ANON_KEY": os.environ.get("SUPABASE_ANON_KEY"),
+            "VERIFIED_USER_CACHE_TTL": os.environ.get("VERIFIED_USER_CACHE_TTL"),
+            "VERIFIED_USER_CACHE_MAXSIZE": os.environ.get(
+                "VERIFIED_USER_CACHE_MAXSIZE"
+            ),
+            "SUPABASE_JWT_SECRET_ID": os.environ.get("SUPABASE_JWT_SECRET_ID"),
+            "SUPABASE_JWKS_URL": os.environ.get("SUPABASE_JWKS_URL"),
+            "JWT_REMOTE_FALLBACK": os.environ.get("JWT_REMOTE_FALLBACK"),
+            "HTTP_POOL_MAXSIZE": os.environ.get("HTTP_POOL_MAXSIZE"),
+            "WARM_UP_ON_START": os.environ.get("WARM_UP_ON_START"),
+            "SECRET_CACHE_TTL": os.environ.get("SECRET_CACHE_TTL"),
+            "IDEMPOTENCY_TTL": os.environ.get("IDEMPOTENCY_TTL"),
+            "SCHEDULER_SUBJECTS": os.environ.get("SCHEDULER_SUBJECTS"),
+            "CONCURRENT_LEGS": os.environ.get("CONCURRENT_LEGS"),
+            "CAMPAIGN_WORKERS": os.environ.get("CAMPAIGN_WORKERS"),
+            "BATCH_CONCURRENCY": os.environ.get("BATCH_CONCURRENCY"),
+            "BULK_CHUNK_SIZE": os.environ.get("BULK_CHUNK_SIZE"),
+            "AUDIENCE_CHUNK_SIZE": os.environ.get("AUDIENCE_CHUNK_SIZE"),
+            "QUEUE_NAMES": os.environ.get("QUEUE_NAMES"),
+            "ALLOWED_QUEUE_NAMES": os.environ.get("ALLOWED_QUEUE_NAMES"),
+            "QUEUE_SHARD_KEY": os.environ.get("QUEUE_SHARD_KEY"),
+            "RETRY_BUDGET_RATIO": os.environ.get("RETRY_BUDGET_RATIO"),
+            "BREAKER_FAILURE_THRESHOLD": os.environ.get("BREAKER_FAILURE_THRESHOLD"),
+            "BREAKER_RESET_SECONDS": os.environ.get("BREAKER_RESET_SECONDS"),
+            "TASK_BODY_ENCODING": os.environ.get("TASK_BODY_ENCODING"),
+            "TASK_BODY_COMPRESS_THRESHOLD": os.environ.get(
+                "TASK_BODY_COMPRESS_THRESHOLD"
+            ),
+            "SCHEDULE_HORIZON_HOURS": os.environ.get("SCHEDULE_HORIZON_HOURS"),
+            "TASK_OUTBOX": os.environ.get("TASK_OUTBOX"),
+            "OUTBOX_BATCH_SIZE": os.environ.get("OUTBOX_BATCH_SIZE"),
+            "REQUEST_TIMING": os.environ.get("REQUEST_TIMING"),
+            "METRICS_TOKEN": os.environ.get("METRICS_TOKEN"),
+            "ASYNC_LOGGING": os.environ.get("ASYNC_LOGGING"),
+            "LOG_MAX_ITEMS": os.environ.get("LOG_MAX_ITEMS"),
+            "LOG_MAX_CHARS": os.environ.get("LOG_MAX_CHARS"),
+            "LOG_SAMPLE_RATES": os.environ.get("LOG_SAMPLE_RATES"),
+            "LOG_QUEUE_SIZE": os.environ.get("LOG_QUEUE_SIZE"),
         }
     except Exception as error:
         logger.error("Error getting env vars: %s", error, exc_info=True)
@@ -0,0 +1,84 @@
+# Path: src/utils/http_session.py
+import logging
+from typing import Dict, List, Sequence
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def create_session(
+    pool_connections: int = 4,
+    pool_maxsize: int = 16,
+    retries: int = 3,
+    backoff_factor: float = 0.2,
+    status_forcelist: Sequence[int] = RETRYABLE_STATUS_CODES,
+) -> requests.Session:
+    """Create a keep-alive session backed by a connection pool.
+
+    The session can be shared between the threads of a worker, connections
+    are checked out of a thread-safe pool per host.
+    Args:
+        pool_connections: The number of hosts to keep a connection pool for.
+        pool_maxsize: The maximum number of connections kept alive per host.
+        retries: The number of retries for idempotent requests.
+        backoff_factor: The exponential backoff factor between retries.
+        status_forcelist: The status codes that trigger a retry.
+    Returns:
+        The session.
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=status_forcelist,
+        allowed_methods=IDEMPOTENT_METHODS,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def pool_stats(session: requests.Session) -> List[Dict]:
+    """Returns the utilisation of every host connection pool of a session.
+    Args:
+        session: A session created by `create_session`.
+    Returns:
+        A list with one entry per host pool.
+    """
+    stats = []
+    seen_adapters = set()
+    for adapter in session.adapters.values():
+        if id(adapter) in seen_adapters or not hasattr(adapter, "poolmanager"):
+            continue
+        seen_adapters.add(id(adapter))
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            maxsize = pool.pool.maxsize if pool.pool is not None else 0
+            available = pool.pool.qsize() if pool.pool is not None else 0
+            stats.append(
+                {
+                    "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                    "maxsize": maxsize,
+                    "in_use": maxsize - available,
+                    "connections_created": pool.num_connections,
+                    "requests": pool.num_requests,
+                }
+            )
+    return stats
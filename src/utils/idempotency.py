@@ -0,0 +1,212 @@
+# Path: src/utils/idempotency.py
+import json
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional, Protocol, Tuple
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyTimeoutError(Exception):
+    """Exception raised when a duplicate request times out waiting on the first one."""
+
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+
+class IdempotencyKeyReuseError(Exception):
+    """Exception raised when an idempotency key is reused for a different request."""
+
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+
+class IdempotencyBackend(Protocol):
+    """A store shared between instances, e.g. a table or a Redis instance."""
+
+    def get(self, key: str) -> Optional[Any]:
+        ...
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        ...
+
+
+def derive_idempotency_key(action_type: str, payload: Any, scope: str = "") -> str:
+    """Derive an idempotency key from the action type and payload of a request.
+    Args:
+        action_type: The action type.
+        payload: The request payload.
+        scope: An optional scope, e.g. the user id, the key is unique within.
+    Returns:
+        The hex digest of the canonical JSON of the request.
+    """
+    canonical = json.dumps(
+        {"scope": scope, "action_type": action_type, "payload": payload},
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """Runs a function at most once per key and replays its result.
+
+    Results are kept in a bounded in-process store for `ttl` seconds, and in
+    an optional shared backend. While the first call for a key is running,
+    duplicate calls in the same process wait for it and get its result. If the
+    first call fails nothing is stored, and one of the waiting calls runs.
+
+    A result is stored with the fingerprint of the request that produced it,
+    and only replayed for a request with the same fingerprint, so that a
+    client-supplied key reused for another request is rejected.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 300,
+        maxsize: int = 1024,
+        backend: Optional[IdempotencyBackend] = None,
+        wait_timeout: float = 30,
+    ):
+        self.ttl = ttl
+        self.backend = backend
+        self.wait_timeout = wait_timeout
+        self.replays = 0
+        self._results: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._inflight: Dict[str, threading.Event] = {}
+        self._inflight_async: Dict[str, asyncio.Event] = {}
+        self._lock = threading.Lock()
+
+    def run(
+        self, key: str, func: Callable[[], Any], fingerprint: str = ""
+    ) -> Tuple[Any, bool]:
+        """Run `func` once for `key`.
+        Args:
+            key: The idempotency key.
+            func: The function to run.
+            fingerprint: The fingerprint of the request, e.g. the hash of its
+                action type and payload.
+        Returns:
+            A tuple of the result and whether it was replayed from the store.
+        Raises:
+            IdempotencyTimeoutError: If the first call for the key did not
+                finish within `wait_timeout` seconds.
+            IdempotencyKeyReuseError: If the result of the key was stored for
+                a request with another fingerprint.
+        """
+        while True:
+            with self._lock:
+                if key in self._results:
+                    return self._replay(self._results[key], fingerprint), True
+                event = self._inflight.get(key)
+                if event is None:
+                    event = self._inflight[key] = threading.Event()
+                    break
+            if not event.wait(self.wait_timeout):
+                raise IdempotencyTimeoutError(
+                    "A request with the same idempotency key is still in progress"
+                )
+
+        try:
+            stored = self._backend_get(key)
+            if stored is not None:
+                with self._lock:
+                    self._results[key] = stored
+                    return self._replay(stored, fingerprint), True
+
+            result = func()
+            entry = {"fingerprint": fingerprint, "result": result}
+            with self._lock:
+                self._results[key] = entry
+            self._backend_set(key, entry)
+            return result, False
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    async def run_async(
+        self, key: str, func: Callable[[], Awaitable[Any]], fingerprint: str = ""
+    ) -> Tuple[Any, bool]:
+        """Await `func` once for `key`, like `run` on an event loop.
+        Duplicate calls wait without blocking the loop, and the backend is
+        called in a worker thread.
+        Args:
+            key: The idempotency key.
+            func: The coroutine function to await.
+            fingerprint: The fingerprint of the request.
+        Returns:
+            A tuple of the result and whether it was replayed from the store.
+        Raises:
+            IdempotencyTimeoutError: If the first call for the key did not
+                finish within `wait_timeout` seconds.
+            IdempotencyKeyReuseError: If the result of the key was stored for
+                a request with another fingerprint.
+        """
+        while True:
+            with self._lock:
+                if key in self._results:
+                    return self._replay(self._results[key], fingerprint), True
+                event = self._inflight_async.get(key)
+                if event is None:
+                    event = self._inflight_async[key] = asyncio.Event()
+                    break
+            try:
+                await asyncio.wait_for(event.wait(), self.wait_timeout)
+            except asyncio.TimeoutError:
+                raise IdempotencyTimeoutError(
+                    "A request with the same idempotency key is still in progress"
+                )
+
+        try:
+            stored = None
+            if self.backend is not None:
+                stored = await asyncio.to_thread(self._backend_get, key)
+            if stored is not None:
+                with self._lock:
+                    self._results[key] = stored
+                    return self._replay(stored, fingerprint), True
+
+            result = await func()
+            entry = {"fingerprint": fingerprint, "result": result}
+            with self._lock:
+                self._results[key] = entry
+            if self.backend is not None:
+                await asyncio.to_thread(self._backend_set, key, entry)
+            return result, False
+        finally:
+            with self._lock:
+                self._inflight_async.pop(key, None)
+            event.set()
+
+    def _replay(self, entry: Dict[str, Any], fingerprint: str) -> Any:
+        """Returns the stored result of an entry, called with the lock held."""
+        if entry["fingerprint"] != fingerprint:
+            raise IdempotencyKeyReuseError(
+                "The idempotency key was already used for a different request"
+            )
+        self.replays += 1
+        return entry["result"]
+
+    def _backend_get(self, key: str) -> Optional[Any]:
+        if self.backend is None:
+            return None
+        try:
+            return self.backend.get(key)
+        except Exception as error:
+            logger.warning("Error reading idempotency key from backend: %s", error)
+            return None
+
+    def _backend_set(self, key: str, value: Any) -> None:
+        if self.backend is None:
+            return
+        try:
+            self.backend.set(key, value, self.ttl)
+        except Exception as error:
+            logger.warning("Error writing idempotency key to backend: %s", error)
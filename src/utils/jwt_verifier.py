@@ -0,0 +1,67 @@
+# Path: src/utils/jwt_verifier.py
+import logging
+from typing import Callable, Dict, Optional, Sequence, Union
+import jwt
+
+logger = logging.getLogger(__name__)
+
+
+class JWTVerifier:
+    """Verifies Supabase JWT signatures locally.
+
+    Tokens are checked against the project's HS256 JWT secret, a JWKS
+    endpoint, or both. The secret can be given as a callable so that a
+    rotated secret is picked up from a cache. The JWKS is fetched once and
+    cached for `jwks_lifespan` seconds; a token signed with an unknown key
+    id forces a refresh.
+    """
+
+    def __init__(
+        self,
+        jwt_secret: Union[None, str, Callable[[], str]] = None,
+        jwks_url: Optional[str] = None,
+        audience: Optional[str] = None,
+        jwks_lifespan: int = 300,
+        jwks_algorithms: Sequence[str] = ("RS256", "ES256"),
+    ):
+        if not jwt_secret and not jwks_url:
+            raise ValueError("Either jwt_secret or jwks_url must be provided")
+        self.jwt_secret = jwt_secret
+        self.audience = audience
+        self.jwks_algorithms = list(jwks_algorithms)
+        self.jwks_client = (
+            jwt.PyJWKClient(
+                jwks_url, cache_jwk_set=True, lifespan=jwks_lifespan, timeout=5
+            )
+            if jwks_url
+            else None
+        )
+
+    def verify(self, jwt_token: str) -> Dict:
+        """Verifies the signature and expiry of a JWT.
+        Args:
+            jwt_token: The encoded JWT.
+        Returns:
+            The verified claims.
+        Raises:
+            jwt.InvalidTokenError: If the token is malformed, expired or badly signed.
+            jwt.PyJWKClientConnectionError: If the key set could not be fetched.
+        """
+        algorithm = jwt.get_unverified_header(jwt_token).get("alg")
+        if self.jwt_secret and algorithm == "HS256":
+            key = self.jwt_secret() if callable(self.jwt_secret) else self.jwt_secret
+        elif self.jwks_client is not None and algorithm in self.jwks_algorithms:
+            key = self.jwks_client.get_signing_key_from_jwt(jwt_token).key
+        else:
+            raise jwt.InvalidAlgorithmError(f"Unsupported JWT algorithm: {algorithm}")
+
+        return jwt.decode(
+            jwt_token,
+            key,
+            algorithms=[algorithm],
+            audience=self.audience,
+            options={
+                "require": ["exp", "sub"],
+                "verify_aud": self.audience is not None,
+            },
+        )
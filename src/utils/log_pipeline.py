@@ -0,0 +1,229 @@
+# Path: src/utils/log_pipeline.py
+"""A logging pipeline that keeps handler I/O off the request path.
+
+`configure_logging` moves the handlers of the root logger behind a
+`QueueListener`, so records are formatted and written by a background thread.
+On the request thread a record only goes through two filters:
+
+- `SamplingFilter` keeps a share of the records below WARNING of the loggers
+  with a sample rate, e.g. `main=0.1`. Warnings and errors are always kept.
+- `RedactingFilter` copies the arguments of the record and replaces the
+  collections larger than `max_items`, such as the `audience_ids` of a
+  payload, by their size and a hash, and truncates strings longer than
+  `max_chars`. The copy also keeps a payload that is changed after the call
+  from changing the record before it is written.
+"""
+import atexit
+import queue
+import random
+import hashlib
+import logging
+import dataclasses
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+DEFAULT_MAX_ITEMS = 20
+DEFAULT_MAX_CHARS = 1000
+DEFAULT_QUEUE_SIZE = 10000
+
+
+class CollectionSummary:
+    """Stands in for a large collection in a log record."""
+
+    __slots__ = ("kind", "count", "digest")
+
+    def __init__(self, value: Any):
+        self.kind = type(value).__name__
+        self.count = len(value)
+        if isinstance(value, (set, frozenset)):
+            value = sorted(map(str, value))
+        try:
+            # Joining strings directly is about 10x faster than through str()
+            text = "\x1f".join(value)
+        except TypeError:
+            text = "\x1f".join(map(str, value))
+        self.digest = hashlib.sha256(text.encode()).hexdigest()[:12]
+
+    def __repr__(self) -> str:
+        return f"<{self.kind} of {self.count} items sha256:{self.digest}>"
+
+
+class RedactedObject:
+    """Stands in for a dataclass in a log record, with its redacted fields."""
+
+    __slots__ = ("name", "fields")
+
+    def __init__(self, name: str, fields: Dict[str, Any]):
+        self.name = name
+        self.fields = fields
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{key}={value!r}" for key, value in self.fields.items())
+        return f"{self.name}({fields})"
+
+
+def redact(value: Any, max_items: int, max_chars: int) -> Any:
+    """
+    Copies a log argument, with its large collections summarized.
+    Args:
+        value: The argument.
+        max_items: The largest collection kept as is, 0 for no limit.
+        max_chars: The longest string kept as is, 0 for no limit.
+    Returns:
+        The redacted copy of the argument.
+    """
+    if isinstance(value, str):
+        if max_chars and len(value) > max_chars:
+            return f"{value[:max_chars]}...<{len(value)} chars>"
+        return value
+    if isinstance(value, dict):
+        if max_items and len(value) > max_items:
+            return CollectionSummary(value)
+        return {key: redact(item, max_items, max_chars) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        if max_items and len(value) > max_items:
+            return CollectionSummary(value)
+        items = [redact(item, max_items, max_chars) for item in value]
+        return tuple(items) if isinstance(value, tuple) else items
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return RedactedObject(
+            type(value).__name__,
+            {
+                field.name: redact(getattr(value, field.name), max_items, max_chars)
+                for field in dataclasses.fields(value)
+            },
+        )
+    return value
+
+
+class RedactingFilter(logging.Filter):
+    """Summarizes the large collections in the arguments of every record."""
+
+    def __init__(
+        self, max_items: int = DEFAULT_MAX_ITEMS, max_chars: int = DEFAULT_MAX_CHARS
+    ):
+        super().__init__()
+        self.max_items = max_items
+        self.max_chars = max_chars
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.args:
+            if isinstance(record.args, dict):
+                record.args = {
+                    key: redact(value, self.max_items, self.max_chars)
+                    for key, value in record.args.items()
+                }
+            else:
+                record.args = tuple(
+                    redact(value, self.max_items, self.max_chars)
+                    for value in record.args
+                )
+        elif not isinstance(record.msg, str):
+            record.msg = redact(record.msg, self.max_items, self.max_chars)
+        return True
+
+
+def parse_sample_rates(value: Optional[str]) -> Dict[str, float]:
+    """Parses `main=0.1,src.services=0.5` into sample rates by logger name."""
+    rates = {}
+    for part in (value or "").split(","):
+        if not part.strip():
+            continue
+        name, rate = (text.strip() for text in part.split("=", 1))
+        rates[name] = float(rate)
+        if not 0 <= rates[name] <= 1:
+            raise ValueError(f"Sample rate of logger '{name}' is not between 0 and 1")
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a share of the records below WARNING of the loggers with a rate.
+
+    The rate of a logger is the rate of its closest configured ancestor, so
+    `src.services=0.5` also samples `src.services.campaign_service`.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._resolved: Dict[str, float] = {}
+
+    def rate(self, name: str) -> float:
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate = 1.0
+            parts = name.split(".")
+            for end in range(len(parts), 0, -1):
+                prefix = ".".join(parts[:end])
+                if prefix in self.rates:
+                    rate = self.rates[prefix]
+                    break
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self.rate(record.name)
+        return rate >= 1 or random.random() < rate
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """Hands records to a background thread without formatting them.
+
+    The records stay on this process, so unlike `QueueHandler` the message is
+    not formatted on the logging thread. A record is dropped and counted when
+    the queue is full, rather than blocking the request.
+    """
+
+    def __init__(self, queue_: queue.Queue):
+        super().__init__(queue_)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(
+    env_vars: Dict[str, Optional[str]], logger: Optional[logging.Logger] = None
+) -> Optional[QueueListener]:
+    """
+    Moves the handlers of a logger behind a background queue, if ASYNC_LOGGING is set.
+    Args:
+        env_vars: The environment variables, with the optional LOG_MAX_ITEMS,
+            LOG_MAX_CHARS, LOG_SAMPLE_RATES and LOG_QUEUE_SIZE.
+        logger: The logger, the root logger if None. A stderr handler is
+            created if it has none.
+    Returns:
+        The started listener that writes the records, or None if disabled.
+    """
+    if env_vars.get("ASYNC_LOGGING") != "true":
+        return None
+    logger = logger or logging.getLogger()
+    handlers = list(logger.handlers) or [logging.StreamHandler()]
+    queue_handler = BackgroundQueueHandler(
+        queue.Queue(int(env_vars.get("LOG_QUEUE_SIZE") or DEFAULT_QUEUE_SIZE))
+    )
+    queue_handler.addFilter(
+        SamplingFilter(parse_sample_rates(env_vars.get("LOG_SAMPLE_RATES")))
+    )
+    queue_handler.addFilter(
+        RedactingFilter(
+            max_items=int(env_vars.get("LOG_MAX_ITEMS") or DEFAULT_MAX_ITEMS),
+            max_chars=int(env_vars.get("LOG_MAX_CHARS") or DEFAULT_MAX_CHARS),
+        )
+    )
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+    logger.addHandler(queue_handler)
+    listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    # Write the records left in the queue when the instance shuts down
+    atexit.register(listener.stop)
+    return listener
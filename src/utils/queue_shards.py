@@ -0,0 +1,32 @@
+# Path: src/utils/queue_shards.py
+import hashlib
+from typing import Optional, Sequence
+
+# Keys a campaign can be sharded on
+QUEUE_SHARD_KEYS = frozenset(["campaign_id", "company_id"])
+
+
+def parse_queue_names(value: Optional[str]) -> list:
+    """Parses a comma-separated list of queue names."""
+    if not value:
+        return []
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+def shard_queue(key: str, queue_names: Sequence[str]) -> str:
+    """
+    Picks the queue of a key by rendezvous hashing.
+    The choice is stable across processes, and adding a queue only moves the
+    keys that pick the new queue.
+    Args:
+        key: The shard key, e.g. a campaign or company id.
+        queue_names: The queues to pick from.
+    Returns:
+        The queue name.
+    """
+    if len(queue_names) == 1:
+        return queue_names[0]
+    return max(
+        queue_names,
+        key=lambda queue_name: hashlib.sha256(f"{queue_name}:{key}".encode()).digest(),
+    )
@@ -0,0 +1,388 @@
+# Path: src/utils/resilience.py
+"""Retry budgets and circuit breakers around remote dependencies.
+
+Every dependency, e.g. Cloud Tasks or Supabase, gets a `DependencyGuard`.
+Calls through a guard are retried only on retryable errors, and only while
+the dependency's retry budget has tokens, so that a brownout does not
+multiply the load on the dependency. Consecutive retryable failures open
+the guard's circuit breaker, which then fails calls fast until a probe
+call succeeds.
+"""
+import time
+import inspect
+import logging
+import threading
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict, Optional
+from tenacity import AsyncRetrying, RetryCallState, Retrying
+from tenacity.stop import stop_after_attempt
+from tenacity.wait import wait_exponential
+
+from src.errors.circuit_open_error import CircuitOpenError
+from src.utils.http_session import RETRYABLE_STATUS_CODES
+from src.utils.timing import span
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def error_status(error: BaseException) -> Optional[int]:
+    """Returns the HTTP status code of an error, if it has one."""
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    if status is None:
+        # google.api_core exceptions carry the HTTP equivalent of their gRPC code
+        status = getattr(error, "code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable_status_error(error: BaseException) -> bool:
+    """Retries errors with a retryable status code and connection errors."""
+    import requests
+
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    try:
+        import httpx
+    except ImportError:
+        pass
+    else:
+        # The async clients raise httpx errors
+        if isinstance(error, httpx.TransportError):
+            return True
+    return error_status(error) in RETRYABLE_STATUS_CODES
+
+
+def is_closed_channel_error(error: BaseException) -> bool:
+    """Returns True for the error of a call on a closed gRPC channel."""
+    return isinstance(error, ValueError) and "closed channel" in str(error)
+
+
+def is_retryable_transport_error(error: BaseException) -> bool:
+    """Retries connection and timeout errors of the HTTP clients, the
+    unavailable and deadline exceeded errors of the Google API clients, and
+    calls on a closed gRPC channel, which is replaced before the retry.
+    Other errors, e.g. a bug raising a TypeError, are not retried."""
+    import requests
+    from google.api_core.exceptions import DeadlineExceeded, ServiceUnavailable
+
+    if isinstance(
+        error,
+        (
+            requests.ConnectionError,
+            requests.Timeout,
+            ServiceUnavailable,
+            DeadlineExceeded,
+        ),
+    ) or is_closed_channel_error(error):
+        return True
+    try:
+        import httpx
+    except ImportError:
+        return False
+    return isinstance(error, (httpx.ConnectError, httpx.TimeoutException))
+
+
+class RetryBudget:
+    """A token bucket that limits retries to a share of the calls.
+
+    Every call deposits `ratio` tokens and every retry withdraws one, so at
+    most about `ratio` of the calls are retried once the initial
+    `max_tokens` are spent.
+    """
+
+    def __init__(self, ratio: float = 0.2, max_tokens: float = 10):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures.
+
+    While open, calls fail fast for `reset_timeout` seconds. Then one probe
+    call is let through: it closes the breaker if it succeeds and re-opens
+    it if it fails.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def retry_after(self) -> float:
+        """Seconds until the breaker lets a probe call through."""
+        return max(0.0, self.opened_at + self.reset_timeout - self.clock())
+
+    def allow(self) -> bool:
+        """Whether a call may go through, claiming the probe if half open."""
+        with self._lock:
+            if self.state == OPEN and self.retry_after() == 0:
+                self.state = HALF_OPEN
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self) -> Optional[str]:
+        """Records a successful call, returns the new state if it changed."""
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            if self.state != CLOSED:
+                self.state = CLOSED
+                return CLOSED
+            return None
+
+    def record_failure(self) -> Optional[str]:
+        """Records a failed call, returns the new state if it changed."""
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or (
+                self.state == CLOSED and self.failures >= self.failure_threshold
+            ):
+                self.state = OPEN
+                self.opened_at = self.clock()
+                return OPEN
+            return None
+
+    def release(self) -> None:
+        """Releases the probe of a call that did not reach the dependency."""
+        with self._lock:
+            self._probing = False
+
+
+class DependencyGuard:
+    """Guards the calls to one dependency with a retry budget and a breaker."""
+
+    def __init__(
+        self,
+        name: str,
+        is_retryable: Callable[[BaseException], bool] = is_retryable_status_error,
+        max_attempts: int = 3,
+        backoff: float = 1,
+        max_backoff: float = 3,
+        budget: Optional[RetryBudget] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.name = name
+        self.is_retryable = is_retryable
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.budget = budget or RetryBudget()
+        self.breaker = breaker or CircuitBreaker()
+        self.counters = {
+            "calls": 0,
+            "failures": 0,
+            "retries": 0,
+            "budget_exhausted": 0,
+            "short_circuited": 0,
+        }
+        self._lock = threading.Lock()
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self.counters[counter] += 1
+
+    def _transition(self, state: Optional[str]) -> None:
+        if state is not None:
+            logger.warning(
+                "Circuit breaker of %s is %s",
+                self.name,
+                state,
+                extra={"resilience": self.metrics()},
+            )
+
+    def _before_attempt(self) -> None:
+        if not self.breaker.allow():
+            self._count("short_circuited")
+            raise CircuitOpenError(
+                f"{self.name} is unavailable", retry_after=self.breaker.retry_after()
+            )
+        self._count("calls")
+        self.budget.deposit()
+
+    def _after_error(self, error: Exception) -> None:
+        if self.is_retryable(error):
+            self._count("failures")
+            self._transition(self.breaker.record_failure())
+        else:
+            # The dependency answered, e.g. with a 404
+            self._transition(self.breaker.record_success())
+
+    def _attempt(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        self._before_attempt()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as error:
+            self._after_error(error)
+            raise
+        self._transition(self.breaker.record_success())
+        return result
+
+    async def _attempt_async(
+        self, func: Callable[..., Awaitable[Any]], *args, **kwargs
+    ) -> Any:
+        self._before_attempt()
+        try:
+            result = await func(*args, **kwargs)
+        except Exception as error:
+            self._after_error(error)
+            raise
+        self._transition(self.breaker.record_success())
+        return result
+
+    def _should_retry(self, retry_state: RetryCallState) -> bool:
+        if not retry_state.outcome.failed:
+            return False
+        error = retry_state.outcome.exception()
+        if isinstance(error, CircuitOpenError) or not self.is_retryable(error):
+            return False
+        if retry_state.attempt_number >= self.max_attempts:
+            # The last attempt, tenacity stops without spending the budget
+            return True
+        if not self.budget.withdraw():
+            self._count("budget_exhausted")
+            logger.warning("Retry budget of %s is exhausted", self.name)
+            return False
+        self._count("retries")
+        return True
+
+    def call(self, func: Callable[..., Any], *args, retry: bool = True, **kwargs):
+        """
+        Calls a function of the dependency.
+        Args:
+            func: The function.
+            retry: Whether retryable errors are retried, False for calls that
+                are not idempotent.
+        Returns:
+            The result of the function.
+        Raises:
+            CircuitOpenError: If the breaker is open.
+            tenacity.RetryError: If every attempt failed with a retryable error.
+        """
+        if not retry or self.max_attempts <= 1:
+            return self._attempt(func, *args, **kwargs)
+        retrying = Retrying(
+            stop=stop_after_attempt(self.max_attempts),
+            wait=wait_exponential(multiplier=self.backoff, max=self.max_backoff),
+            retry=self._should_retry,
+        )
+        return retrying(self._attempt, func, *args, **kwargs)
+
+    async def call_async(
+        self, func: Callable[..., Awaitable[Any]], *args, retry: bool = True, **kwargs
+    ):
+        """
+        Calls a coroutine function of the dependency, like `call`.
+        The backoff between attempts does not block the event loop.
+        """
+        if not retry or self.max_attempts <= 1:
+            return await self._attempt_async(func, *args, **kwargs)
+        retrying = AsyncRetrying(
+            stop=stop_after_attempt(self.max_attempts),
+            wait=wait_exponential(multiplier=self.backoff, max=self.max_backoff),
+            retry=self._should_retry,
+        )
+        return await retrying(self._attempt_async, func, *args, **kwargs)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Returns the breaker state, retry counts and remaining budget."""
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            "dependency": self.name,
+            "state": self.breaker.state,
+            "budget_tokens": round(self.budget.tokens, 2),
+            **counters,
+        }
+
+
+def guarded(dependency: str, retry: bool = True):
+    """Decorates a method so that it is called through `self.guards[dependency]`,
+    timed as the `{dependency}.{method}` span of the request."""
+
+    def decorator(func):
+        span_name = f"{dependency}.{func.__name__}"
+
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with span(span_name):
+                return self.guards[dependency].call(
+                    func, self, *args, retry=retry, **kwargs
+                )
+
+        return wrapper
+
+    return decorator
+
+
+class GuardedClient:
+    """Calls the methods of a client, e.g. a Supabase client, through a guard.
+    Only the `idempotent_methods` are retried. Coroutine methods of an async
+    client are awaited through `DependencyGuard.call_async`. Every call is
+    timed as the `{guard name}.{method}` span of the request."""
+
+    def __init__(self, client: Any, guard: DependencyGuard, idempotent_methods=()):
+        self.client = client
+        self.guard = guard
+        self.idempotent_methods = frozenset(idempotent_methods)
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self.client, name)
+        if not callable(attribute):
+            return attribute
+
+        span_name = f"{self.guard.name}.{name}"
+        if inspect.iscoroutinefunction(attribute):
+
+            async def call_async(*args, **kwargs):
+                with span(span_name):
+                    return await self.guard.call_async(
+                        attribute,
+                        *args,
+                        retry=name in self.idempotent_methods,
+                        **kwargs,
+                    )
+
+            return call_async
+
+        def call(*args, **kwargs):
+            with span(span_name):
+                return self.guard.call(
+                    attribute,
+                    *args,
+                    retry=name in self.idempotent_methods,
+                    **kwargs,
+                )
+
+        return call
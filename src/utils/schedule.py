@@ -0,0 +1,153 @@
+# Path: src/utils/schedule.py
+import math
+import datetime as dt
+from typing import List, Optional, Tuple, Union
+from dateutil.relativedelta import relativedelta
+
+# The step between two runs of a recurring campaign, by frequency
+FREQUENCY_STEPS = {
+    "daily": relativedelta(days=1),
+    "weekly": relativedelta(weeks=1),
+    "fortnightly": relativedelta(weeks=2),
+    "monthly": relativedelta(months=1),
+}
+
+# Average length of a step, used to estimate the index of a run
+FREQUENCY_SECONDS = {
+    "daily": 86400.0,
+    "weekly": 7 * 86400.0,
+    "fortnightly": 14 * 86400.0,
+    "monthly": 30.436875 * 86400.0,
+}
+
+
+def parse_datetime(value: Union[None, str, dt.datetime]) -> Optional[dt.datetime]:
+    """Parses an ISO 8601 timestamp, naive values are taken as UTC."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        value = dt.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=dt.timezone.utc)
+    return value
+
+
+def parse_time(value: Union[None, str, dt.time]) -> Optional[dt.time]:
+    """Parses an ISO 8601 time of day, e.g. "09:30" or "09:30:00"."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        value = dt.time.fromisoformat(value)
+    return value
+
+
+def schedule_anchor(
+    next_run_time: Union[str, dt.datetime], time_of_day: Union[None, str, dt.time]
+) -> dt.datetime:
+    """Returns the first run of a campaign, at its time of day if it has one."""
+    anchor = parse_datetime(next_run_time)
+    run_time = parse_time(time_of_day)
+    if run_time is not None:
+        anchor = anchor.replace(
+            hour=run_time.hour,
+            minute=run_time.minute,
+            second=run_time.second,
+            microsecond=0,
+        )
+    return anchor
+
+
+def run_time(anchor: dt.datetime, frequency: str, index: int) -> dt.datetime:
+    """Returns the time of the run at `index`, counted from the anchor."""
+    return anchor + FREQUENCY_STEPS[frequency] * index
+
+
+def first_run_after(anchor: dt.datetime, frequency: str, after: dt.datetime) -> int:
+    """Returns the index of the first run strictly after `after`."""
+    elapsed = (after - anchor).total_seconds()
+    index = max(0, math.floor(elapsed / FREQUENCY_SECONDS[frequency]))
+    while index > 0 and run_time(anchor, frequency, index - 1) > after:
+        index -= 1
+    while run_time(anchor, frequency, index) <= after:
+        index += 1
+    return index
+
+
+def run_index(anchor: dt.datetime, frequency: str, time: dt.datetime) -> Optional[int]:
+    """Returns the index of the run at `time`, None if no run is at that time."""
+    if frequency not in FREQUENCY_STEPS or time < anchor:
+        return None
+    index = first_run_after(anchor, frequency, time - dt.timedelta(microseconds=1))
+    return index if run_time(anchor, frequency, index) == time else None
+
+
+def expand_runs(
+    next_run_time: Union[str, dt.datetime],
+    frequency: str,
+    after: dt.datetime,
+    until: dt.datetime,
+    time_of_day: Union[None, str, dt.time] = None,
+    end_date: Union[None, str, dt.datetime] = None,
+    first_index: int = 0,
+) -> List[Tuple[int, dt.datetime]]:
+    """
+    Expands a recurring schedule into the runs within a time window.
+    Args:
+        next_run_time: The first run of the campaign.
+        frequency: One of the FREQUENCY_STEPS keys.
+        after: Only runs strictly after this time are returned.
+        until: Only runs up to this time are returned.
+        time_of_day: The time of day of every run, if set.
+        end_date: No runs after this time are returned, if set.
+        first_index: Runs with a lower index are skipped, e.g. because they
+            are already scheduled.
+    Returns:
+        A list of (index, run time) tuples.
+    """
+    if frequency not in FREQUENCY_STEPS:
+        raise ValueError(f"Invalid frequency: {frequency}")
+    anchor = schedule_anchor(next_run_time, time_of_day)
+    end = parse_datetime(end_date)
+    if end is not None:
+        until = min(until, end)
+
+    index = max(first_index, first_run_after(anchor, frequency, after))
+    runs = []
+    while True:
+        time = run_time(anchor, frequency, index)
+        if time > until:
+            return runs
+        runs.append((index, time))
+        index += 1
+
+
+def next_run_after(
+    last_run: Union[str, dt.datetime],
+    frequency: str,
+    now: dt.datetime,
+    time_of_day: Union[None, str, dt.time] = None,
+    end_date: Union[None, str, dt.datetime] = None,
+    min_steps: int = 1,
+) -> Optional[dt.datetime]:
+    """
+    Computes the next run of a recurring campaign from its last run.
+    Args:
+        last_run: The last run of the campaign.
+        frequency: One of the FREQUENCY_STEPS keys.
+        now: The next run is strictly after this time.
+        time_of_day: The time of day of every run, if set.
+        end_date: The end of the campaign, if set.
+        min_steps: The minimum number of steps from the last run, 0 to keep
+            a last run that is still after `now`.
+    Returns:
+        The next run time, or None if the campaign ends before it.
+    """
+    if frequency not in FREQUENCY_STEPS:
+        raise ValueError(f"Invalid frequency: {frequency}")
+    anchor = schedule_anchor(last_run, time_of_day)
+    index = max(min_steps, first_run_after(anchor, frequency, now))
+    time = run_time(anchor, frequency, index)
+    end = parse_datetime(end_date)
+    if end is not None and time > end:
+        return None
+    return time
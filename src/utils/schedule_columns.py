@@ -0,0 +1,192 @@
+# Path: src/utils/schedule_columns.py
+"""Columnar next run time computation for many recurring campaigns at once.
+
+Timestamps are numpy `datetime64[s]` arrays in UTC, with NaT for missing
+values, and times of day are seconds since midnight with -1 for none. The
+results match `src.utils.schedule.next_run_after` row by row.
+"""
+import datetime as dt
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+
+from src.utils.schedule import FREQUENCY_STEPS, parse_datetime, parse_time
+
+# Frequencies by code, the order of FREQUENCY_STEPS
+FREQUENCIES = list(FREQUENCY_STEPS)
+MONTHLY = FREQUENCIES.index("monthly")
+
+# Fixed step of a frequency in seconds, 0 for calendar months
+STEP_SECONDS = np.array(
+    [
+        0 if step.months else int(dt.timedelta(days=step.days).total_seconds())
+        for step in FREQUENCY_STEPS.values()
+    ],
+    dtype=np.int64,
+)
+
+SECONDS_PER_DAY = 86400
+NAT = np.datetime64("NaT", "s")
+
+
+def parse_timestamps(values: Iterable[Union[None, str, dt.datetime]]) -> np.ndarray:
+    """Converts ISO 8601 timestamps or datetimes to a UTC `datetime64[s]` array."""
+    seconds = [
+        NAT if value is None or value == "" else int(parse_datetime(value).timestamp())
+        for value in values
+    ]
+    return np.array(seconds, dtype="datetime64[s]")
+
+
+def parse_times_of_day(values: Iterable[Union[None, str, dt.time]]) -> np.ndarray:
+    """Converts times of day to seconds since midnight, -1 for none."""
+    seconds = []
+    for value in values:
+        time = parse_time(value)
+        if time is None:
+            seconds.append(-1)
+        else:
+            seconds.append(time.hour * 3600 + time.minute * 60 + time.second)
+    return np.array(seconds, dtype=np.int64)
+
+
+def frequency_codes(frequencies: Sequence[str]) -> np.ndarray:
+    """Converts frequency names to their index in FREQUENCIES."""
+    names, inverse = np.unique(
+        np.asarray(frequencies, dtype=object), return_inverse=True
+    )
+    invalid = [name for name in names if name not in FREQUENCY_STEPS]
+    if invalid:
+        raise ValueError(f"Invalid frequency: {invalid[0]}")
+    codes = np.array([FREQUENCIES.index(name) for name in names], dtype=np.int64)
+    return codes[inverse]
+
+
+def _add_months(
+    months: np.ndarray, day: np.ndarray, seconds: np.ndarray, count: np.ndarray
+) -> np.ndarray:
+    """Adds calendar months, clamping the day to the end of the month."""
+    month = months + count
+    first_day = month.astype("datetime64[D]")
+    days_in_month = ((month + 1).astype("datetime64[D]") - first_day).astype(np.int64)
+    clamped = np.minimum(day, days_in_month - 1)
+    return first_day.astype("datetime64[s]") + (clamped * SECONDS_PER_DAY + seconds)
+
+
+def next_run_times(
+    last_run: np.ndarray,
+    frequency: np.ndarray,
+    now: Union[dt.datetime, np.datetime64],
+    time_of_day: Optional[np.ndarray] = None,
+    end_date: Optional[np.ndarray] = None,
+    min_steps: int = 1,
+) -> np.ndarray:
+    """
+    Computes the next run time of every campaign in a single vectorized pass.
+    Args:
+        last_run: The last run times as `datetime64[s]`.
+        frequency: The frequency codes, see `frequency_codes`.
+        now: Next runs are strictly after this time.
+        time_of_day: The times of day in seconds since midnight, -1 for none.
+        end_date: The end dates as `datetime64[s]`, NaT for none.
+        min_steps: The minimum number of steps from the last run, 0 to keep
+            last runs that are still after `now`.
+    Returns:
+        The next run times as `datetime64[s]`, NaT for ended campaigns and
+        campaigns without a last run.
+    """
+    if isinstance(now, dt.datetime):
+        now = np.datetime64(int(parse_datetime(now).timestamp()), "s")
+    last_run = last_run.astype("datetime64[s]")
+    missing = np.isnat(last_run)
+    last = np.where(missing, np.datetime64(0, "s"), last_run).astype(np.int64)
+    now_seconds = now.astype("datetime64[s]").astype(np.int64)
+
+    # Runs happen at the time of day from the day of the last run on
+    base = last
+    if time_of_day is not None:
+        day_start = last - last % SECONDS_PER_DAY
+        base = np.where(time_of_day >= 0, day_start + time_of_day, last)
+
+    # Daily, weekly and fortnightly runs are a fixed number of seconds apart
+    step = STEP_SECONDS[frequency]
+    safe_step = np.where(step > 0, step, 1)
+    count = np.maximum(min_steps, (now_seconds - base) // safe_step + 1)
+    result = (base + count * safe_step).astype("datetime64[s]")
+
+    monthly = frequency == MONTHLY
+    if monthly.any():
+        base_time = base[monthly].astype("datetime64[s]")
+        months = base_time.astype("datetime64[M]")
+        day = (
+            base_time.astype("datetime64[D]") - months.astype("datetime64[D]")
+        ).astype(np.int64)
+        seconds = base[monthly] % SECONDS_PER_DAY
+        count = np.maximum(
+            min_steps, (now.astype("datetime64[M]") - months).astype(np.int64)
+        )
+        candidate = _add_months(months, day, seconds, count)
+        late = candidate <= now
+        candidate[late] = _add_months(
+            months[late], day[late], seconds[late], count[late] + 1
+        )
+        result[monthly] = candidate
+
+    ended = missing
+    if end_date is not None:
+        ended = ended | (~np.isnat(end_date) & (result > end_date))
+    result[ended] = NAT
+    return result
+
+
+def changed_rows(
+    ids: Sequence[Any], current: np.ndarray, computed: np.ndarray
+) -> List[Dict[str, Any]]:
+    """
+    Returns the rows whose next run time changed, for a bulk update.
+    Args:
+        ids: The campaign ids.
+        current: The stored next run times as `datetime64[s]`.
+        computed: The computed next run times as `datetime64[s]`.
+    Returns:
+        A list of `{"id", "next_run_time"}` rows, with None for ended campaigns.
+    """
+    current_nat = np.isnat(current)
+    computed_nat = np.isnat(computed)
+    changed = (current_nat != computed_nat) | (
+        ~current_nat & ~computed_nat & (current != computed)
+    )
+    indexes = np.flatnonzero(changed)
+    values = np.datetime_as_string(computed[indexes], unit="s", timezone="UTC")
+    ids = np.asarray(ids, dtype=object)[indexes]
+    return [
+        {"id": campaign_id, "next_run_time": None if value == "NaT" else value}
+        for campaign_id, value in zip(ids.tolist(), values.tolist())
+    ]
+
+
+def plan_next_run_times(
+    campaigns: Sequence[Dict[str, Any]], now: dt.datetime
+) -> List[Dict[str, Any]]:
+    """
+    Recomputes the next run time of recurring campaign rows, e.g. after a
+    change of their time of day. Stored next run times in the past move to
+    the first run after `now`, and campaigns past their end date are cleared.
+    Args:
+        campaigns: The campaign rows.
+        now: Next runs are strictly after this time.
+    Returns:
+        The changed rows, see `changed_rows`.
+    """
+    current = parse_timestamps(campaign.get("next_run_time") for campaign in campaigns)
+    computed = next_run_times(
+        last_run=current,
+        frequency=frequency_codes([campaign["frequency"] for campaign in campaigns]),
+        now=now,
+        time_of_day=parse_times_of_day(
+            campaign.get("time_of_day") for campaign in campaigns
+        ),
+        end_date=parse_timestamps(campaign.get("end_date") for campaign in campaigns),
+        min_steps=0,
+    )
+    return changed_rows([campaign["id"] for campaign in campaigns], current, computed)
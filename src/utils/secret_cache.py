@@ -0,0 +1,202 @@
+# Path: src/utils/secret_cache.py
+import time
+import logging
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from src.utils.get_secret_payload import get_secret_payload
+
+logger = logging.getLogger(__name__)
+
+SecretKey = Tuple[str, str, str]
+
+
+class SecretAccessError(Exception):
+    """Exception raised when a secret could not be accessed."""
+
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+
+@dataclass
+class _Entry:
+    value: str
+    fetched_at: float
+
+
+class SecretCache:
+    """A cache of Secret Manager payloads keyed by (project, secret, version).
+
+    - Entries are served for `ttl` seconds. Within the last `refresh_ahead`
+      seconds a background refresh is started, so rotated secrets are picked
+      up without a redeploy and without blocking a request.
+    - If a refresh fails, the previous value is served for up to `max_stale`
+      seconds past its expiry (stale-while-revalidate).
+    - Concurrent callers of a missing or expired secret share a single fetch,
+      and at most one background refresh runs per secret.
+    - After a failed fetch, Secret Manager is not called again for
+      `failure_backoff` seconds: callers get the stale value or an error
+      right away instead of each waiting on a fetch during an outage.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 300,
+        refresh_ahead: float = 60,
+        max_stale: float = 3600,
+        failure_backoff: float = 5,
+        fetch: Optional[Callable[[str, str, str], Optional[str]]] = None,
+    ):
+        self.ttl = ttl
+        self.refresh_ahead = min(refresh_ahead, ttl)
+        self.max_stale = max_stale
+        self.failure_backoff = failure_backoff
+        self._fetch = fetch or self._fetch_from_secret_manager
+        self._entries: Dict[SecretKey, _Entry] = {}
+        self._inflight: Dict[SecretKey, Future] = {}
+        self._refreshing: Set[SecretKey] = set()
+        self._failed_until: Dict[SecretKey, float] = {}
+        self._lock = threading.Lock()
+        self._client_lock = threading.Lock()
+        self._client = None
+
+    def _fetch_from_secret_manager(
+        self, project_id: str, secret_id: str, version_id: str
+    ) -> Optional[str]:
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from google.cloud import secretmanager
+
+                    self._client = secretmanager.SecretManagerServiceClient()
+        return get_secret_payload(
+            project_id=project_id,
+            secret_id=secret_id,
+            version_id=version_id,
+            client=self._client,
+        )
+
+    def get(self, project_id: str, secret_id: str, version_id: str) -> str:
+        """Get the payload of a secret version.
+        Args:
+            project_id: The Google Cloud project id.
+            secret_id: The secret id.
+            version_id: The version number or alias, e.g. "latest".
+        Returns:
+            The secret payload.
+        Raises:
+            SecretAccessError: If the secret could not be fetched and there is
+                no usable cached value.
+        """
+        key = (project_id, secret_id, version_id)
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = now - entry.fetched_at
+            if age < self.ttl:
+                if age >= self.ttl - self.refresh_ahead:
+                    self._refresh_in_background(key)
+                return entry.value
+
+        backoff_until = self._failed_until.get(key, 0.0)
+        try:
+            if now < backoff_until:
+                raise SecretAccessError(
+                    f"Secret {secret_id} is not fetched again for "
+                    f"{backoff_until - now:.1f}s after an error"
+                )
+            return self._load(key)
+        except Exception as error:
+            if entry is not None and now - entry.fetched_at < self.ttl + self.max_stale:
+                # Only the failed fetch is logged, not every request of the backoff
+                if now >= backoff_until:
+                    logger.warning(
+                        "Serving stale secret %s after refresh error: %s",
+                        secret_id,
+                        error,
+                    )
+                return entry.value
+            if isinstance(error, SecretAccessError):
+                raise
+            raise SecretAccessError(f"Error accessing secret {secret_id}") from error
+
+    def get_cached(
+        self, project_id: str, secret_id: str, version_id: str
+    ) -> Optional[str]:
+        """Get the payload of a secret version without blocking on Secret Manager.
+        Args:
+            project_id: The Google Cloud project id.
+            secret_id: The secret id.
+            version_id: The version number or alias, e.g. "latest".
+        Returns:
+            The cached payload if it has not expired, None otherwise. A
+            background refresh is started like in `get`.
+        """
+        key = (project_id, secret_id, version_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        age = time.time() - entry.fetched_at
+        if age >= self.ttl:
+            return None
+        if age >= self.ttl - self.refresh_ahead:
+            self._refresh_in_background(key)
+        return entry.value
+
+    def invalidate(self, project_id: str, secret_id: str, version_id: str) -> None:
+        """Remove a secret version from the cache."""
+        with self._lock:
+            self._entries.pop((project_id, secret_id, version_id), None)
+
+    def _load(self, key: SecretKey) -> str:
+        """Fetch a secret, sharing the fetch with any concurrent caller."""
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            value = self._fetch(*key)
+            if not value:
+                raise SecretAccessError(f"Secret {key[1]} not found")
+            with self._lock:
+                self._entries[key] = _Entry(value=value, fetched_at=time.time())
+                self._failed_until.pop(key, None)
+            future.set_result(value)
+            return value
+        except Exception as error:
+            with self._lock:
+                self._failed_until[key] = time.time() + self.failure_backoff
+            future.set_exception(error)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _refresh_in_background(self, key: SecretKey) -> None:
+        with self._lock:
+            if (
+                key in self._inflight
+                or key in self._refreshing
+                or time.time() < self._failed_until.get(key, 0.0)
+            ):
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._load(key)
+                logger.debug("Refreshed secret %s", key[1])
+            except Exception as error:
+                logger.warning("Error refreshing secret %s: %s", key[1], error)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name="secret-refresh", daemon=True).start()
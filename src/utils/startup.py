@@ -0,0 +1,71 @@
+# Path: src/utils/startup.py
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Generic, Iterator, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class StartupTimer:
+    """Records how long each startup step of the function instance takes."""
+
+    def __init__(self):
+        self._steps: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self._steps[name] = seconds
+        logger.debug("Startup step '%s' took %.1f ms", name, seconds * 1000)
+
+    @contextmanager
+    def step(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def report(self) -> Dict[str, float]:
+        """Returns the duration of every recorded step in milliseconds."""
+        with self._lock:
+            return {
+                name: round(seconds * 1000, 3) for name, seconds in self._steps.items()
+            }
+
+
+startup_timer = StartupTimer()
+
+
+class Lazy(Generic[T]):
+    """A value created once, on first use, in a thread-safe way.
+
+    The time spent in the factory is recorded as a startup step.
+    """
+
+    def __init__(
+        self, factory: Callable[[], T], name: str, timer: Optional[StartupTimer] = None
+    ):
+        self.factory = factory
+        self.name = name
+        self.timer = timer or startup_timer
+        self._value: Optional[T] = None
+        self._initialized = False
+        self._lock = threading.Lock()
+
+    @property
+    def initialized(self) -> bool:
+        return self._initialized
+
+    def get(self) -> T:
+        if not self._initialized:
+            with self._lock:
+                if not self._initialized:
+                    with self.timer.step(self.name):
+                        self._value = self.factory()
+                    self._initialized = True
+        return self._value  # type: ignore
@@ -0,0 +1,89 @@
+# Path: src/utils/task_body.py
+"""Encoding of Cloud Tasks HTTP request bodies.
+
+Bodies are JSON, gzip-compressed when they are larger than a threshold. The
+encoding is given by the `Content-Encoding` header of the task, so the survey
+executor can decode any body with `decode_task_body`.
+"""
+import gzip
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Mapping, Optional
+
+JSON_CONTENT_TYPE = "application/json"
+GZIP_ENCODING = "gzip"
+TASK_BODY_ENCODINGS = frozenset([GZIP_ENCODING])
+
+
+@dataclass
+class EncodedBody:
+    """A task body with its headers and encoding statistics."""
+
+    body: bytes
+    headers: Dict[str, str] = field(default_factory=dict)
+    raw_size: int = 0
+    seconds: float = 0.0
+
+    @property
+    def size(self) -> int:
+        return len(self.body)
+
+    @property
+    def ratio(self) -> float:
+        """The raw size divided by the encoded size."""
+        return self.raw_size / self.size if self.size else 1.0
+
+
+def encode_task_body(
+    payload: Any,
+    encoding: Optional[str] = None,
+    threshold: int = 16384,
+    level: int = 1,
+) -> EncodedBody:
+    """
+    Encodes a task payload as a JSON body, compressed if it is large.
+    Args:
+        payload: The task payload.
+        encoding: The content encoding of large bodies, None for plain JSON.
+        threshold: Bodies of at most this many bytes are not compressed.
+        level: The gzip compression level. Audience ids are mostly random,
+            higher levels barely improve the ratio and are much slower.
+    Returns:
+        The encoded body.
+    """
+    started = time.perf_counter()
+    raw = json.dumps(payload).encode()
+    headers = {"Content-Type": JSON_CONTENT_TYPE}
+    body = raw
+    if encoding is not None and len(raw) > threshold:
+        if encoding not in TASK_BODY_ENCODINGS:
+            raise ValueError(f"Unsupported task body encoding: {encoding}")
+        # mtime=0 keeps the body of a payload identical between calls
+        body = gzip.compress(raw, compresslevel=level, mtime=0)
+        headers["Content-Encoding"] = encoding
+    return EncodedBody(
+        body=body,
+        headers=headers,
+        raw_size=len(raw),
+        seconds=time.perf_counter() - started,
+    )
+
+
+def decode_task_body(body: bytes, headers: Mapping[str, str]) -> Any:
+    """
+    Decodes a task body, the reference for the survey executor.
+    Args:
+        body: The request body.
+        headers: The request headers.
+    Returns:
+        The task payload.
+    """
+    encoding = next(
+        (v for k, v in headers.items() if k.lower() == "content-encoding"), None
+    )
+    if encoding is not None and encoding.strip().lower() == GZIP_ENCODING:
+        body = gzip.decompress(body)
+    elif encoding not in (None, "", "identity"):
+        raise ValueError(f"Unsupported task body encoding: {encoding}")
+    return json.loads(body)
@@ -0,0 +1,209 @@
+# Path: src/utils/timing.py
+"""Timing spans of the stages of a request.
+
+A request started with `start_request` collects the spans recorded with
+`span(name)` anywhere below it, e.g. the token verification, the Supabase
+calls and the Cloud Tasks calls. The spans are reported in a `Server-Timing`
+header and a log record, and every span is observed by a `HistogramRegistry`
+that can be dumped or scraped in the Prometheus text format.
+
+Outside of a started request `span` returns a shared no-op context manager,
+so the instrumentation costs one context variable lookup when timing is
+disabled.
+"""
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+from functools import partial
+from typing import Callable, ContextManager, Dict, Iterator, List, Optional, Tuple
+
+# Upper bounds of the histogram buckets, in seconds
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+class HistogramRegistry:
+    """Cumulative histograms of the span durations of the instance, by span name."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._histograms: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                # The bucket counts, the +Inf bucket, then the count and the sum
+                histogram = self._histograms[name] = [0] * (len(self.buckets) + 3)
+            histogram[bisect.bisect_left(self.buckets, seconds)] += 1
+            histogram[-2] += 1
+            histogram[-1] += seconds
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Returns the count, sum and cumulative bucket counts of every span name."""
+        with self._lock:
+            histograms = {
+                name: list(values) for name, values in self._histograms.items()
+            }
+        snapshot = {}
+        for name, values in sorted(histograms.items()):
+            cumulative, buckets = 0, {}
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            buckets["+Inf"] = values[-2]
+            snapshot[name] = {
+                "count": values[-2],
+                "sum_seconds": round(values[-1], 6),
+                "buckets": buckets,
+            }
+        return snapshot
+
+    def to_prometheus(self, metric: str = "campaigns_span_duration_seconds") -> str:
+        """Renders the histograms in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {metric} Duration of the stages of campaign requests.",
+            f"# TYPE {metric} histogram",
+        ]
+        for name, histogram in self.snapshot().items():
+            for bound, count in histogram["buckets"].items():
+                lines.append(f'{metric}_bucket{{span="{name}",le="{bound}"}} {count}')
+            lines.append(f'{metric}_sum{{span="{name}"}} {histogram["sum_seconds"]}')
+            lines.append(f'{metric}_count{{span="{name}"}} {histogram["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+
+histograms = HistogramRegistry()
+
+
+class RequestTimer:
+    """The spans of one request, recorded from any thread or task of the request."""
+
+    def __init__(self, registry: Optional[HistogramRegistry] = None):
+        self.registry = registry
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, float]] = []
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.spans.append((name, seconds))
+        if self.registry is not None:
+            self.registry.observe(name, seconds)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Returns the total milliseconds and the count of the spans of every name."""
+        with self._lock:
+            spans = list(self.spans)
+        summary: Dict[str, Dict[str, float]] = {}
+        for name, seconds in spans:
+            entry = summary.setdefault(name, {"ms": 0.0, "count": 0})
+            entry["ms"] += seconds * 1000
+            entry["count"] += 1
+        for entry in summary.values():
+            entry["ms"] = round(entry["ms"], 2)
+        summary["total"] = {"ms": round(self.elapsed() * 1000, 2), "count": 1}
+        return summary
+
+    def server_timing(self) -> str:
+        """Returns the value of the `Server-Timing` header, spans of the same
+        name are summed and their count given as the description."""
+        metrics = []
+        for name, entry in self.summary().items():
+            metric = f"{name};dur={entry['ms']}"
+            if entry["count"] > 1:
+                metric += f';desc="x{entry["count"]}"'
+            metrics.append(metric)
+        return ", ".join(metrics)
+
+
+_current: contextvars.ContextVar[Optional[RequestTimer]] = contextvars.ContextVar(
+    "request_timer", default=None
+)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        return None
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("timer", "name", "started")
+
+    def __init__(self, timer: RequestTimer, name: str):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self) -> "_Span":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.timer.record(self.name, time.perf_counter() - self.started)
+
+
+def span(name: str) -> ContextManager:
+    """Times the block as a span of the current request, if any."""
+    timer = _current.get()
+    if timer is None:
+        return _NOOP
+    return _Span(timer, name)
+
+
+def current_timer() -> Optional[RequestTimer]:
+    return _current.get()
+
+
+@contextmanager
+def start_request(
+    registry: Optional[HistogramRegistry] = histograms,
+) -> Iterator[RequestTimer]:
+    """Collects the spans recorded until the block exits."""
+    timer = RequestTimer(registry)
+    token = _current.set(timer)
+    try:
+        yield timer
+    finally:
+        _current.reset(token)
+        if registry is not None:
+            registry.observe("total", timer.elapsed())
+
+
+def propagate(func: Callable) -> Callable:
+    """Binds a function submitted to a thread pool to the current request,
+    so that its spans are recorded. A pool thread does not inherit the
+    context of the submitting thread."""
+    if _current.get() is None:
+        return func
+    return partial(contextvars.copy_context().run, func)
@@ -0,0 +1,75 @@
+# Path: src/utils/verified_user_cache.py
+import time
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+from cachetools import TLRUCache
+
+logger = logging.getLogger(__name__)
+
+
+class VerifiedUserCache:
+    """A bounded, thread-safe cache of verified super admins keyed by JWT `sub`.
+
+    Entries expire after `ttl` seconds or at the token's `exp`, whichever
+    comes first. When the cache is full the least recently used entry is
+    evicted.
+    """
+
+    def __init__(self, ttl: float = 300, maxsize: int = 1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Wall clock timer as `exp` is a unix timestamp.
+        self._cache: TLRUCache = TLRUCache(
+            maxsize=maxsize, ttu=self._time_to_use, timer=lambda: time.time()
+        )
+
+    def _time_to_use(self, key: str, value: Tuple[Dict, float], now: float) -> float:
+        """Returns the expiry time of an entry, never later than the token `exp`."""
+        return min(now + self.ttl, value[1])
+
+    def get(self, user_id: str) -> Optional[Dict]:
+        """Get the cached user metadata for a user id.
+        Args:
+            user_id: The JWT `sub` claim.
+        Returns:
+            A copy of the cached user metadata or None if there is no valid entry.
+        """
+        with self._lock:
+            entry = self._cache.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return dict(entry[0])
+
+    def set(self, user_id: str, user_metadata: Dict, exp: float) -> None:
+        """Cache the user metadata of a verified user.
+        Args:
+            user_id: The JWT `sub` claim.
+            user_metadata: The user metadata to cache.
+            exp: The token expiration time as a unix timestamp.
+        """
+        with self._lock:
+            self._cache[user_id] = (dict(user_metadata), float(exp))
+
+    def invalidate(self, user_id: Optional[str] = None) -> None:
+        """Remove a single user from the cache, or every user if no id is given."""
+        with self._lock:
+            if user_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(user_id, None)
+
+    def stats(self) -> Dict[str, float]:
+        """Returns the cache hit/miss counters and current size."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._cache),
+                "maxsize": self.maxsize,
+            }
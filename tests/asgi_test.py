@@ -0,0 +1,227 @@
+import time
+import asyncio
+import grpc
+import jwt
+import httpx
+import pytest
+from unittest import mock
+from google.api_core.exceptions import ServiceUnavailable
+import asgi
+import main
+from benchmarks.fakes import FakeAsyncCloudTasks, FakeCloudTasks, FakePostgREST
+from src.models.task_ref import TaskRef
+from src.services.async_campaign_service import AsyncCampaignService
+from src.services.campaign_service import CampaignService
+from src.services.user_services import AdminUserService
+from src.utils.idempotency import IdempotencyStore
+
+
+def instant_campaign():
+    return {
+        "name": "Campaign",
+        "count": 0,
+        "threshold": 5,
+        "status": "active",
+        "company_id": "company-1",
+        "created_by": "user-1",
+        "next_run_time": "2023-01-01T09:00:00+00:00",
+        "type": "instant",
+    }
+
+
+def auth_headers(user_id="user-1"):
+    token = jwt.encode({"sub": user_id, "exp": time.time() + 600}, "secret")
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def postgrest():
+    with FakePostgREST(latency=0, row_latency=0) as postgrest:
+        yield postgrest
+
+
+@pytest.fixture
+def cloud_tasks():
+    return FakeCloudTasks()
+
+
+@pytest.fixture
+def campaign_service(mock_env_vars):
+    service = CampaignService({**mock_env_vars, "BREAKER_FAILURE_THRESHOLD": "1"})
+    service.guards["cloud_tasks"].backoff = 0
+    return service
+
+
+@pytest.fixture
+def app(postgrest, cloud_tasks, campaign_service):
+    user_service = AdminUserService(
+        base_url=postgrest.url, anon_key="anon", service_key="service-key"
+    )
+    with mock.patch.dict(
+        main.env_vars, {"SUPABASE_URL": postgrest.url, "SUPABASE_ANON_KEY": "anon"}
+    ), mock.patch(
+        "google.cloud.tasks_v2.CloudTasksAsyncClient",
+        lambda: FakeAsyncCloudTasks(cloud_tasks),
+    ), mock.patch.object(
+        main, "get_service_key", return_value="service-key"
+    ), mock.patch.object(
+        main, "get_admin_user_service", return_value=user_service
+    ), mock.patch.object(
+        main, "campaign_service", mock.Mock(get=lambda: campaign_service)
+    ), mock.patch.object(
+        main, "idempotency_store", IdempotencyStore()
+    ), mock.patch.object(
+        asgi, "clients", asgi.AsyncClients()
+    ):
+        yield asgi.app
+
+
+def request(app, method, json=None, headers=None, path="/"):
+    async def send():
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            try:
+                return await client.request(method, path, json=json, headers=headers)
+            finally:
+                # The clients are bound to the loop of the request
+                await asgi.clients.stop()
+
+    return asyncio.run(send())
+
+
+def test_preflight(app):
+    response = request(app, "OPTIONS")
+    assert response.status_code == 204
+    assert response.headers["Access-Control-Allow-Origin"] == "*"
+
+
+def test_invalid_request(app):
+    response = request(app, "POST", headers=auth_headers())
+    assert response.status_code == 400
+    assert response.json() == {"message": "Invalid request body"}
+
+
+def test_create_edit_and_delete_campaign(app, postgrest, cloud_tasks):
+    """Test that the async actions write the row and the tasks, and replay duplicates."""
+    body = {
+        "queue_name": "campaigns",
+        "action_type": "create_campaign",
+        "payload": instant_campaign(),
+    }
+    response = request(app, "POST", json=body, headers=auth_headers())
+    assert response.status_code == 200
+    campaign_id = response.json()
+    assert campaign_id in postgrest.rows
+    assert [name.rsplit("/", 1)[-1] for name in cloud_tasks.tasks] == [campaign_id]
+
+    replayed = request(app, "POST", json=body, headers=auth_headers())
+    assert replayed.headers["Idempotency-Replayed"] == "true"
+    assert len(postgrest.rows) == 1
+
+    edit = {**postgrest.rows[campaign_id], "audience_ids": ["user-2"]}
+    response = request(
+        app,
+        "POST",
+        json={"queue_name": "q", "action_type": "edit_campaign", "payload": edit},
+        headers=auth_headers(),
+    )
+    assert response.status_code == 200
+    row = postgrest.rows[campaign_id]
+    task_ref = TaskRef.parse(row["cloud_task_id"])
+    assert task_ref.generation
+    assert [
+        name.rsplit("/", 1)[-1] for name in cloud_tasks.tasks
+    ] == task_ref.task_names(campaign_id)
+
+    response = request(
+        app,
+        "POST",
+        json={
+            "queue_name": "q",
+            "action_type": "delete_campaign",
+            "payload": {"id": campaign_id, "cloud_task_id": row["cloud_task_id"]},
+        },
+        headers=auth_headers(),
+    )
+    assert response.status_code == 200
+    assert postgrest.rows == {}
+    assert cloud_tasks.tasks == {}
+
+
+def test_open_circuit_returns_503(app, cloud_tasks):
+    cloud_tasks.faults = iter([ServiceUnavailable("down")] * 3)
+    body = {"queue_name": "q", "action_type": "create_campaign"}
+    for user_id in ("user-1", "user-2"):
+        response = request(
+            app,
+            "POST",
+            json={**body, "payload": {**instant_campaign(), "name": user_id}},
+            headers=auth_headers(user_id),
+        )
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "30"
+
+
+def test_request_timing(app):
+    """Test that the stages of a request are reported and scraped when enabled."""
+    body = {
+        "queue_name": "campaigns",
+        "action_type": "create_campaign",
+        "payload": instant_campaign(),
+    }
+    with mock.patch.object(main, "request_timing", True), mock.patch.object(
+        main, "metrics_token", "metrics-token"
+    ):
+        response = request(app, "POST", json=body, headers=auth_headers())
+        unauthorized = request(app, "GET", path="/metrics", headers=auth_headers())
+        metrics = request(
+            app,
+            "GET",
+            path="/metrics",
+            headers={"Authorization": "Bearer metrics-token"},
+        )
+    assert unauthorized.status_code == 401
+    server_timing = response.headers["Server-Timing"]
+    for name in (
+        "verify",
+        "gotrue.get_user",
+        "supabase.rpc",
+        "cloud_tasks.create_task",
+    ):
+        assert f"{name};dur=" in server_timing
+    assert server_timing.split(", ")[-1].startswith("total;dur=")
+    assert metrics.headers["Content-Type"].startswith("text/plain")
+    assert 'span="cloud_tasks.create_task"' in metrics.text
+
+    response = request(app, "POST", json=body, headers=auth_headers("user-2"))
+    assert "Server-Timing" not in response.headers
+
+
+def test_broken_channel_resets_async_client(campaign_service):
+    """Test that a closed channel is replaced on the next call, like the sync client."""
+    service = AsyncCampaignService(campaign_service, mock.Mock())
+    client = mock.Mock()
+    client.queue_path.return_value = "queues/q"
+    client.delete_task = mock.AsyncMock(
+        side_effect=grpc.aio.UsageError("Channel is closed.")
+    )
+    client.transport.close = mock.AsyncMock()
+    service._client = client
+    with pytest.raises(grpc.aio.UsageError):
+        asyncio.run(service.delete_task("task-1"))
+    assert service._client is None
+    client.transport.close.assert_awaited_once()
+
+
+def test_async_delete_logs_task_error_after_row_delete(campaign_service, caplog):
+    """Test that the async delete returns once the row is deleted, like the sync one."""
+    service = AsyncCampaignService(campaign_service, mock.Mock())
+    service.read_campaign = mock.AsyncMock(
+        return_value={"id": "campaign-1", "type": "instant", "cloud_task_id": None}
+    )
+    service.delete_task = mock.AsyncMock(side_effect=ValueError("test exception"))
+    supabase = mock.Mock()
+    supabase.delete = mock.AsyncMock(return_value=[{"id": "campaign-1"}])
+    deleted = asyncio.run(service.delete_campaign(supabase, {"id": "campaign-1"}))
+    assert deleted == [{"id": "campaign-1"}]
+    service.delete_task.assert_awaited()
+    assert "Error deleting tasks of deleted campaign campaign-1" in caplog.text
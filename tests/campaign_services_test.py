@@ -2,9 +2,11 @@ import os
 import json
 import datetime as dt
 import pytest
-import tenacity
 from unittest import mock
 from google.cloud import tasks_v2
+from google.api_core.exceptions import PermissionDenied, ServiceUnavailable
+from src.errors.verification_error import VerificationError
+from src.models.task_ref import TaskRef
 from src.services.campaign_service import CampaignService
 
 
@@ -33,7 +35,7 @@ def test_create_task_missing_env_variables(mock_env_vars, mock_client, mock_queu
     schedule_time = dt.datetime.now()
     mock_client.return_value.create_task.return_value = tasks_v2.types.task.Task()
     mock_queue_path.side_effect = ValueError("test exception")
-    with pytest.raises(tenacity.RetryError):
+    with pytest.raises(ValueError):
         campaign_service.create_task(payload, schedule_time)
     assert mock_client.return_value.create_task.called_once()
 
@@ -43,7 +45,9 @@ def test_create_task_retry(mock_env_vars, mock_client, mock_queue_path):
     campaign_service = CampaignService(mock_env_vars)
     payload = {"test": "test"}
     schedule_time = dt.datetime.now()
-    mock_client.return_value.create_task.side_effect = Exception("test exception")
+    mock_client.return_value.create_task.side_effect = ServiceUnavailable(
+        "test exception"
+    )
     mock_queue_path.return_value = "test-queue-path"
     with pytest.raises(Exception):
         campaign_service.create_task(payload, schedule_time)
@@ -56,10 +60,485 @@ def test_create_task_retry_success(mock_env_vars, mock_client, mock_queue_path):
     payload = {"test": "test"}
     schedule_time = dt.datetime.now()
     mock_client.return_value.create_task.side_effect = [
-        Exception("test exception"),
+        ServiceUnavailable("test exception"),
         tasks_v2.types.task.Task(),
     ]
     mock_queue_path.return_value = "test-queue-path"
     task = campaign_service.create_task(payload, schedule_time)
     assert isinstance(task, tasks_v2.types.task.Task)
     assert mock_client.return_value.create_task.call_count == 2
+
+
+def test_client_is_shared_between_calls(mock_env_vars, mock_client, mock_queue_path):
+    """Test that a single client and queue path are reused across task operations."""
+    campaign_service = CampaignService(mock_env_vars)
+    mock_client.return_value.create_task.return_value = tasks_v2.types.task.Task()
+    campaign_service.create_task({"test": "test"}, "task-1")
+    campaign_service.edit_task({"test": "test"}, "task-1")
+    campaign_service.delete_task("task-1")
+    assert mock_client.call_count == 1
+    assert mock_queue_path.call_count == 1
+    mock_client.return_value.delete_task.assert_called_with(
+        name="projects/my-project/locations/us-central1/queues/my-queue/tasks/task-1"
+    )
+
+
+def test_client_is_reset_when_channel_is_closed(
+    mock_env_vars, mock_client, mock_queue_path
+):
+    """Test that a closed channel is replaced by a new client on retry."""
+    campaign_service = CampaignService(mock_env_vars)
+    mock_client.return_value.create_task.side_effect = [
+        ValueError("Cannot invoke RPC on closed channel!"),
+        tasks_v2.types.task.Task(),
+    ]
+    campaign_service.create_task({"test": "test"}, "task-1")
+    assert mock_client.call_count == 2
+    mock_client.return_value.transport.close.assert_called_once()
+
+
+def instant_payload(**overrides):
+    payload = {
+        "id": "campaign-1",
+        "name": "Campaign",
+        "type": "instant",
+        "company_id": "company-1",
+        "audience_ids": ["user-1", "user-2"],
+        "questionnaire_ids": ["questionnaire-1"],
+    }
+    payload.update(overrides)
+    return payload
+
+
+def stored_campaign(campaign_service, **overrides):
+    """Returns a Supabase mock that reads the row of an instant campaign with its TaskRef."""
+    row = instant_payload(**overrides)
+    row["cloud_task_id"] = campaign_service.task_ref(row).to_str()
+    supabase = mock.Mock()
+    supabase.read.return_value = [row]
+    return supabase
+
+
+def test_edit_campaign_skips_unchanged_task(
+    mock_env_vars, mock_client, mock_queue_path
+):
+    """Test that an edit of descriptive fields does not touch Cloud Tasks."""
+    campaign_service = CampaignService(mock_env_vars)
+    supabase = stored_campaign(campaign_service)
+    campaign_service.edit_campaign(
+        supabase, {"id": "campaign-1", "description": "New description"}
+    )
+    supabase.update.assert_called_once()
+    assert "cloud_task_id" not in supabase.update.call_args.kwargs["data"]
+    mock_client.return_value.delete_task.assert_not_called()
+    mock_client.return_value.create_task.assert_not_called()
+
+
+def test_created_campaign_description_edit_keeps_tasks(
+    mock_env_vars, mock_client, mock_queue_path
+):
+    """Test that the fingerprint of a create matches the one of its stored row."""
+    campaign_service = CampaignService(mock_env_vars)
+    supabase = mock.Mock()
+    supabase.rpc.return_value = "campaign-1"
+    payload = campaign_payload(
+        type="instant",
+        next_run_time="2023-01-01T10:00:00+01:00",
+        audience_ids=["user-1", "user-2"],
+    )
+    campaign_service.create_campaign(supabase, payload)
+    mock_client.return_value.create_task.assert_called_once()
+    params = supabase.rpc.call_args.kwargs["params"]
+
+    # The row as Postgres returns it, with every column
+    row = {key[1:]: value for key, value in params.items()}
+    row.update(
+        id="campaign-1",
+        next_run_time="2023-01-01T09:00:00+00:00",
+        created_at="2023-01-01T08:00:00.123456+00:00",
+    )
+    supabase.read.return_value = [row]
+    mock_client.reset_mock()
+    campaign_service.edit_campaign(
+        supabase, {"id": "campaign-1", "description": "New description"}
+    )
+    assert mock_client.return_value.method_calls == []
+    assert "cloud_task_id" not in supabase.update.call_args.kwargs["data"]
+
+
+def test_edit_campaign_recreates_changed_task(
+    mock_env_vars, mock_client, mock_queue_path
+):
+    """Test that an edit of the audience re-creates the task and stores the new fingerprint."""
+    campaign_service = CampaignService(mock_env_vars)
+    supabase = stored_campaign(campaign_service)
+    stored_ref = supabase.read.return_value[0]["cloud_task_id"]
+    # The TaskRef is read from the row, the one of the payload is ignored
+    payload = {"id": "campaign-1", "audience_ids": ["user-3"], "cloud_task_id": "g=9"}
+    campaign_service.edit_campaign(supabase, payload)
+    mock_client.return_value.delete_task.assert_called_once()
+    assert mock_client.return_value.delete_task.call_args.kwargs["name"].endswith(
+        "/tasks/campaign-1"
+    )
+    mock_client.return_value.create_task.assert_called_once()
+    body = mock_client.return_value.create_task.call_args.kwargs["request"]["task"]
+    assert json.loads(body["http_request"]["body"])["name"] == "Campaign"
+    new_ref = supabase.update.call_args.kwargs["data"]["cloud_task_id"]
+    assert new_ref != stored_ref
+    row = {**supabase.read.return_value[0], **payload, "cloud_task_id": new_ref}
+    assert campaign_service.plan_edit(row, {"id": "campaign-1"}).action == "none"
+
+
+def test_edit_writes_task_ref_after_tasks(mock_env_vars, mock_client, mock_queue_path):
+    """Test that the new TaskRef is only written once the new task exists."""
+    campaign_service = CampaignService(mock_env_vars)
+    supabase = stored_campaign(campaign_service)
+    mock_client.return_value.create_task.side_effect = PermissionDenied("denied")
+    with pytest.raises(PermissionDenied):
+        campaign_service.edit_campaign(
+            supabase, {"id": "campaign-1", "audience_ids": ["user-3"]}
+        )
+    supabase.update.assert_not_called()
+    mock_client.return_value.delete_task.assert_not_called()
+
+
+def test_edit_campaign_deletes_new_tasks_when_row_update_fails(
+    mock_env_vars, mock_client, mock_queue_path
+):
+    campaign_service = CampaignService(mock_env_vars)
+    supabase = stored_campaign(campaign_service)
+    supabase.update.side_effect = Exception("test exception")
+    with mock.patch("time.time_ns", return_value=1_000_000_000):
+        with pytest.raises(Exception, match="test exception"):
+            campaign_service.edit_campaign(
+                supabase, {"id": "campaign-1", "audience_ids": ["user-3"]}
+            )
+    deleted = [
+        call.kwargs["name"].rsplit("/", 1)[1]
+        for call in mock_client.return_value.delete_task.call_args_list
+    ]
+    assert deleted == ["campaign-1-g1000"]
+
+
+def test_edit_recurring_campaign_skips_cloud_tasks(
+    mock_env_vars, mock_client, mock_queue_path
+):
+    """Test that campaigns without a task never call Cloud Tasks on edit."""
+    campaign_service = CampaignService(mock_env_vars)
+    supabase = mock.Mock()
+    supabase.read.return_value = [instant_payload(type="recurring")]
+    campaign_service.edit_campaign(supabase, instant_payload(type="recurring"))
+    mock_client.assert_not_called()
+
+
+def test_delete_campaign_deletes_stored_tasks(
+    mock_env_vars, mock_client, mock_queue_path
+):
+    """Test that a delete finds the current generation of the tasks from the stored row."""
+    campaign_service = CampaignService(mock_env_vars)
+    supabase = mock.Mock()
+    task_ref = TaskRef(fingerprint="f", generation=7)
+    supabase.read.return_value = [
+        {"id": "campaign-1", "type": "instant", "cloud_task_id": task_ref.to_str()}
+    ]
+    supabase.delete.return_value = [{"id": "campaign-1"}]
+    assert campaign_service.delete_campaign(supabase, {"id": "campaign-1"}) == [
+        {"id": "campaign-1"}
+    ]
+    name = mock_client.return_value.delete_task.call_args.kwargs["name"]
+    assert name.endswith("/tasks/campaign-1-g7")
+    mock_client.return_value.create_task.assert_not_called()
+
+
+def test_delete_campaign_keeps_tasks_if_row_delete_fails(
+    mock_env_vars, mock_client, mock_queue_path
+):
+    """Test that the tasks are only deleted once the row is deleted."""
+    campaign_service = CampaignService(mock_env_vars)
+    supabase = stored_campaign(campaign_service)
+    supabase.delete.side_effect = Exception("test exception")
+    with pytest.raises(Exception, match="test exception"):
+        campaign_service.delete_campaign(supabase, {"id": "campaign-1"})
+    mock_client.return_value.delete_task.assert_not_called()
+
+
+def test_delete_campaign_logs_task_error_after_row_delete(
+    mock_env_vars, mock_client, mock_queue_path, caplog
+):
+    """Test that a failed task delete after the row delete is logged, not raised."""
+    campaign_service = CampaignService(mock_env_vars)
+    supabase = stored_campaign(campaign_service)
+    supabase.delete.return_value = [{"id": "campaign-1"}]
+    mock_client.return_value.delete_task.side_effect = ValueError("test exception")
+    assert campaign_service.delete_campaign(supabase, {"id": "campaign-1"}) == [
+        {"id": "campaign-1"}
+    ]
+    assert "Error deleting tasks of deleted campaign campaign-1" in caplog.text
+
+
+def test_edit_campaign_concurrently_keeps_task_ref_on_task_error(
+    mock_env_vars, mock_client, mock_queue_path
+):
+    """Test that a failed task edit keeps the previous tasks and TaskRef of the campaign."""
+    campaign_service = CampaignService({**mock_env_vars, "CONCURRENT_LEGS": "true"})
+    mock_client.return_value.create_task.side_effect = ValueError("test exception")
+    supabase = stored_campaign(campaign_service)
+    with mock.patch("time.time_ns", return_value=1_000_000_000):
+        with pytest.raises(Exception):
+            campaign_service.edit_campaign(
+                supabase, {"id": "campaign-1", "audience_ids": ["user-3"]}
+            )
+    for call in supabase.update.call_args_list:
+        assert "cloud_task_id" not in call.kwargs["data"]
+    deleted = [
+        call.kwargs["name"].rsplit("/", 1)[1]
+        for call in mock_client.return_value.delete_task.call_args_list
+    ]
+    assert deleted == ["campaign-1-g1000"]
+
+
+def test_edit_campaign_concurrently_writes_task_ref_last(
+    mock_env_vars, mock_client, mock_queue_path
+):
+    campaign_service = CampaignService({**mock_env_vars, "CONCURRENT_LEGS": "true"})
+    supabase = stored_campaign(campaign_service)
+    campaign_service.edit_campaign(
+        supabase, {"id": "campaign-1", "audience_ids": ["user-3"]}
+    )
+    first, last = supabase.update.call_args_list
+    assert first.kwargs["data"] == {"id": "campaign-1", "audience_ids": ["user-3"]}
+    assert list(last.kwargs["data"]) == ["cloud_task_id"]
+    mock_client.return_value.delete_task.assert_called_once()
+
+
+def test_edit_retry_uses_new_task_names(mock_env_vars, mock_client, mock_queue_path):
+    """Test that the retry of a failed edit does not re-use the deleted task names."""
+    campaign_service = CampaignService({**mock_env_vars, "CONCURRENT_LEGS": "true"})
+    client = mock_client.return_value
+    names = []
+
+    def create_task(request):
+        names.append(request["task"]["name"])
+        if len(names) == 1:
+            raise PermissionDenied("test exception")
+        return tasks_v2.Task(name=request["task"]["name"])
+
+    client.create_task.side_effect = create_task
+    supabase = stored_campaign(campaign_service)
+    payload = {"id": "campaign-1", "audience_ids": ["user-3"]}
+    with pytest.raises(PermissionDenied):
+        campaign_service.edit_campaign(supabase, dict(payload))
+    campaign_service.edit_campaign(supabase, dict(payload))
+    assert len(names) == 2
+    assert names[0] != names[1]
+
+
+def test_edit_campaign_creates_next_generation_before_deleting(
+    mock_env_vars, mock_client, mock_queue_path
+):
+    """Test that an edit creates the tasks under a new name before deleting the previous ones."""
+    campaign_service = CampaignService(mock_env_vars)
+    client = mock_client.return_value
+    calls = []
+
+    def create_task(request):
+        calls.append(("create", request["task"]["name"].rsplit("/", 1)[1]))
+        return tasks_v2.Task(name=request["task"]["name"])
+
+    client.create_task.side_effect = create_task
+    client.delete_task.side_effect = lambda name: calls.append(
+        ("delete", name.rsplit("/", 1)[1])
+    )
+    supabase = stored_campaign(campaign_service)
+    with mock.patch("time.time_ns", return_value=1_000_000_000):
+        campaign_service.edit_campaign(
+            supabase, {"id": "campaign-1", "audience_ids": ["user-3"]}
+        )
+    assert calls == [("create", "campaign-1-g1000"), ("delete", "campaign-1")]
+
+    calls.clear()
+    stored_ref = supabase.update.call_args.kwargs["data"]["cloud_task_id"]
+    assert "g=1000" in stored_ref
+    supabase.read.return_value = [
+        instant_payload(audience_ids=["user-3"], cloud_task_id=stored_ref)
+    ]
+    with mock.patch("time.time_ns", return_value=2_000_000_000):
+        campaign_service.edit_campaign(
+            supabase, {"id": "campaign-1", "audience_ids": ["user-4"]}
+        )
+    assert calls == [("create", "campaign-1-g2000"), ("delete", "campaign-1-g1000")]
+
+
+def test_edit_campaign_skips_task_that_already_ran(
+    mock_env_vars, mock_client, mock_queue_path
+):
+    """Test that an edit does not create a task if the previous one no longer exists."""
+    from google.api_core.exceptions import NotFound
+
+    campaign_service = CampaignService(mock_env_vars)
+    mock_client.return_value.get_task.side_effect = NotFound("missing")
+    supabase = stored_campaign(campaign_service)
+    campaign_service.edit_campaign(
+        supabase, {"id": "campaign-1", "audience_ids": ["user-3"]}
+    )
+    mock_client.return_value.create_task.assert_not_called()
+    # The new fingerprint is still stored
+    assert supabase.update.call_args.kwargs["data"]["cloud_task_id"]
+
+
+def test_execute_batch_reports_every_item(mock_env_vars, mock_client, mock_queue_path):
+    """Test that a batch runs every item and reports per-item errors."""
+    campaign_service = CampaignService(mock_env_vars)
+    supabase = mock.Mock()
+    supabase.read.return_value = [{"type": "recurring"}]
+    supabase.delete.side_effect = [Exception("test exception"), None]
+    response = campaign_service.action_dispatcher("batch")(
+        supabase=supabase,
+        payload={
+            "items": [
+                {
+                    "action_type": "delete_campaign",
+                    "payload": {"id": "1", "type": "recurring"},
+                },
+                {
+                    "action_type": "delete_campaign",
+                    "payload": {"id": "2", "type": "recurring"},
+                },
+                {"action_type": "unknown", "payload": {}},
+            ]
+        },
+    )
+    assert response["succeeded"] == 1
+    assert response["failed"] == 2
+    assert [result["index"] for result in response["results"]] == [0, 1, 2]
+    assert {result["status"] for result in response["results"][:2]} == {"ok", "error"}
+    errors = [result for result in response["results"] if result["status"] == "error"]
+    assert errors[0]["message"] == "Internal server error"
+    assert "test exception" not in str(response)
+    assert response["results"][2]["message"] == "Invalid action type: unknown"
+
+
+def campaign_payload(**overrides):
+    payload = {
+        "name": "Campaign",
+        "count": 0,
+        "threshold": 5,
+        "status": "active",
+        "company_id": "company-1",
+        "created_by": "user-1",
+        "next_run_time": "2023-01-01T09:00:00+00:00",
+        "type": "recurring",
+    }
+    payload.update(overrides)
+    return payload
+
+
+def test_create_campaigns_in_chunks(mock_env_vars, mock_client, mock_queue_path):
+    """Test that campaigns are written in chunks and instant ones get a task."""
+    campaign_service = CampaignService({**mock_env_vars, "BULK_CHUNK_SIZE": "2"})
+    supabase = mock.Mock()
+    supabase.rpc.side_effect = lambda url, params: [
+        f"id-{p['_name']}" for p in params["_campaigns"]
+    ]
+    campaigns = [campaign_payload(name=str(i)) for i in range(4)]
+    campaigns.append(campaign_payload(name="4", type="instant"))
+    response = campaign_service.create_campaigns(supabase, {"campaigns": campaigns})
+
+    assert response == {
+        "ids": [f"id-{i}" for i in range(5)],
+        "failed_chunks": [],
+        "failed_task_ids": [],
+    }
+    assert supabase.rpc.call_count == 3
+    assert supabase.rpc.call_args.kwargs["url"] == "rest/v1/rpc/create_campaigns"
+    mock_client.return_value.create_task.assert_called_once()
+
+
+def test_create_campaigns_reports_failed_chunks(
+    mock_env_vars, mock_client, mock_queue_path
+):
+    """Test that the ids of the committed chunks are returned with the failed chunks."""
+    campaign_service = CampaignService({**mock_env_vars, "BULK_CHUNK_SIZE": "2"})
+    supabase = mock.Mock()
+    supabase.rpc.side_effect = [["id-0", "id-1"], Exception("timeout"), ["id-4"]]
+    campaigns = [campaign_payload(name=str(i)) for i in range(4)]
+    campaigns.append(campaign_payload(name="4", type="instant"))
+    response = campaign_service.create_campaigns(supabase, {"campaigns": campaigns})
+
+    assert response["ids"] == ["id-0", "id-1", None, None, "id-4"]
+    assert response["failed_chunks"] == [
+        {"start": 2, "count": 2, "message": "Internal server error"}
+    ]
+    mock_client.return_value.create_task.assert_called_once()
+
+    # A request without any committed chunk fails as a whole
+    supabase.rpc.side_effect = Exception("timeout")
+    with pytest.raises(Exception, match="timeout"):
+        campaign_service.create_campaigns(
+            supabase, {"campaigns": [campaign_payload(), campaign_payload()]}
+        )
+
+
+def test_create_campaigns_validates_before_writing(mock_env_vars):
+    """Test that an invalid campaign rejects the whole request before any write."""
+    campaign_service = CampaignService(mock_env_vars)
+    supabase = mock.Mock()
+    with pytest.raises(VerificationError, match="index 1"):
+        campaign_service.create_campaigns(
+            supabase, {"campaigns": [campaign_payload(), {"name": "invalid"}]}
+        )
+    supabase.rpc.assert_not_called()
+
+
+def test_create_campaign_fans_out_large_audience(
+    mock_env_vars, mock_client, mock_queue_path
+):
+    """Test that a large audience is split into one task per chunk."""
+    campaign_service = CampaignService({**mock_env_vars, "AUDIENCE_CHUNK_SIZE": "2"})
+    supabase = mock.Mock()
+    supabase.rpc.return_value = "campaign-1"
+    payload = campaign_payload(
+        type="instant", audience_ids=["user-1", "user-2", "user-3", "user-4", "user-5"]
+    )
+    campaign_service.create_campaign(supabase, payload)
+
+    assert "c=3" in supabase.rpc.call_args.kwargs["params"]["_cloud_task_id"]
+    requests = [
+        call.kwargs["request"]
+        for call in mock_client.return_value.create_task.call_args_list
+    ]
+    names = sorted(request["task"]["name"].rsplit("/", 1)[1] for request in requests)
+    assert names == ["campaign-1-0", "campaign-1-1", "campaign-1-2"]
+    bodies = [
+        json.loads(request["task"]["http_request"]["body"]) for request in requests
+    ]
+    assert sorted(len(body["audience_ids"]) for body in bodies) == [1, 2, 2]
+    assert {body["chunks"] for body in bodies} == {3}
+
+
+def test_edit_and_delete_operate_on_task_family(
+    mock_env_vars, mock_client, mock_queue_path
+):
+    """Test that edits replace and deletes remove every chunk task of a campaign."""
+    campaign_service = CampaignService({**mock_env_vars, "AUDIENCE_CHUNK_SIZE": "2"})
+    audience_ids = ["user-1", "user-2", "user-3"]
+    supabase = stored_campaign(campaign_service, audience_ids=audience_ids)
+    task_ref = TaskRef.parse(supabase.read.return_value[0]["cloud_task_id"])
+    assert task_ref.task_names("campaign-1") == ["campaign-1-0", "campaign-1-1"]
+
+    payload = {"id": "campaign-1", "audience_ids": audience_ids + ["user-4", "user-5"]}
+    with mock.patch("time.time_ns", return_value=1_000_000_000):
+        campaign_service.edit_campaign(supabase, payload)
+    assert mock_client.return_value.delete_task.call_count == 2
+    assert mock_client.return_value.create_task.call_count == 3
+    stored_ref = supabase.update.call_args.kwargs["data"]["cloud_task_id"]
+    assert "c=3" in stored_ref
+
+    mock_client.return_value.delete_task.reset_mock()
+    supabase.read.return_value = [{"type": "instant", "cloud_task_id": stored_ref}]
+    campaign_service.delete_campaign(supabase, {"id": "campaign-1"})
+    deleted = sorted(
+        call.kwargs["name"].rsplit("/", 1)[1]
+        for call in mock_client.return_value.delete_task.call_args_list
+    )
+    assert deleted == ["campaign-1-g1000-0", "campaign-1-g1000-1", "campaign-1-g1000-2"]
@@ -0,0 +1,78 @@
+import datetime as dt
+import pytest
+from unittest import mock
+from src.errors.verification_error import VerificationError
+from src.models.campaign import Campaign
+from src.services.campaign_service import CampaignService
+
+
+def campaign_payload(**overrides):
+    payload = {
+        "name": "Campaign",
+        "count": 0,
+        "threshold": 5,
+        "status": "active",
+        "company_id": "company-1",
+        "created_by": "user-1",
+        "next_run_time": "2023-01-01T09:00:00+00:00",
+        "type": "recurring",
+    }
+    payload.update(overrides)
+    return payload
+
+
+def test_campaign_is_parsed_and_encoded_without_copies():
+    payload = campaign_payload(
+        next_run_time="2023-01-01T09:00:00Z",
+        time_of_day="09:30:00",
+        audience_ids=[f"user-{i}" for i in range(1000)],
+    )
+    campaign = Campaign.from_payload(payload)
+    assert not hasattr(campaign, "__dict__")
+    assert campaign.next_run_time == dt.datetime(2023, 1, 1, 9, tzinfo=dt.timezone.utc)
+    assert campaign.time_of_day == dt.time(9, 30)
+
+    params = campaign.to_rpc_params()
+    assert params["_next_run_time"] == "2023-01-01T09:00:00+00:00"
+    assert params["_time_of_day"] == "09:30:00"
+    assert params["_audience_ids"] is payload["audience_ids"]
+    assert params["_end_date"] is None
+    assert list(campaign.to_row())[:2] == ["name", "count"]
+
+
+@pytest.mark.parametrize(
+    "overrides, message",
+    [
+        ({"count": "0"}, "Invalid campaign field 'count': expected an integer"),
+        ({"count": True}, "Invalid campaign field 'count'"),
+        ({"next_run_time": "tomorrow"}, "expected an ISO 8601 timestamp"),
+        ({"audience_ids": ["user-1", 2]}, "expected a list of strings"),
+        ({"name": None}, "Missing campaign field 'name'"),
+        ({"unknown": 1}, "Unknown campaign fields: unknown"),
+        ({"cloud_task_id": "fp;1;1;q;1;0"}, "'cloud_task_id' is set by the server"),
+    ],
+)
+def test_invalid_campaign_is_rejected(overrides, message):
+    with pytest.raises(VerificationError, match=message):
+        Campaign.from_payload(campaign_payload(**overrides))
+
+
+def test_invalid_campaign_is_rejected_before_any_call(mock_env_vars):
+    campaign_service = CampaignService(mock_env_vars)
+    supabase = mock.Mock()
+    with pytest.raises(VerificationError):
+        campaign_service.create_campaign(
+            supabase, campaign_payload(type="instant", threshold="5")
+        )
+    supabase.rpc.assert_not_called()
+
+
+def test_create_rejects_client_task_ref(mock_env_vars):
+    campaign_service = CampaignService(mock_env_vars)
+    supabase = mock.Mock()
+    with pytest.raises(VerificationError, match="cloud_task_id"):
+        campaign_service.create_campaigns(
+            supabase,
+            {"campaigns": [campaign_payload(type="recurring", cloud_task_id="fp")]},
+        )
+    supabase.rpc.assert_not_called()
@@ -0,0 +1,65 @@
+import pytest
+from google.api_core.exceptions import AlreadyExists, NotFound
+import asyncio
+from benchmarks.fakes import FakeAsyncCloudTasks, FakeCloudTasks, FakeCloudTasksServer
+from benchmarks.harness import bench, compare, parse_mix
+
+
+def test_parse_mix():
+    assert parse_mix("create=2,delete=2") == {"create": 0.5, "delete": 0.5}
+    with pytest.raises(ValueError):
+        parse_mix("update=1")
+
+
+def test_fake_cloud_tasks_server_errors_reach_the_client():
+    with FakeCloudTasksServer() as server:
+        client = server.client()
+        name = f"{client.queue_path('p', 'l', 'q')}/tasks/campaign-1"
+        task = {"name": name, "http_request": {"url": "http://127.0.0.1"}}
+        client.create_task(request={"parent": name.split("/tasks/")[0], "task": task})
+        with pytest.raises(AlreadyExists):
+            client.create_task(
+                request={"parent": name.split("/tasks/")[0], "task": task}
+            )
+        assert client.get_task(request={"name": name}).name == name
+        client.delete_task(name=name)
+        with pytest.raises(NotFound):
+            client.delete_task(name=name)
+        # The name of a deleted task is tombstoned, as in Cloud Tasks
+        with pytest.raises(AlreadyExists):
+            client.create_task(
+                request={"parent": name.split("/tasks/")[0], "task": task}
+            )
+
+
+def test_fake_cloud_tasks_tombstones_expire():
+    fake = FakeCloudTasks(tombstone_seconds=0)
+    task = {"name": "queue/tasks/campaign-1"}
+    fake.create_task({"task": task})
+    fake.delete_task(name=task["name"])
+    fake.create_task({"task": task})
+
+    fake.tombstone_seconds = 3600
+    async_fake = FakeAsyncCloudTasks(fake)
+    asyncio.run(async_fake.delete_task(name=task["name"]))
+    with pytest.raises(AlreadyExists):
+        asyncio.run(async_fake.create_task({"task": task}))
+
+
+def test_bench_reports_every_action():
+    report = bench(
+        requests=20,
+        concurrency=4,
+        mix=parse_mix("create=1,edit=1,delete=1"),
+        supabase_latency=0,
+        gotrue_latency=0,
+        tasks_latency=0,
+    )
+    assert report["total"]["count"] == 20
+    assert report["total"]["errors"] == 0
+    assert set(report["actions"]) == {"create", "edit", "delete"}
+    for summary in report["actions"].values():
+        assert summary["p50_ms"] <= summary["p95_ms"] <= summary["p99_ms"]
+
+    changes = compare(report, report)
+    assert changes["total"]["p99_ms"] == 0
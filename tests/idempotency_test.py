@@ -0,0 +1,129 @@
+# tests/idempotency_test.py
+import time
+import asyncio
+import threading
+import pytest
+from unittest import mock
+
+from src.utils.idempotency import (
+    IdempotencyKeyReuseError,
+    IdempotencyStore,
+    IdempotencyTimeoutError,
+    derive_idempotency_key,
+)
+
+
+def test_derive_idempotency_key_is_stable():
+    key = derive_idempotency_key("create_campaign", {"a": 1, "b": [1, 2]}, "user_id")
+    assert key == derive_idempotency_key(
+        "create_campaign", {"b": [1, 2], "a": 1}, "user_id"
+    )
+    assert key != derive_idempotency_key("create_campaign", {"a": 1}, "user_id")
+    assert key != derive_idempotency_key("create_campaign", {"a": 1, "b": [1, 2]})
+
+
+def test_run_replays_stored_result():
+    store = IdempotencyStore(ttl=300)
+    func = mock.Mock(return_value="campaign_id")
+    assert store.run("key", func) == ("campaign_id", False)
+    assert store.run("key", func) == ("campaign_id", True)
+    func.assert_called_once()
+
+
+def test_run_does_not_store_errors():
+    store = IdempotencyStore(ttl=300)
+    func = mock.Mock(side_effect=[Exception("test exception"), "campaign_id"])
+    with pytest.raises(Exception):
+        store.run("key", func)
+    assert store.run("key", func) == ("campaign_id", False)
+
+
+def test_concurrent_duplicates_wait_on_first_call():
+    store = IdempotencyStore(ttl=300)
+    calls = []
+
+    def create_campaign():
+        calls.append(1)
+        time.sleep(0.1)
+        return "campaign_id"
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(store.run("key", create_campaign))
+        )
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(results) == [("campaign_id", False)] + [("campaign_id", True)] * 4
+
+
+def test_concurrent_async_duplicates_wait_on_first_call():
+    store = IdempotencyStore(ttl=300)
+    calls = []
+
+    async def create_campaign():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "campaign_id"
+
+    async def run_all():
+        return await asyncio.gather(
+            *(store.run_async("key", create_campaign) for _ in range(5))
+        )
+
+    results = asyncio.run(run_all())
+    assert len(calls) == 1
+    assert sorted(results) == [("campaign_id", False)] + [("campaign_id", True)] * 4
+
+
+def test_duplicate_times_out_waiting():
+    store = IdempotencyStore(ttl=300, wait_timeout=0.05)
+    started = threading.Event()
+
+    def slow():
+        started.set()
+        time.sleep(0.2)
+        return "campaign_id"
+
+    thread = threading.Thread(target=store.run, args=("key", slow))
+    thread.start()
+    started.wait()
+    with pytest.raises(IdempotencyTimeoutError):
+        store.run("key", slow)
+    thread.join()
+
+
+def test_shared_backend_is_used():
+    backend = mock.Mock()
+    backend.get.return_value = {"fingerprint": "", "result": "stored_id"}
+    store = IdempotencyStore(ttl=300, backend=backend)
+    func = mock.Mock()
+    assert store.run("key", func) == ("stored_id", True)
+    func.assert_not_called()
+
+    backend.get.return_value = None
+    func.return_value = "campaign_id"
+    assert store.run("other_key", func) == ("campaign_id", False)
+    backend.set.assert_called_once_with(
+        "other_key", {"fingerprint": "", "result": "campaign_id"}, 300
+    )
+
+
+def test_reused_key_with_other_fingerprint_is_rejected():
+    store = IdempotencyStore(ttl=300)
+    assert store.run("key", lambda: "campaign_id", "request-1") == (
+        "campaign_id",
+        False,
+    )
+    assert store.run("key", lambda: "other_id", "request-1") == ("campaign_id", True)
+    with pytest.raises(IdempotencyKeyReuseError):
+        store.run("key", lambda: "other_id", "request-2")
+    with pytest.raises(IdempotencyKeyReuseError):
+        asyncio.run(store.run_async("key", mock.AsyncMock(), "request-2"))
+    assert store.replays == 1
@@ -0,0 +1,117 @@
+# tests/jwt_verifier_test.py
+import json
+import base64
+import datetime
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest.mock import patch
+import jwt
+import pytest
+
+from src.services.user_services import AdminUserService
+from src.utils.jwt_verifier import JWTVerifier
+
+JWKS_SECRET = b"jwks-secret-with-enough-bytes-for-hs256"
+
+
+@pytest.fixture
+def key_server():
+    """A local fake JWKS endpoint serving a single symmetric key."""
+    jwks = {
+        "keys": [
+            {
+                "kty": "oct",
+                "kid": "key-1",
+                "alg": "HS256",
+                "use": "sig",
+                "k": base64.urlsafe_b64encode(JWKS_SECRET).rstrip(b"=").decode(),
+            }
+        ]
+    }
+    requests_served = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests_served.append(self.path)
+            body = json.dumps(jwks).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.requests_served = requests_served
+    server.url = f"http://127.0.0.1:{server.server_port}/auth/v1/.well-known/jwks.json"
+    yield server
+    server.shutdown()
+
+
+def make_token(claims, key=JWKS_SECRET, kid="key-1"):
+    exp = datetime.datetime.utcnow().timestamp() + 100
+    return jwt.encode(
+        {"sub": "user_id", "exp": exp, **claims},
+        key,
+        algorithm="HS256",
+        headers={"kid": kid},
+    )
+
+
+def make_service(verifier, remote_fallback=True):
+    return AdminUserService(
+        base_url="https://example.com",
+        anon_key="anon_key",
+        service_key="service_key",
+        jwt_verifier=verifier,
+        remote_fallback=remote_fallback,
+    )
+
+
+@patch("requests.Session.get")
+def test_verify_user_with_jwks_skips_remote_lookup(mock_get, key_server):
+    verifier = JWTVerifier(jwks_url=key_server.url, jwks_algorithms=["HS256"])
+    service = make_service(verifier)
+    token = make_token({"app_metadata": {"role": "super_admin"}})
+
+    assert service.verify_user(token) == {"role": "super_admin"}
+    assert service.verify_user(token) == {"role": "super_admin"}
+    mock_get.assert_not_called()
+    assert len(key_server.requests_served) == 1
+
+
+@patch("requests.Session.get")
+def test_verify_user_rejects_bad_signature(mock_get, key_server):
+    verifier = JWTVerifier(jwks_url=key_server.url, jwks_algorithms=["HS256"])
+    service = make_service(verifier)
+    token = make_token({"app_metadata": {"role": "super_admin"}}, key=b"forged" * 8)
+
+    assert service.verify_user(token) == {"error": "Invalid JWT"}
+    mock_get.assert_not_called()
+
+
+def test_verify_user_with_secret_rejects_non_admin():
+    service = make_service(JWTVerifier(jwt_secret="secret"))
+    token = make_token({"app_metadata": {"role": "admin"}}, key="secret")
+    assert service.verify_user(token) == {"error": "User is not a super admin"}
+
+
+@patch("requests.Session.get")
+def test_verify_user_falls_back_to_remote_lookup(mock_get):
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.json.return_value = {
+        "app_metadata": {"role": "super_admin"},
+    }
+    token = make_token({}, key="secret")
+
+    service = make_service(JWTVerifier(jwt_secret="secret"))
+    assert service.verify_user(token) == {"role": "super_admin"}
+    assert mock_get.call_count == 1
+
+    service = make_service(JWTVerifier(jwt_secret="secret"), remote_fallback=False)
+    assert service.verify_user(token) == {"error": "User does not have app metadata"}
+    assert mock_get.call_count == 1
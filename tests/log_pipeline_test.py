@@ -0,0 +1,91 @@
+import io
+import atexit
+import queue
+import logging
+import datetime as dt
+from src.models.campaign import Campaign
+from src.utils.log_pipeline import (
+    BackgroundQueueHandler,
+    SamplingFilter,
+    configure_logging,
+    parse_sample_rates,
+    redact,
+)
+
+
+def make_logger(name):
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+    logger.addHandler(handler)
+    return logger, stream
+
+
+def test_large_collections_are_summarized():
+    payload = {"name": "Campaign", "audience_ids": [f"user-{i}" for i in range(500)]}
+    redacted = redact(payload, max_items=20, max_chars=10)
+    summary = repr(redacted["audience_ids"])
+    assert summary.startswith("<list of 500 items sha256:")
+    assert summary == repr(redact(payload, 20, 10)["audience_ids"])
+    assert redacted["name"] == "Campaign"
+    assert redact("x" * 30, 20, 10) == "xxxxxxxxxx...<30 chars>"
+    assert redact(payload, 0, 0) == payload
+
+    campaign = Campaign(
+        name="Campaign",
+        count=0,
+        threshold=5,
+        status="active",
+        company_id="company-1",
+        created_by="user-1",
+        next_run_time=dt.datetime(2023, 1, 1),
+        audience_ids=payload["audience_ids"],
+    )
+    text = repr(redact(campaign, 20, 1000))
+    assert text.startswith("Campaign(name='Campaign'")
+    assert "audience_ids=<list of 500 items sha256:" in text
+
+
+def test_sampling_keeps_warnings():
+    sampling = SamplingFilter(parse_sample_rates("src.services=0, main=1"))
+    record = logging.LogRecord(
+        "src.services.campaign_service", logging.INFO, "", 0, "msg", None, None
+    )
+    assert not sampling.filter(record)
+    record.levelno = logging.WARNING
+    assert sampling.filter(record)
+    record = logging.LogRecord("main", logging.INFO, "", 0, "msg", None, None)
+    assert sampling.filter(record)
+
+
+def test_records_are_written_by_the_listener():
+    logger, stream = make_logger("log_pipeline_test.listener")
+    assert configure_logging({}, logger) is None
+
+    listener = configure_logging(
+        {"ASYNC_LOGGING": "true", "LOG_MAX_ITEMS": "3"}, logger
+    )
+    assert isinstance(logger.handlers[0], BackgroundQueueHandler)
+    payload = {"audience_ids": ["a", "b", "c", "d"]}
+    logger.info("Received request with payload: %s", payload)
+    # Changing the payload after the call does not change the record
+    payload["id"] = "campaign-1"
+    atexit.unregister(listener.stop)
+    listener.stop()
+
+    output = stream.getvalue()
+    assert output.startswith(
+        "INFO Received request with payload: {'audience_ids': <list"
+    )
+    assert "campaign-1" not in output
+
+
+def test_records_are_dropped_when_the_queue_is_full():
+    handler = BackgroundQueueHandler(queue.Queue(maxsize=1))
+    record = logging.LogRecord("main", logging.INFO, "", 0, "msg", None, None)
+    handler.handle(record)
+    handler.handle(record)
+    assert handler.dropped == 1
@@ -1,5 +1,84 @@
 #  tests/main_test.py
+import jwt
+import time
 import pytest
-import main_
+import main
 
 from unittest.mock import patch, Mock
+from src.errors.verification_error import VerificationError
+
+
+def test_verify_batch_payload():
+    main.verify_batch_payload(
+        {
+            "items": [
+                {"action_type": "create_campaign", "payload": {"name": "test"}},
+                {"action_type": "delete_campaign", "payload": {"id": "test"}},
+            ]
+        }
+    )
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        {},
+        {"items": []},
+        {"items": [{"action_type": "batch", "payload": {}}]},
+        {"items": [{"action_type": "create_campaign"}]},
+        {"items": [{"action_type": "create_campaign", "payload": {}}] * 501},
+    ],
+)
+def test_verify_batch_payload_invalid(payload):
+    with pytest.raises(VerificationError):
+        main.verify_batch_payload(payload)
+
+
+def test_scheduler_actions_are_only_run_by_scheduler_subjects():
+    token = jwt.encode({"sub": "scheduler", "exp": time.time() + 600}, "secret")
+    other = jwt.encode({"sub": "user-1", "exp": time.time() + 600}, "secret")
+    with patch.dict(main.env_vars, {"SCHEDULER_SUBJECTS": "scheduler, other"}):
+        main.verify_scheduler_caller("drain_task_outbox", token)
+        main.verify_scheduler_caller("create_campaign", other)
+        with pytest.raises(VerificationError, match="not allowed"):
+            main.verify_scheduler_caller("drain_task_outbox", other)
+    with patch.dict(main.env_vars, {"SCHEDULER_SUBJECTS": None}):
+        with pytest.raises(VerificationError):
+            main.verify_scheduler_caller("reconcile_tasks", token)
+
+
+def test_scheduler_actions_are_not_replayed():
+    headers = {"Authorization": "Bearer token", "Idempotency-Key": "key"}
+    assert main.derive_request_key(headers, "schedule_recurring_campaigns", {}) is None
+
+
+def test_only_creates_derive_an_idempotency_key():
+    token = jwt.encode({"sub": "user-1", "exp": time.time() + 600}, "secret")
+    headers = {"Authorization": f"Bearer {token}"}
+    payload = {"id": "campaign-1", "name": "Campaign"}
+    assert main.derive_request_key(headers, "create_campaign", payload)
+    assert main.derive_request_key(headers, "edit_campaign", payload) is None
+    assert main.derive_request_key(headers, "delete_campaign", payload) is None
+    headers["Idempotency-Key"] = "key"
+    assert main.derive_request_key(headers, "edit_campaign", payload) == (
+        main.derive_request_key(headers, "delete_campaign", {})
+    )
+
+
+def test_reused_idempotency_key_is_rejected():
+    error = main.IdempotencyKeyReuseError("reused")
+    assert main.error_response(error) == (422, {"message": "reused"}, {})
+
+
+def test_request_payload_is_not_logged_at_info(caplog):
+    payload = {"name": "Campaign", "audience_ids": [f"user-{i}" for i in range(50)]}
+    data = {"queue_name": "q", "action_type": "create_campaign", "payload": payload}
+    with caplog.at_level("INFO", logger="main"):
+        main.parse_request_data(data)
+    assert "Received create_campaign request for queue q" in caplog.text
+    assert "user-1" not in caplog.text
+    caplog.clear()
+    with caplog.at_level("DEBUG", logger="main"):
+        main.parse_request_data(data)
+    assert "<list of 50 items" in caplog.text
+    assert "user-1" not in caplog.text
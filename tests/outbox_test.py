@@ -0,0 +1,136 @@
+import pytest
+from unittest import mock
+from google.api_core.exceptions import ServiceUnavailable
+from benchmarks.fakes import FakeCloudTasks, FakePostgREST, PostgRESTClient
+from src.models.task_ref import TaskRef
+from src.services.campaign_service import CampaignService
+from src.services.outbox_service import OutboxDrainer
+
+
+def instant_campaign():
+    return {
+        "name": "Campaign",
+        "count": 0,
+        "threshold": 5,
+        "status": "active",
+        "company_id": "company-1",
+        "created_by": "user-1",
+        "next_run_time": "2023-01-01T09:00:00+00:00",
+        "type": "instant",
+    }
+
+
+@pytest.fixture
+def postgrest():
+    with FakePostgREST(latency=0, row_latency=0) as postgrest:
+        yield postgrest
+
+
+@pytest.fixture
+def cloud_tasks():
+    return FakeCloudTasks()
+
+
+@pytest.fixture
+def campaign_service(mock_env_vars, cloud_tasks):
+    with mock.patch("google.cloud.tasks_v2.CloudTasksClient", return_value=cloud_tasks):
+        service = CampaignService({**mock_env_vars, "TASK_OUTBOX": "true"})
+        service.guards["cloud_tasks"].backoff = 0
+        yield service
+
+
+def test_create_records_intent_and_drain_creates_task(
+    postgrest, cloud_tasks, campaign_service
+):
+    """Test that a create commits an intent and the drain creates the task."""
+    supabase = PostgRESTClient(postgrest.url)
+    campaign_id = campaign_service.create_campaign(supabase, instant_campaign())
+
+    assert campaign_id in postgrest.rows
+    assert cloud_tasks.tasks == {}
+    [intent] = postgrest.outbox.values()
+    assert intent["action"] == "create"
+    assert intent["status"] == "pending"
+
+    report = campaign_service.drain_task_outbox(supabase, {})
+
+    assert report == {"claimed": 1, "done": 1, "retried": 0, "failed": 0}
+    assert [name.rsplit("/", 1)[-1] for name in cloud_tasks.tasks] == [campaign_id]
+    assert intent["status"] == "done"
+    assert intent["processed_at"] is not None
+    assert campaign_service.drain_task_outbox(supabase, {})["claimed"] == 0
+
+
+def test_delete_intent_deletes_task(postgrest, cloud_tasks, campaign_service):
+    """Test that a delete commits an intent and the drain deletes the task."""
+    supabase = PostgRESTClient(postgrest.url)
+    campaign_id = campaign_service.create_campaign(supabase, instant_campaign())
+    campaign_service.drain_task_outbox(supabase, {})
+
+    campaign_service.delete_campaign(supabase, {"id": campaign_id})
+
+    assert campaign_id not in postgrest.rows
+    assert len(cloud_tasks.tasks) == 1
+    report = campaign_service.drain_task_outbox(supabase, {})
+    assert report["done"] == 1
+    assert cloud_tasks.tasks == {}
+
+
+def test_failed_intent_is_retried(postgrest, cloud_tasks, campaign_service):
+    """Test that a failed intent is released, retried and given up on."""
+    supabase = PostgRESTClient(postgrest.url)
+    campaign_service.create_campaign(supabase, instant_campaign())
+    cloud_tasks.faults = iter([ServiceUnavailable("down")] * 3)
+    drainer = OutboxDrainer(campaign_service, max_attempts=2)
+    campaign_service.guards["cloud_tasks"].max_attempts = 1
+
+    assert drainer.drain(supabase)["retried"] == 1
+    [intent] = postgrest.outbox.values()
+    assert intent["status"] == "pending"
+    assert "down" in intent["last_error"]
+
+    assert drainer.drain(supabase)["failed"] == 1
+    assert intent["status"] == "failed"
+    assert cloud_tasks.tasks == {}
+
+
+def test_replace_intent_creates_next_generation(
+    postgrest, cloud_tasks, campaign_service
+):
+    """Test that the drain of an edit creates the new task and deletes the previous one."""
+    supabase = PostgRESTClient(postgrest.url)
+    campaign_id = campaign_service.create_campaign(supabase, instant_campaign())
+    campaign_service.drain_task_outbox(supabase, {})
+
+    campaign_service.edit_campaign(
+        supabase,
+        {
+            **postgrest.rows[campaign_id],
+            "id": campaign_id,
+            "audience_ids": ["user-1"],
+        },
+    )
+    assert campaign_service.drain_task_outbox(supabase, {})["done"] == 1
+    names = [name.rsplit("/", 1)[-1] for name in cloud_tasks.tasks]
+    task_ref = TaskRef.parse(postgrest.rows[campaign_id]["cloud_task_id"])
+    assert task_ref.generation
+    assert names == task_ref.task_names(campaign_id)
+
+
+def test_delete_intent_deletes_run_tasks(postgrest, cloud_tasks, campaign_service):
+    """Test that the delete of a recurring campaign deletes the runs of its stored TaskRef."""
+    supabase = PostgRESTClient(postgrest.url)
+    campaign_id = "00000000-0000-0000-0000-000000000001"
+    task_ref = TaskRef(fingerprint="f", runs=(0, 1))
+    postgrest.rows[campaign_id] = {
+        **instant_campaign(),
+        "id": campaign_id,
+        "type": "recurring",
+        "cloud_task_id": task_ref.to_str(),
+    }
+    for task_name in task_ref.run_task_names(campaign_id):
+        campaign_service.create_task({"id": campaign_id}, task_name)
+
+    campaign_service.delete_campaign(supabase, {"id": campaign_id})
+    assert campaign_service.drain_task_outbox(supabase, {})["done"] == 1
+    assert cloud_tasks.tasks == {}
@@ -0,0 +1,108 @@
+from collections import Counter
+from unittest import mock
+from src.models.task_ref import TaskRef
+from src.services.campaign_service import CampaignService
+from src.utils.queue_shards import parse_queue_names, shard_queue
+
+QUEUES = ["queue-0", "queue-1", "queue-2", "queue-3"]
+
+
+def test_shard_queue_is_stable_and_balanced():
+    """Test that keys always map to the same queue and spread over all queues."""
+    counts = Counter(shard_queue(f"campaign-{i}", QUEUES) for i in range(4000))
+    assert set(counts) == set(QUEUES)
+    assert min(counts.values()) > 800
+    assert shard_queue("campaign-1", QUEUES) == shard_queue("campaign-1", QUEUES)
+
+
+def test_adding_a_queue_only_moves_keys_to_it():
+    keys = [f"campaign-{i}" for i in range(1000)]
+    before = {key: shard_queue(key, QUEUES) for key in keys}
+    after = {key: shard_queue(key, QUEUES + ["queue-4"]) for key in keys}
+    assert all(after[key] in (before[key], "queue-4") for key in keys)
+
+
+def test_parse_queue_names():
+    assert parse_queue_names(" a, b ,,c") == ["a", "b", "c"]
+    assert parse_queue_names(None) == []
+
+
+def sharded_service(mock_env_vars, **env_vars):
+    return CampaignService(
+        {**mock_env_vars, "QUEUE_NAMES": ",".join(QUEUES), **env_vars}
+    )
+
+
+def instant_campaign():
+    return {
+        "name": "Campaign",
+        "count": 0,
+        "threshold": 5,
+        "status": "active",
+        "company_id": "company-1",
+        "created_by": "user-1",
+        "next_run_time": "2023-01-01T09:00:00+00:00",
+        "type": "instant",
+    }
+
+
+def created_queue(mock_client):
+    request = mock_client.return_value.create_task.call_args.kwargs["request"]
+    return request["task"]["name"].split("/tasks/")[0]
+
+
+def test_sharded_queue_is_stored(mock_env_vars, mock_client):
+    """Test that deletes find the stored queue after QUEUE_NAMES changed."""
+    mock_client.return_value.queue_path.side_effect = lambda p, l, q: q
+    campaign_service = sharded_service(mock_env_vars)
+    supabase = mock.Mock()
+    supabase.rpc.return_value = "campaign-7"
+    campaign_service.create_campaign(supabase, instant_campaign())
+    cloud_task_id = supabase.rpc.call_args.kwargs["params"]["_cloud_task_id"]
+    queue_name = TaskRef.parse(cloud_task_id).queue
+    assert created_queue(mock_client) == queue_name
+    assert queue_name in QUEUES
+
+    resharded_service = sharded_service(
+        mock_env_vars, QUEUE_NAMES=",".join(QUEUES + ["queue-4"])
+    )
+    supabase.read.return_value = [{"cloud_task_id": cloud_task_id}]
+    resharded_service.delete_campaign(supabase, {"id": "campaign-7"})
+    name = mock_client.return_value.delete_task.call_args.kwargs["name"]
+    assert name == f"{queue_name}/tasks/campaign-7"
+
+
+def test_task_ref_without_queue_uses_queue_name(mock_env_vars):
+    campaign_service = sharded_service(mock_env_vars)
+    assert campaign_service.task_queue(TaskRef(fingerprint="fp")) == "test-queue-name"
+    assert campaign_service.task_queue(None) == "test-queue-name"
+
+
+def test_allowed_explicit_queue_is_stored(mock_env_vars, mock_client):
+    """Test that an allowed requested queue is used and kept in the TaskRef."""
+    mock_client.return_value.queue_path.side_effect = lambda p, l, q: q
+    campaign_service = sharded_service(
+        mock_env_vars, ALLOWED_QUEUE_NAMES="priority-queue"
+    )
+    supabase = mock.Mock()
+    supabase.rpc.return_value = "campaign-7"
+    campaign_service.action_dispatcher("create_campaign", "priority-queue")(
+        supabase=supabase, payload=instant_campaign()
+    )
+    assert created_queue(mock_client) == "priority-queue"
+    task_ref = TaskRef.parse(supabase.rpc.call_args.kwargs["params"]["_cloud_task_id"])
+    assert task_ref.queue == "priority-queue"
+
+    campaign_service.action_dispatcher("create_campaign", "other-queue")(
+        supabase=supabase, payload=instant_campaign()
+    )
+    assert created_queue(mock_client) in QUEUES
+
+
+def test_tasks_are_sharded_by_company_id(mock_env_vars, mock_client):
+    mock_client.return_value.queue_path.side_effect = lambda p, l, q: q
+    campaign_service = sharded_service(mock_env_vars, QUEUE_SHARD_KEY="company_id")
+    supabase = mock.Mock()
+    supabase.rpc.return_value = "campaign-7"
+    campaign_service.create_campaign(supabase, instant_campaign())
+    assert created_queue(mock_client) == shard_queue("company-1", QUEUES)
@@ -0,0 +1,127 @@
+import uuid
+import datetime as dt
+import pytest
+from unittest import mock
+from benchmarks.fakes import FakeCloudTasks, FakePostgREST, PostgRESTClient
+from src.models.task_ref import TaskRef
+from src.services.campaign_service import CampaignService
+from src.services.reconcile_service import (
+    ReconcileService,
+    is_expected_task,
+    task_campaign_id,
+)
+
+LATER = dt.datetime.now(dt.timezone.utc) + dt.timedelta(hours=1)
+
+
+def instant_campaign():
+    return {
+        "name": "Campaign",
+        "count": 0,
+        "threshold": 5,
+        "status": "active",
+        "company_id": "company-1",
+        "created_by": "user-1",
+        "next_run_time": "2023-01-01T09:00:00+00:00",
+        "type": "instant",
+    }
+
+
+@pytest.fixture
+def postgrest():
+    with FakePostgREST(latency=0, row_latency=0) as postgrest:
+        yield postgrest
+
+
+@pytest.fixture
+def cloud_tasks():
+    return FakeCloudTasks()
+
+
+@pytest.fixture
+def campaign_service(mock_env_vars, cloud_tasks):
+    with mock.patch("google.cloud.tasks_v2.CloudTasksClient", return_value=cloud_tasks):
+        yield CampaignService(mock_env_vars)
+
+
+def task_names(cloud_tasks):
+    return sorted(name.rsplit("/", 1)[-1] for name in cloud_tasks.tasks)
+
+
+def test_task_campaign_id():
+    campaign_id = str(uuid.uuid4())
+    assert task_campaign_id(f"queues/q/tasks/{campaign_id}-g2-1") == campaign_id
+    assert task_campaign_id(f"{campaign_id}-0123456789abcdef-r3") == campaign_id
+    assert task_campaign_id("nightly-report") is None
+
+
+def test_is_expected_task():
+    campaign_id = str(uuid.uuid4())
+    row = {
+        "id": campaign_id,
+        "type": "instant",
+        "cloud_task_id": TaskRef(fingerprint="f", generation=2).to_str(),
+    }
+    assert is_expected_task(row, f"{campaign_id}-g2")
+    assert not is_expected_task(row, f"{campaign_id}-g1")
+    assert not is_expected_task(row, campaign_id)
+    recurring = {
+        "id": campaign_id,
+        "type": "recurring",
+        "cloud_task_id": TaskRef(fingerprint="f", runs=(3, 5)).to_str(),
+    }
+    assert is_expected_task(recurring, f"{campaign_id}-f-r2")
+    assert not is_expected_task(recurring, f"{campaign_id}-e-r4")
+
+
+def test_reconcile_deletes_orphans_page_by_page(
+    postgrest, cloud_tasks, campaign_service
+):
+    """Test that only the tasks of deleted campaigns and stale generations are deleted."""
+    supabase = PostgRESTClient(postgrest.url)
+    kept = campaign_service.create_campaign(supabase, instant_campaign())
+    deleted = campaign_service.create_campaign(supabase, instant_campaign())
+    del postgrest.rows[deleted]
+    campaign_service.create_task({"id": kept}, f"{kept}-g7")
+    campaign_service.create_task({}, "nightly-report")
+
+    reconcile_service = ReconcileService(campaign_service, page_size=2)
+    report = reconcile_service.reconcile(supabase, dry_run=True, now=LATER)
+    assert report["orphaned"] == 2
+    assert report["deleted"] == 0
+    assert len(cloud_tasks.tasks) == 4
+
+    report = reconcile_service.reconcile(supabase, now=LATER)
+    assert report["pages"] == 2
+    assert report["scanned"] == 4
+    assert report["skipped"] == 1
+    assert report["deleted"] == 2
+    assert task_names(cloud_tasks) == sorted([kept, "nightly-report"])
+
+
+def test_find_orphans_reads_campaigns_in_chunks(campaign_service):
+    """Test that the campaign rows of a page are read by chunks of ids."""
+    tasks = [mock.Mock(create_time=None) for _ in range(5)]
+    for task in tasks:
+        task.name = f"queues/q/tasks/{uuid.uuid4()}"
+    supabase = mock.Mock()
+    supabase.read.return_value = []
+    reconcile_service = ReconcileService(campaign_service, lookup_size=2)
+    report = {"skipped": 0}
+    orphans = reconcile_service.find_orphans(supabase, tasks, LATER, report)
+    assert len(orphans) == 5
+    assert supabase.read.call_count == 3
+    lookups = [
+        call.kwargs["url"].split("in.(", 1)[1].split(")", 1)[0].split(",")
+        for call in supabase.read.call_args_list
+    ]
+    assert [len(ids) for ids in lookups] == [2, 2, 1]
+
+
+def test_reconcile_skips_recent_tasks(postgrest, cloud_tasks, campaign_service):
+    """Test that tasks created within the grace period are never deleted."""
+    supabase = PostgRESTClient(postgrest.url)
+    campaign_service.create_task({}, str(uuid.uuid4()))
+    report = ReconcileService(campaign_service).reconcile(supabase)
+    assert report["skipped"] == 1
+    assert len(cloud_tasks.tasks) == 1
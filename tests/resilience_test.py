@@ -0,0 +1,143 @@
+import httpx
+import pytest
+import requests
+import tenacity
+from unittest import mock
+from google.api_core.exceptions import (
+    DeadlineExceeded,
+    InternalServerError,
+    NotFound,
+    ServiceUnavailable,
+)
+from benchmarks.fakes import FakeCloudTasks, FakePostgREST, PostgRESTClient
+from src.errors.circuit_open_error import CircuitOpenError
+from src.services.campaign_service import CampaignService
+from src.utils.resilience import (
+    CircuitBreaker,
+    DependencyGuard,
+    GuardedClient,
+    RetryBudget,
+    is_retryable_status_error,
+    is_retryable_transport_error,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def fast_guard(**kwargs):
+    kwargs.setdefault("backoff", 0)
+    return DependencyGuard("test", **kwargs)
+
+
+def test_breaker_opens_and_probes():
+    """Test that the breaker fails fast when open and closes after a good probe."""
+    clock = FakeClock()
+    guard = fast_guard(
+        max_attempts=1,
+        is_retryable=is_retryable_transport_error,
+        breaker=CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock),
+    )
+    func = mock.Mock(side_effect=ServiceUnavailable("down"))
+    for _ in range(2):
+        with pytest.raises(ServiceUnavailable):
+            guard.call(func)
+    with pytest.raises(CircuitOpenError) as error:
+        guard.call(func)
+    assert error.value.retry_after == 10
+    assert func.call_count == 2
+    assert guard.metrics()["state"] == "open"
+    assert guard.metrics()["short_circuited"] == 1
+
+    clock.now = 10
+    func.side_effect = None
+    func.return_value = "ok"
+    assert guard.call(func) == "ok"
+    assert guard.metrics()["state"] == "closed"
+
+
+def test_only_retryable_errors_are_retried():
+    guard = fast_guard(is_retryable=is_retryable_transport_error)
+    func = mock.Mock(side_effect=NotFound("missing"))
+    with pytest.raises(NotFound):
+        guard.call(func)
+    assert func.call_count == 1
+    assert guard.metrics()["failures"] == 0
+
+
+@pytest.mark.parametrize(
+    "error, retryable",
+    [
+        (ServiceUnavailable("down"), True),
+        (DeadlineExceeded("slow"), True),
+        (requests.ConnectionError("reset"), True),
+        (requests.Timeout("slow"), True),
+        (httpx.ConnectError("reset"), True),
+        (httpx.ReadTimeout("slow"), True),
+        (ValueError("Cannot invoke RPC on closed channel!"), True),
+        (InternalServerError("error"), False),
+        (NotFound("missing"), False),
+        (TypeError("bug"), False),
+        (ValueError("invalid"), False),
+    ],
+)
+def test_only_transport_errors_are_retryable(error, retryable):
+    assert is_retryable_transport_error(error) is retryable
+
+
+def test_retry_budget_limits_retries():
+    """Test that retries stop once the budget is spent, without waiting on attempts."""
+    guard = fast_guard(
+        is_retryable=is_retryable_transport_error,
+        budget=RetryBudget(ratio=0, max_tokens=2),
+        breaker=CircuitBreaker(failure_threshold=100),
+    )
+    func = mock.Mock(side_effect=ServiceUnavailable("down"))
+    with pytest.raises(tenacity.RetryError):
+        guard.call(func)
+    with pytest.raises(ServiceUnavailable):
+        guard.call(func)
+    assert func.call_count == 4
+    assert guard.metrics()["retries"] == 2
+    assert guard.metrics()["budget_exhausted"] == 1
+
+
+def test_guarded_client_retries_idempotent_calls():
+    """Test that a 503 is retried for updates, and RPC calls are never retried."""
+    with FakePostgREST(latency=0, faults=[503, None, 503]) as postgrest:
+        postgrest.rows["1"] = {"id": "1"}
+        guard = fast_guard(is_retryable=is_retryable_status_error)
+        client = GuardedClient(
+            PostgRESTClient(postgrest.url), guard, idempotent_methods=("update",)
+        )
+        assert client.update(url="rest/v1/campaigns?id=eq.1", data={"a": 1}) == [
+            {"id": "1", "a": 1}
+        ]
+        with pytest.raises(requests.HTTPError):
+            client.rpc(url="rest/v1/rpc/create_campaign", params={"_name": "a"})
+        assert postgrest.requests == 3
+        assert guard.metrics()["retries"] == 1
+
+
+def test_cloud_tasks_brownout_fails_fast(mock_env_vars):
+    """Test that create_task stops calling Cloud Tasks once its breaker opens."""
+    fake = FakeCloudTasks(faults=[ServiceUnavailable("down")] * 10)
+    with mock.patch("google.cloud.tasks_v2.CloudTasksClient", return_value=fake):
+        campaign_service = CampaignService(
+            {**mock_env_vars, "BREAKER_FAILURE_THRESHOLD": "2"}
+        )
+        campaign_service.guards["cloud_tasks"].backoff = 0
+        with pytest.raises(CircuitOpenError):
+            campaign_service.create_task({"id": "campaign-1"}, "campaign-1")
+        with pytest.raises(CircuitOpenError):
+            campaign_service.delete_task("campaign-1")
+    assert fake.calls == 2
+    metrics = campaign_service.resilience_metrics()
+    assert metrics[0]["dependency"] == "cloud_tasks"
+    assert metrics[0]["state"] == "open"
+    assert metrics[0]["short_circuited"] == 2
@@ -0,0 +1,98 @@
+import random
+import datetime as dt
+import numpy as np
+import pytest
+from src.utils.schedule import FREQUENCY_STEPS, next_run_after
+from src.utils.schedule_columns import (
+    changed_rows,
+    frequency_codes,
+    next_run_times,
+    parse_timestamps,
+    parse_times_of_day,
+    plan_next_run_times,
+)
+
+UTC = dt.timezone.utc
+NOW = dt.datetime(2023, 3, 15, 12, 0, tzinfo=UTC)
+
+
+def random_campaigns(count, seed=1):
+    rng = random.Random(seed)
+    campaigns = []
+    for i in range(count):
+        last_run = dt.datetime(2022, 1, 1, tzinfo=UTC) + dt.timedelta(
+            seconds=rng.randrange(0, 500 * 86400)
+        )
+        campaigns.append(
+            {
+                "id": f"campaign-{i}",
+                "frequency": rng.choice(list(FREQUENCY_STEPS)),
+                "next_run_time": last_run.isoformat(),
+                "time_of_day": rng.choice([None, "00:00", "09:30", "23:59:59"]),
+                "end_date": rng.choice(
+                    [None, (NOW + dt.timedelta(days=rng.randrange(-5, 40))).isoformat()]
+                ),
+            }
+        )
+    return campaigns
+
+
+@pytest.mark.parametrize("min_steps", [0, 1])
+def test_next_run_times_matches_scalar(min_steps):
+    """Test that the vectorized pass agrees with the per-row computation."""
+    campaigns = random_campaigns(2000)
+    computed = next_run_times(
+        last_run=parse_timestamps(c["next_run_time"] for c in campaigns),
+        frequency=frequency_codes([c["frequency"] for c in campaigns]),
+        now=NOW,
+        time_of_day=parse_times_of_day(c["time_of_day"] for c in campaigns),
+        end_date=parse_timestamps(c["end_date"] for c in campaigns),
+        min_steps=min_steps,
+    )
+    for campaign, value in zip(campaigns, computed):
+        expected = next_run_after(
+            campaign["next_run_time"],
+            campaign["frequency"],
+            NOW,
+            time_of_day=campaign["time_of_day"],
+            end_date=campaign["end_date"],
+            min_steps=min_steps,
+        )
+        if expected is None:
+            assert np.isnat(value)
+        else:
+            assert value == np.datetime64(int(expected.timestamp()), "s")
+
+
+def test_next_run_times_monthly_clamps_to_end_of_month():
+    computed = next_run_times(
+        last_run=parse_timestamps(["2023-01-31T09:00:00Z"]),
+        frequency=frequency_codes(["monthly"]),
+        now=dt.datetime(2023, 2, 1, tzinfo=UTC),
+    )
+    assert computed[0] == np.datetime64("2023-02-28T09:00:00")
+
+
+def test_changed_rows_are_minimal():
+    """Test that unchanged rows are left out and ended campaigns are cleared."""
+    current = parse_timestamps(["2023-01-01T00:00:00Z", "2023-01-02T00:00:00Z", None])
+    computed = parse_timestamps(["2023-01-01T00:00:00Z", None, None])
+    assert changed_rows(["a", "b", "c"], current, computed) == [
+        {"id": "b", "next_run_time": None}
+    ]
+
+
+def test_plan_next_run_times():
+    """Test that future runs are kept and past runs move to the next run after now."""
+    campaigns = [
+        {"id": "a", "frequency": "daily", "next_run_time": "2023-03-16T09:00:00Z"},
+        {"id": "b", "frequency": "weekly", "next_run_time": "2023-03-01T09:00:00Z"},
+    ]
+    assert plan_next_run_times(campaigns, NOW) == [
+        {"id": "b", "next_run_time": "2023-03-22T09:00:00Z"}
+    ]
+
+
+def test_frequency_codes_rejects_unknown():
+    with pytest.raises(ValueError, match="Invalid frequency"):
+        frequency_codes(["daily", "hourly"])
@@ -0,0 +1,175 @@
+import datetime as dt
+import pytest
+from unittest import mock
+from src.models.task_ref import TaskRef
+from src.services.campaign_service import CampaignService
+from src.services.schedule_service import ScheduleService
+from src.utils.schedule import expand_runs
+
+UTC = dt.timezone.utc
+NOW = dt.datetime(2023, 1, 10, 12, 0, tzinfo=UTC)
+
+
+def recurring_campaign(**overrides):
+    campaign = {
+        "id": "campaign-1",
+        "name": "Campaign",
+        "type": "recurring",
+        "frequency": "daily",
+        "next_run_time": "2023-01-01T09:00:00+00:00",
+        "company_id": "company-1",
+    }
+    campaign.update(overrides)
+    return campaign
+
+
+def test_expand_runs_daily():
+    """Test that only runs strictly within the window are returned, with stable indexes."""
+    runs = expand_runs(
+        "2023-01-01T09:00:00Z", "daily", after=NOW, until=NOW + dt.timedelta(days=3)
+    )
+    assert [index for index, _ in runs] == [10, 11, 12]
+    assert runs[0][1] == dt.datetime(2023, 1, 11, 9, 0, tzinfo=UTC)
+
+
+def test_expand_runs_monthly_end_date_and_time_of_day():
+    """Test that monthly runs use calendar months, the time of day and the end date."""
+    runs = expand_runs(
+        "2023-01-31T09:00:00",
+        "monthly",
+        after=dt.datetime(2023, 1, 1, tzinfo=UTC),
+        until=dt.datetime(2024, 1, 1, tzinfo=UTC),
+        time_of_day="18:30",
+        end_date="2023-04-30T00:00:00Z",
+    )
+    assert [time.date().isoformat() for _, time in runs] == [
+        "2023-01-31",
+        "2023-02-28",
+        "2023-03-31",
+    ]
+    assert runs[0][1].hour == 18
+
+
+def test_expand_runs_invalid_frequency():
+    with pytest.raises(ValueError, match="Invalid frequency"):
+        expand_runs("2023-01-01T09:00:00Z", "hourly", after=NOW, until=NOW)
+
+
+def test_plan_only_adds_new_runs(mock_env_vars):
+    """Test that a second expansion only creates the runs that entered the horizon."""
+    schedule_service = ScheduleService(
+        CampaignService(mock_env_vars), horizon=dt.timedelta(days=2)
+    )
+    first = schedule_service.plan(recurring_campaign(), NOW)
+    assert [index for index, _ in first.runs] == [10, 11]
+
+    campaign = recurring_campaign(cloud_task_id=first.task_ref.to_str())
+    second = schedule_service.plan(campaign, NOW + dt.timedelta(days=1))
+    assert [index for index, _ in second.runs] == [12]
+    assert second.task_ref.runs == (11, 12)
+    assert second.stale_task_names == []
+
+
+def test_plan_replaces_runs_of_edited_campaign(mock_env_vars):
+    """Test that a changed campaign gets a new task family and the old one is deleted."""
+    schedule_service = ScheduleService(CampaignService(mock_env_vars))
+    previous_ref = TaskRef(fingerprint="0" * 16, runs=(10, 12))
+    plan = schedule_service.plan(
+        recurring_campaign(cloud_task_id=previous_ref.to_str()), NOW
+    )
+    assert plan.stale_task_names == previous_ref.run_task_names("campaign-1")
+    assert plan.runs[0][0] == 10
+    assert plan.task_ref.fingerprint != previous_ref.fingerprint
+
+
+def test_plan_keeps_runs_as_the_campaign_runs(mock_env_vars):
+    """Test that the count, status and next run of a running campaign keep its tasks."""
+    schedule_service = ScheduleService(
+        CampaignService(mock_env_vars), horizon=dt.timedelta(days=2)
+    )
+    first = schedule_service.plan(recurring_campaign(), NOW)
+    campaign = recurring_campaign(
+        count=3,
+        status="running",
+        next_run_time="2023-01-11T09:00:00+00:00",
+        cloud_task_id=first.task_ref.to_str(),
+    )
+    second = schedule_service.plan(campaign, NOW + dt.timedelta(days=1))
+    assert second.task_ref.fingerprint == first.task_ref.fingerprint
+    assert second.task_ref.anchor == first.task_ref.anchor
+    assert [index for index, _ in second.runs] == [12]
+    assert second.stale_task_names == []
+
+    # Moving the next run ahead on the schedule deletes the skipped runs
+    campaign["next_run_time"] = "2023-01-12T09:00:00+00:00"
+    skipped = schedule_service.plan(campaign, NOW)
+    assert skipped.stale_task_names == [first.task_ref.run_task_name("campaign-1", 10)]
+    assert skipped.task_ref.runs == (11, 11)
+    assert [index for index, _ in skipped.runs] == []
+    assert CampaignService(mock_env_vars).plan_task_edit(campaign, first.task_ref) == (
+        "none",
+        first.task_ref,
+    )
+
+
+def test_plan_replaces_runs_moved_off_the_schedule(mock_env_vars):
+    """Test that a next run between two runs starts a new task family."""
+    schedule_service = ScheduleService(CampaignService(mock_env_vars))
+    first = schedule_service.plan(recurring_campaign(), NOW)
+    campaign = recurring_campaign(
+        next_run_time="2023-01-11T10:00:00+00:00",
+        cloud_task_id=first.task_ref.to_str(),
+    )
+    plan = schedule_service.plan(campaign, NOW)
+    assert plan.task_ref.fingerprint != first.task_ref.fingerprint
+    assert plan.stale_task_names == first.task_ref.run_task_names("campaign-1")
+    assert plan.runs[0] == (0, dt.datetime(2023, 1, 11, 10, 0, tzinfo=UTC))
+
+
+def test_schedule_campaigns(mock_env_vars, mock_client, mock_queue_path):
+    """Test that run tasks are created and the TaskRef is stored once per campaign."""
+    campaign_service = CampaignService(mock_env_vars)
+    supabase = mock.Mock()
+    report = campaign_service.schedule_recurring_campaigns(
+        supabase, {"campaigns": [recurring_campaign()], "horizon_hours": 48}
+    )
+    assert report == {"campaigns": 1, "created": 2, "deleted": 0, "failed": []}
+    assert mock_client.return_value.create_task.call_count == 2
+    stored_ref = TaskRef.parse(
+        supabase.update.call_args.kwargs["data"]["cloud_task_id"]
+    )
+    assert stored_ref.runs[1] - stored_ref.runs[0] == 1
+
+
+def test_schedule_campaigns_reads_pages(mock_env_vars, mock_client, mock_queue_path):
+    """Test that the recurring campaigns are read by pages of ids."""
+    campaign_service = CampaignService(mock_env_vars)
+    supabase = mock.Mock()
+    supabase.read.side_effect = [
+        [recurring_campaign(id="a"), recurring_campaign(id="b")],
+        [recurring_campaign(id="c")],
+    ]
+    report = campaign_service.schedule_recurring_campaigns(
+        supabase, {"horizon_hours": 24, "page_size": 2}
+    )
+    assert report["campaigns"] == 3
+    urls = [call.kwargs["url"] for call in supabase.read.call_args_list]
+    assert urls == [
+        "rest/v1/campaigns?type=eq.recurring&order=id&limit=2&select=*",
+        "rest/v1/campaigns?type=eq.recurring&id=gt.b&order=id&limit=2&select=*",
+    ]
+
+
+def test_delete_recurring_campaign_deletes_runs(
+    mock_env_vars, mock_client, mock_queue_path
+):
+    """Test that deleting a recurring campaign deletes its scheduled run tasks."""
+    campaign_service = CampaignService(mock_env_vars)
+    task_ref = TaskRef(fingerprint="0" * 16, runs=(3, 5))
+    supabase = mock.Mock()
+    supabase.read.return_value = [
+        {"id": "campaign-1", "type": "recurring", "cloud_task_id": task_ref.to_str()}
+    ]
+    # The type and the runs are read from the stored row
+    campaign_service.delete_campaign(supabase, {"id": "campaign-1"})
+    assert mock_client.return_value.delete_task.call_count == 3
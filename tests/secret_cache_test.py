@@ -0,0 +1,135 @@
+# tests/secret_cache_test.py
+import time
+import threading
+import pytest
+import freezegun
+
+from src.utils.secret_cache import SecretAccessError, SecretCache
+
+
+class FakeSecretManager:
+    """A local stand-in for Secret Manager with controllable latency and failures."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self.version = 1
+        self.failing = False
+        self._lock = threading.Lock()
+
+    def fetch(self, project_id, secret_id, version_id):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        if self.failing:
+            raise Exception("503 Service Unavailable")
+        return f"{secret_id}-v{self.version}"
+
+
+def test_get_is_cached():
+    secret_manager = FakeSecretManager()
+    cache = SecretCache(ttl=300, fetch=secret_manager.fetch)
+    assert cache.get("project", "secret", "latest") == "secret-v1"
+    assert cache.get("project", "secret", "latest") == "secret-v1"
+    assert secret_manager.calls == 1
+
+
+def test_concurrent_cold_callers_share_one_fetch():
+    secret_manager = FakeSecretManager(latency=0.1)
+    cache = SecretCache(ttl=300, fetch=secret_manager.fetch)
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(cache.get("project", "secret", "latest"))
+        )
+        for _ in range(10)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["secret-v1"] * 10
+    assert secret_manager.calls == 1
+
+
+def test_rotated_secret_is_refreshed_after_ttl():
+    secret_manager = FakeSecretManager()
+    cache = SecretCache(ttl=300, refresh_ahead=0, fetch=secret_manager.fetch)
+    with freezegun.freeze_time("2022-01-01") as frozen_time:
+        assert cache.get("project", "secret", "latest") == "secret-v1"
+        secret_manager.version = 2
+        frozen_time.tick(301)
+        assert cache.get("project", "secret", "latest") == "secret-v2"
+
+
+def test_refresh_ahead_runs_in_background():
+    secret_manager = FakeSecretManager()
+    cache = SecretCache(ttl=300, refresh_ahead=60, fetch=secret_manager.fetch)
+    with freezegun.freeze_time("2022-01-01") as frozen_time:
+        cache.get("project", "secret", "latest")
+        secret_manager.version = 2
+        frozen_time.tick(250)
+        assert cache.get("project", "secret", "latest") == "secret-v1"
+    for _ in range(100):
+        if secret_manager.calls == 2:
+            break
+        time.sleep(0.01)
+    assert secret_manager.calls == 2
+
+
+def test_stale_value_is_served_on_errors():
+    secret_manager = FakeSecretManager()
+    cache = SecretCache(
+        ttl=300, refresh_ahead=0, max_stale=600, fetch=secret_manager.fetch
+    )
+    with freezegun.freeze_time("2022-01-01") as frozen_time:
+        cache.get("project", "secret", "latest")
+        secret_manager.failing = True
+        frozen_time.tick(301)
+        assert cache.get("project", "secret", "latest") == "secret-v1"
+        frozen_time.tick(600)
+        with pytest.raises(SecretAccessError):
+            cache.get("project", "secret", "latest")
+
+
+def test_get_cached_never_fetches():
+    secret_manager = FakeSecretManager()
+    cache = SecretCache(ttl=300, refresh_ahead=0, fetch=secret_manager.fetch)
+    with freezegun.freeze_time("2022-01-01") as frozen_time:
+        assert cache.get_cached("project", "secret", "latest") is None
+        assert cache.get("project", "secret", "latest") == "secret-v1"
+        assert cache.get_cached("project", "secret", "latest") == "secret-v1"
+        frozen_time.tick(301)
+        assert cache.get_cached("project", "secret", "latest") is None
+    assert secret_manager.calls == 1
+
+
+def test_failed_fetch_backs_off():
+    secret_manager = FakeSecretManager()
+    secret_manager.failing = True
+    cache = SecretCache(ttl=300, failure_backoff=5, fetch=secret_manager.fetch)
+    with freezegun.freeze_time("2022-01-01") as frozen_time:
+        for _ in range(3):
+            with pytest.raises(SecretAccessError):
+                cache.get("project", "secret", "latest")
+        assert secret_manager.calls == 1
+        secret_manager.failing = False
+        frozen_time.tick(6)
+        assert cache.get("project", "secret", "latest") == "secret-v1"
+        assert secret_manager.calls == 2
+
+
+def test_one_background_refresh_per_secret():
+    secret_manager = FakeSecretManager()
+    cache = SecretCache(ttl=300, refresh_ahead=60, fetch=secret_manager.fetch)
+    with freezegun.freeze_time("2022-01-01") as frozen_time:
+        cache.get("project", "secret", "latest")
+        secret_manager.latency = 0.1
+        frozen_time.tick(250)
+        for _ in range(20):
+            assert cache.get("project", "secret", "latest") == "secret-v1"
+        for _ in range(100):
+            if not cache._refreshing:
+                break
+            time.sleep(0.01)
+    assert secret_manager.calls == 2
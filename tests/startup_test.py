@@ -0,0 +1,48 @@
+# tests/startup_test.py
+import sys
+import subprocess
+import threading
+from unittest import mock
+
+from src.utils.startup import Lazy, StartupTimer
+
+
+def test_lazy_creates_value_once():
+    factory = mock.Mock(return_value="value")
+    timer = StartupTimer()
+    lazy = Lazy(factory, "value", timer=timer)
+    assert not lazy.initialized
+
+    threads = [threading.Thread(target=lazy.get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert lazy.get() == "value"
+    assert lazy.initialized
+    factory.assert_called_once()
+    assert "value" in timer.report()
+
+
+def test_lazy_retries_after_factory_error():
+    factory = mock.Mock(side_effect=[Exception("test exception"), "value"])
+    lazy = Lazy(factory, "value", timer=StartupTimer())
+    try:
+        lazy.get()
+    except Exception:
+        pass
+    assert not lazy.initialized
+    assert lazy.get() == "value"
+
+
+def test_importing_main_defers_google_clients():
+    probe = (
+        "import sys, main; "
+        "print(any(m.startswith(('google.cloud.tasks_v2', "
+        "'google.cloud.secretmanager', 'grpc', 'supacrud')) for m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", probe], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "False"
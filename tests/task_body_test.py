@@ -0,0 +1,52 @@
+import json
+import pytest
+from src.services.campaign_service import CampaignService
+from src.utils.task_body import decode_task_body, encode_task_body
+
+
+def large_payload(count=5000):
+    return {"id": "campaign-1", "audience_ids": [f"user-{i}" for i in range(count)]}
+
+
+def test_small_body_is_not_compressed():
+    encoded = encode_task_body({"id": "campaign-1"}, encoding="gzip", threshold=1024)
+    assert encoded.body == json.dumps({"id": "campaign-1"}).encode()
+    assert "Content-Encoding" not in encoded.headers
+
+
+def test_large_body_round_trip():
+    """Test that a compressed body is smaller and decodes to the payload."""
+    payload = large_payload()
+    encoded = encode_task_body(payload, encoding="gzip", threshold=1024)
+    assert encoded.headers == {
+        "Content-Type": "application/json",
+        "Content-Encoding": "gzip",
+    }
+    assert encoded.ratio > 3
+    assert decode_task_body(encoded.body, {"content-encoding": "gzip"}) == payload
+    assert encoded.body == encode_task_body(payload, "gzip", 1024).body
+
+
+def test_unsupported_encoding():
+    with pytest.raises(ValueError, match="Unsupported"):
+        encode_task_body(large_payload(), encoding="br", threshold=0)
+    with pytest.raises(ValueError, match="Unsupported"):
+        decode_task_body(b"{}", {"Content-Encoding": "br"})
+
+
+def test_create_task_compresses_body(mock_env_vars, mock_client, mock_queue_path):
+    """Test that create_task sets the encoding headers of a compressed body."""
+    campaign_service = CampaignService(
+        {
+            **mock_env_vars,
+            "TASK_BODY_ENCODING": "gzip",
+            "TASK_BODY_COMPRESS_THRESHOLD": "1024",
+        }
+    )
+    campaign_service.create_task(payload=large_payload(), task_name="campaign-1")
+    request = mock_client.return_value.create_task.call_args.kwargs["request"]
+    http_request = request["task"]["http_request"]
+    assert http_request["headers"]["Content-Encoding"] == "gzip"
+    assert decode_task_body(http_request["body"], http_request["headers"]) == (
+        large_payload()
+    )
@@ -0,0 +1,57 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from src.utils.timing import (
+    HistogramRegistry,
+    current_timer,
+    propagate,
+    span,
+    start_request,
+)
+
+
+def test_span_outside_of_a_request_is_a_no_op():
+    assert span("supabase.rpc") is span("cloud_tasks.create_task")
+    with span("supabase.rpc"):
+        pass
+    assert current_timer() is None
+
+
+def test_spans_of_pool_threads_are_recorded():
+    registry = HistogramRegistry()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        with start_request(registry) as timer:
+            with span("verify"):
+                pass
+
+            def create_task():
+                with span("cloud_tasks.create_task"):
+                    return threading.current_thread().name
+
+            futures = [executor.submit(propagate(create_task)) for _ in range(3)]
+            for future in futures:
+                future.result()
+    assert current_timer() is None
+
+    summary = timer.summary()
+    assert summary["verify"]["count"] == 1
+    assert summary["cloud_tasks.create_task"]["count"] == 3
+    server_timing = timer.server_timing()
+    assert server_timing.startswith("verify;dur=")
+    assert "cloud_tasks.create_task;dur=" in server_timing
+    assert 'desc="x3"' in server_timing
+    assert registry.snapshot()["cloud_tasks.create_task"]["count"] == 3
+    assert registry.snapshot()["total"]["count"] == 1
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = HistogramRegistry(buckets=(0.01, 0.1))
+    for seconds in (0.005, 0.05, 0.05, 1):
+        registry.observe("supabase.rpc", seconds)
+    histogram = registry.snapshot()["supabase.rpc"]
+    assert histogram["buckets"] == {"0.01": 1, "0.1": 3, "+Inf": 4}
+    assert histogram["count"] == 4
+    text = registry.to_prometheus()
+    assert (
+        'campaigns_span_duration_seconds_bucket{span="supabase.rpc",le="0.1"} 3' in text
+    )
+    assert 'campaigns_span_duration_seconds_count{span="supabase.rpc"} 4' in text
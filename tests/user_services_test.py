@@ -6,6 +6,8 @@ import jwt
 import requests
 import datetime
 from src.services.user_services import AdminUserService
+from src.utils.verified_user_cache import VerifiedUserCache
+from src.utils.http_session import IDEMPOTENT_METHODS, create_session, pool_stats
 
 
 @pytest.fixture
@@ -17,7 +19,7 @@ def user_service():
     )
 
 
-@patch("requests.get")
+@patch("requests.Session.get")
 def test_get_user_by_id(mock_get, user_service):
     mock_get.return_value.status_code = 200
     mock_get.return_value.json.return_value = {"user_id": "user_id"}
@@ -26,7 +28,7 @@ def test_get_user_by_id(mock_get, user_service):
     assert response.json() == {"user_id": "user_id"}
 
 
-@patch("requests.post")
+@patch("requests.Session.post")
 def test_generate_link(mock_post, user_service):
     mock_post.return_value.status_code = 200
     mock_post.return_value.json.return_value = {"link": "link"}
@@ -35,7 +37,7 @@ def test_generate_link(mock_post, user_service):
     assert response.json() == {"link": "link"}
 
 
-@patch("requests.delete")
+@patch("requests.Session.delete")
 def test_delete_user(mock_delete, user_service):
     mock_delete.return_value.status_code = 200
     mock_delete.return_value.json.return_value = {"user_id": "user_id"}
@@ -58,7 +60,7 @@ def test_is_jwt_valid(user_service):
         }
 
 
-@patch("requests.get")
+@patch("requests.Session.get")
 def test_verify_user(mock_get, user_service):
     mock_get.return_value.status_code = 200
     mock_get.return_value.json.return_value = {
@@ -80,7 +82,7 @@ def test_verify_user_invalid_jwt(user_service):
     assert result == {"error": "Invalid JWT"}
 
 
-@patch("requests.get")
+@patch("requests.Session.get")
 def test_get_user_by_id_error(mock_get, user_service):
     mock_get.return_value.status_code = 404
     mock_get.return_value.json.return_value = {"error": "User not found"}
@@ -89,7 +91,7 @@ def test_get_user_by_id_error(mock_get, user_service):
     assert response.json() == {"error": "User not found"}
 
 
-@patch("requests.get")
+@patch("requests.Session.get")
 def test_user_metadata_returns_none(mock_get, user_service):
     mock_get.return_value.status_code = 200
     mock_get.return_value.json.return_value = {"user_id": "user_id"}
@@ -98,7 +100,7 @@ def test_user_metadata_returns_none(mock_get, user_service):
     assert response.json().get("user_metadata") is None
 
 
-@patch("requests.get")
+@patch("requests.Session.get")
 def test_user_not_super_admin(mock_get, user_service):
     mock_get.return_value.status_code = 200
     mock_get.return_value.json.return_value = {
@@ -113,3 +115,85 @@ def test_user_not_super_admin(mock_get, user_service):
         )
         result = user_service.verify_user(jwt_token)
         assert result == {"error": "User is not a super admin"}
+
+
+@patch("requests.Session.get")
+def test_verify_user_is_cached(mock_get, user_service):
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.json.return_value = {
+        "user_id": "user_id",
+        "app_metadata": {"role": "super_admin"},
+    }
+    with freezegun.freeze_time("2022-01-01"):
+        jwt_token = jwt.encode(
+            {"sub": "user_id", "exp": datetime.datetime.utcnow().timestamp() + 100},
+            "secret",
+            algorithm="HS256",
+        )
+        assert user_service.verify_user(jwt_token) == {"role": "super_admin"}
+        assert user_service.verify_user(jwt_token) == {"role": "super_admin"}
+    assert mock_get.call_count == 1
+    assert user_service.verified_user_cache.stats()["hits"] == 1
+    assert user_service.verified_user_cache.stats()["misses"] == 1
+
+
+@patch("requests.Session.get")
+def test_verify_user_cache_expires_with_token(mock_get, user_service):
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.json.return_value = {
+        "user_id": "user_id",
+        "app_metadata": {"role": "super_admin"},
+    }
+    with freezegun.freeze_time("2022-01-01") as frozen_time:
+        exp = datetime.datetime.utcnow().timestamp() + 10
+        jwt_token = jwt.encode({"sub": "user_id", "exp": exp}, "secret")
+        user_service.verify_user(jwt_token)
+        frozen_time.tick(20)
+        renewed_token = jwt.encode({"sub": "user_id", "exp": exp + 100}, "secret")
+        user_service.verify_user(renewed_token)
+    assert mock_get.call_count == 2
+
+
+def test_verified_user_cache_evicts_least_recently_used():
+    cache = VerifiedUserCache(ttl=300, maxsize=2)
+    exp = datetime.datetime.utcnow().timestamp() + 100
+    cache.set("a", {"role": "super_admin"}, exp)
+    cache.set("b", {"role": "super_admin"}, exp)
+    cache.get("a")
+    cache.set("c", {"role": "super_admin"}, exp)
+    assert cache.get("b") is None
+    assert cache.get("a") == {"role": "super_admin"}
+    assert cache.get("c") == {"role": "super_admin"}
+
+
+@patch("requests.Session.get")
+def test_get_user_by_id_uses_split_timeouts(mock_get):
+    user_service = AdminUserService(
+        base_url="https://example.com",
+        anon_key="anon_key",
+        service_key="service_key",
+        connect_timeout=1,
+        read_timeout=2,
+    )
+    user_service.get_user_by_id("user_id")
+    assert mock_get.call_args.kwargs["timeout"] == (1, 2)
+
+
+def test_session_reuses_pooled_connections():
+    session = create_session(pool_maxsize=2, retries=1)
+    adapter = session.get_adapter("https://example.com")
+    assert adapter is session.get_adapter("http://example.com")
+    assert adapter.max_retries.allowed_methods == IDEMPOTENT_METHODS
+    assert "POST" not in adapter.max_retries.allowed_methods
+
+    pool = adapter.poolmanager.connection_from_url("https://example.com")
+    assert pool.pool.maxsize == 2
+    assert pool_stats(session) == [
+        {
+            "host": "https://example.com:443",
+            "maxsize": 2,
+            "in_use": 0,
+            "connections_created": 0,
+            "requests": 0,
+        }
+    ]